@@ -16,20 +16,26 @@ import time
 from datetime import datetime
 import cv2
 import json
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.tri as tri
 
 from Pyro5.api import Proxy
 from time import sleep
-from getpass import getpass
 from scipy.interpolate import Rbf
 from pynput import keyboard
 
-from cobe.settings.pmodulesettings import max_abs_coord
 from cobe.settings import network, odmodel, aruco, vision, logs
 from cobe.rendering.renderingstack import RenderingStack
 from cobe.pmodule.pmodule import generate_pred_json
+from cobe.cobe.detectionreceiver import DetectionReceiver, expand_detections
+from cobe.cobe.offloadpool import OffloadPool, InferenceRouter
+from cobe.cobe.resolutioncontroller import ResolutionController
+from cobe.tools.remaptools import build_remap_lut, scale_to_simulation_space, RemapLUT
+from cobe.tools.croptools import arena_points, arena_crop, crop_calibration_axis
+from cobe.tools.timetools import now_ns, seconds_between
+from cobe.vision.web_vision import fetch_snapshot
 
 # Setting up file logger
 import logging
@@ -85,22 +91,13 @@ class CoBeMaster(object):
         self.cobe_root_dir = os.path.abspath(os.path.join(self.file_dir_path, os.pardir))
         # calib data dir
         self.calib_data_dir = os.path.join(self.cobe_root_dir, "settings", "calibration_data")
-        # requesting master password for nanos if they are not set yet
-        self.check_pswds()
-
-    def check_pswds(self):
-        """Checking if the password is already set on the eyes and if not asking from user"""
-        ask_for_pswd = False
-        for eye_name, eye_dict in self.eyes.items():
-            if not eye_dict["pyro_proxy"].has_pswd():
-                logger.info(f"Eye {eye_name} does not have a password set.")
-                ask_for_pswd = True
-                break
-
-        if ask_for_pswd:
-            nano_password = getpass("Please enter password for nanos: ")
-            for eye_name, eye_dict in self.eyes.items():
-                eye_dict["pyro_proxy"].set_pswd(nano_password)
+        # receiver of detections pushed by the eyes in streaming mode (see start_detection_streams)
+        self.detection_receiver = None
+        # router sending inference requests to the eyes or to a CPU worker pool on the master
+        # (see start_inference_offloading)
+        self.inference_router = None
+        # controller adapting the inference size of each eye to its latency budget (see start_adaptive_resolution)
+        self.resolution_controller = None
 
     def create_eye_objects(self):
         """Creates eye Pyro objects from the network settings"""
@@ -109,24 +106,31 @@ class CoBeMaster(object):
             eyes[eye_name] = {"pyro_proxy": Proxy(
                 eye_data["uri"] + eye_data["name"] + "@" + eye_data["host"] + ":" + eye_data["port"])}
             eyes[eye_name]["eye_data"] = eye_data
-            # adding fisheye calibration map for eye
-            eyes[eye_name]["pyro_proxy"].set_fisheye_calibration_map(eye_data["fisheye_calibration_map"])
+            # the first sensor of the eye (SENSOR_IDS), the calibration maps of the master belong to it
+            eyes[eye_name]["primary_sensor_id"] = eyes[eye_name]["pyro_proxy"].get_sensor_ids()[0]
+            # adding fisheye calibration maps for the sensors of the eye, the single map of an eye without
+            # sensor_calibration_maps is set for its primary sensor
+            if "sensor_calibration_maps" in eye_data:
+                for sensor_id, calibration_map in eye_data["sensor_calibration_maps"].items():
+                    eyes[eye_name]["pyro_proxy"].set_fisheye_calibration_map(calibration_map,
+                                                                             sensor_id=int(sensor_id))
+            else:
+                eyes[eye_name]["pyro_proxy"].set_fisheye_calibration_map(eye_data["fisheye_calibration_map"],
+                                                                         sensor_id=None)
             # testing created eye by accessing public Pyro method and comparing outcome with expected ID
             assert eyes[eye_name]["pyro_proxy"].return_id() == eyes[eye_name]["eye_data"]["expected_id"]
         return eyes
 
     def initialize_object_detectors(self):
         """Starting the roboflow inference servers on all the eyes and carry out a single detection to initialize
-        the model weights. This needs WWW access on the eyes as it downloads model weights from Roboflow"""
+        the model weights. This needs WWW access on the eyes as it downloads model weights from Roboflow.
+        Other detector backends (cobe.settings.odmodel.detector_backend) run without inference server."""
         logger.info("Initializing object detectors...")
-        for eye_name, eye_dict in self.eyes.items():
-            # start docker servers
-            logger.info(f"Starting inference server on {eye_name}.")
-            eye_dict["pyro_proxy"].start_inference_server()
-            sleep(2)
-
-        logger.info("Waiting for inference servers to start...")
-        sleep(5)
+        if odmodel.detector_backend in ("roboflow", "roboflow_http"):
+            for eye_name, eye_dict in self.eyes.items():
+                # start docker servers
+                logger.info(f"Starting inference server on {eye_name}.")
+                eye_dict["pyro_proxy"].start_inference_server()
         for eye_name, eye_dict in self.eyes.items():
             # carry out a single detection to initialize the model weights
             logger.debug(f"Initializing model on {eye_name}. Model parameters: {odmodel.model_name}, "
@@ -135,7 +139,181 @@ class CoBeMaster(object):
                                                model_name=odmodel.model_name,
                                                model_id=odmodel.model_id,
                                                inf_server_url=odmodel.inf_server_url,
-                                               version=odmodel.version)
+                                               version=odmodel.version,
+                                               backend=odmodel.detector_backend)
+        self.wait_for_eyes_ready()
+
+    def wait_for_eyes_ready(self, timeout=odmodel.ready_timeout, num_predictions=odmodel.warmup_num_predictions):
+        """Warming up the detectors of all eyes in parallel and waiting until every eye reported ready (see
+        CoBeEye.warm_up), so that startup takes as long as the slowest eye. Returns the readiness reports by eye
+        name."""
+        def warm_up(eye_dict):
+            # own proxy of this thread
+            with Proxy(eye_dict["pyro_proxy"]._pyroUri) as proxy:
+                return proxy.warm_up(num_predictions=num_predictions, timeout=timeout)
+
+        logger.info("Waiting for object detectors to warm up...")
+        t_start = time.perf_counter()
+        reports = {}
+        with ThreadPoolExecutor(max_workers=max(len(self.eyes), 1)) as executor:
+            futures = {eye_name: executor.submit(warm_up, eye_dict) for eye_name, eye_dict in self.eyes.items()}
+            for eye_name, future in futures.items():
+                try:
+                    reports[eye_name] = future.result()
+                except Exception as e:
+                    reports[eye_name] = {"ready": False, "error": str(e)}
+        for eye_name, report in reports.items():
+            if report["ready"]:
+                logger.info(f"{eye_name} ready after {report['total_time']:.2f}s, warm-up latencies (s): "
+                            f"{[round(latency, 3) for latency in report['warmup_latencies']]}")
+            else:
+                logger.error(f"{eye_name} not ready: {report['error']}")
+        logger.info(f"Object detectors warmed up in {time.perf_counter() - t_start:.2f}s.")
+        return reports
+
+    def push_remap_luts(self):
+        """Sending a compact remap table built from the calibration maps to every calibrated eye, so that the eyes
+        return detections directly in simulation space and the master does not have to remap them. The calibration
+        maps and thus the tables only cover the primary sensor of each eye, detections of other sensors are not
+        remapped."""
+        for eye_name, eye_dict in self.eyes.items():
+            if eye_dict.get("cmap_xmap_extrap") is None:
+                logger.warning(f"No calibration maps for {eye_name}, remap table not sent.")
+                continue
+            logger.info(f"Sending remap table to {eye_name}.")
+            lut_message = build_remap_lut(eye_dict)
+            eye_dict["pyro_proxy"].set_remap_lut(lut_message)
+            # keeping a copy to remap frames of the eye that are inferred on the master
+            eye_dict["remap_lut"] = RemapLUT.from_message(lut_message)
+
+    def fit_camera_crops(self, margin=vision.camera_crop_margin):
+        """Cropping the sensors of the calibrated eyes to the arena footprint seen during calibration, so that the
+        arena fills the inference frames, and converting the axes of the calibration maps to the new crops. Must be
+        called before the remap tables are sent to the eyes (see push_remap_luts)."""
+        for eye_name, eye_dict in self.eyes.items():
+            if eye_dict.get("cmap_x_interp") is None:
+                logger.warning(f"No calibration maps for {eye_name}, crop not fitted.")
+                continue
+            camera = eye_dict["pyro_proxy"].get_camera_crop()
+            old_crop = camera["crop"]
+            try:
+                new_crop = arena_crop(arena_points(eye_dict), old_crop, camera["frame_size"], camera["capture_size"],
+                                      flip_method=camera["flip_method"], margin=float(margin))
+            except ValueError as e:
+                logger.warning(f"Crop of {eye_name} not fitted: {e}")
+                continue
+            if new_crop == old_crop:
+                continue
+            logger.info(f"Cropping {eye_name} from {old_crop} to arena footprint {new_crop}.")
+            if not eye_dict["pyro_proxy"].set_camera_crop(**new_crop):
+                logger.warning(f"{eye_name} could not be cropped.")
+                continue
+            for axis in ("x", "y"):
+                for key in (f"cmap_{axis}_interp", f"cmap_{axis}_extrap"):
+                    eye_dict[key] = crop_calibration_axis(eye_dict[key], old_crop, new_crop, camera["frame_size"],
+                                                          flip_method=camera["flip_method"], axis=axis)
+            eye_dict["camera_crop"] = new_crop
+
+    def start_inference_offloading(self, num_workers=odmodel.offload_num_workers):
+        """Starting a pool of CPU detector workers on the master and routing each inference request either to the
+        eye or to the pool, depending on which route currently has the lower latency. Returns False if the pool could
+        not be started, all inference requests then go to the eyes."""
+        pool = OffloadPool(num_workers=int(num_workers))
+        try:
+            pool.start()
+        except Exception as e:
+            logger.error(f"Could not start inference offloading pool, inferring on the eyes only: {e}")
+            return False
+        self.inference_router = InferenceRouter(pool,
+                                                alpha=float(odmodel.offload_ewma_alpha),
+                                                probe_every=int(odmodel.offload_probe_every),
+                                                jpeg_quality=int(odmodel.offload_jpeg_quality))
+        return True
+
+    def stop_inference_offloading(self):
+        """Stopping the worker pool, all inference requests go to the eyes again"""
+        if self.inference_router is not None:
+            logger.info(f"Inference routing stats: {self.inference_router.get_stats()}")
+            self.inference_router.pool.stop()
+            self.inference_router = None
+
+    def start_adaptive_resolution(self):
+        """Adapting the inference size of every eye to its latency budget (cobe.settings.network.eyes[...]
+        ["latency_budget"], default cobe.settings.vision.latency_budget) within cobe.settings.vision.resolution_ladder"""
+        budgets = {eye_name: float(eye_dict["eye_data"]["latency_budget"])
+                   for eye_name, eye_dict in self.eyes.items() if "latency_budget" in eye_dict["eye_data"]}
+        self.resolution_controller = ResolutionController(
+            ladder=[int(size) for size in str(vision.resolution_ladder).split(",")],
+            latency_budgets=budgets,
+            default_budget=float(vision.latency_budget),
+            loss_patience=int(vision.resolution_loss_patience))
+        logger.info(f"Adaptive inference size started with ladder {self.resolution_controller.ladder}.")
+
+    def stop_adaptive_resolution(self):
+        """Going back to fixed inference sizes"""
+        if self.resolution_controller is not None:
+            logger.info(f"Adaptive inference size stats: {self.resolution_controller.get_stats()}")
+            self.resolution_controller = None
+
+    def request_adaptive_detections(self, eye_name, eye_dict, req_ts, confidence=35):
+        """Requesting the detections of the latest frame of an eye at the inference size chosen by the resolution
+        controller (fixed 416 if adaptive resolution is not started) and feeding the round trip back to it"""
+        size = self.resolution_controller.size(eye_name) if self.resolution_controller is not None else 416
+        eye_dict["inference_size"] = (size, size)
+        detections = self.request_detections(eye_name, eye_dict, req_ts, confidence=confidence, img_width=size,
+                                             img_height=size)
+        if self.resolution_controller is not None:
+            self.resolution_controller.update(eye_name, seconds_between(now_ns(), req_ts), len(detections))
+        return detections
+
+    def request_detections(self, eye_name, eye_dict, req_ts, confidence=35, img_width=416, img_height=416):
+        """Requesting the detections of the latest frame of an eye, inferred on the eye or on the worker pool of
+        the master if offloading was started"""
+        if self.inference_router is not None:
+            return self.inference_router.infer(eye_name, eye_dict, confidence=confidence, img_width=img_width,
+                                               img_height=img_height, req_ts=req_ts)
+        return eye_dict["pyro_proxy"].inference(confidence=confidence, img_width=img_width, img_height=img_height,
+                                                req_ts=req_ts)
+
+    def start_detection_streams(self, target_rate=network.stream_target_rate, confidence=35, img_width=416,
+                                img_height=416):
+        """Starting the detection receiver on the master and asking every eye to push its detections to it
+        continuously instead of waiting for inference requests"""
+        if self.detection_receiver is None:
+            self.detection_receiver = DetectionReceiver()
+            self.detection_receiver.start()
+        for eye_name, eye_dict in self.eyes.items():
+            logger.info(f"Starting detection stream on {eye_name}.")
+            self.detection_receiver.forget(eye_name)
+            eye_dict["pyro_proxy"].start_detection_stream(str(self.detection_receiver.uri), eye_name,
+                                                          target_rate=target_rate, confidence=confidence,
+                                                          img_width=img_width, img_height=img_height)
+            eye_dict["last_stream_seq"] = 0
+            eye_dict["inference_size"] = (img_width, img_height)
+
+    def stop_detection_streams(self):
+        """Stopping the detection streams of all eyes and the detection receiver on the master"""
+        for eye_name, eye_dict in self.eyes.items():
+            logger.info(f"Stopping detection stream on {eye_name}.")
+            eye_dict["pyro_proxy"].stop_detection_stream()
+        if self.detection_receiver is not None:
+            self.detection_receiver.stop()
+            self.detection_receiver = None
+
+    def get_streamed_detections(self, eye_name, eye_dict, timeout=0.1):
+        """Returning the latest detections pushed by a streaming eye that were not consumed before together with
+        the capture timestamp of the corresponding frame. Returns (None, None) if no new message arrived within
+        timeout seconds."""
+        message, t_received = self.detection_receiver.get_latest(eye_name, after_seq=eye_dict["last_stream_seq"],
+                                                                 timeout=timeout)
+        if message is None:
+            return None, None
+        eye_dict["last_stream_seq"] = message["seq"]
+        detections = expand_detections(message["detections"])
+        for detection in detections:
+            detection["capture_ts"] = message["capture_ts"]
+            detection["tracked"] = message.get("tracked", False)
+        return detections, message["capture_ts"]
 
     def calculate_calibration_maps(self, with_visualization=False, interactive=False, detach=False, with_save=True):
         """Calculates the calibration maps for each eye and stores them in the eye dict
@@ -256,16 +434,16 @@ class CoBeMaster(object):
             # no calibration map found so a new map is necessary
             return False
 
-    def cleanup_inference_servers(self, waitfor=3):
+    def cleanup_inference_servers(self, waitfor=0):
         """Cleans up inference servers on all eyes.
-        Waiting for waitfor seconds between each stop and remove operation"""
+        Waiting for waitfor seconds between each stop and remove operation. Stopping returns once the container has
+        stopped, so no waiting is needed."""
         for eye_name, eye_dict in self.eyes.items():
             # stop docker servers
             sleep(waitfor)
             logger.info(f"Stopping inference server on {eye_name}...")
             eye_dict["pyro_proxy"].stop_inference_server()
 
-            # waiting for docker to stop the container
             sleep(waitfor)
             logger.info(f"Removing inference server on {eye_name}...")
             eye_dict["pyro_proxy"].remove_inference_server()
@@ -395,6 +573,20 @@ class CoBeMaster(object):
                 # print FPS with overwriting previous line
                 logger.info(f"FPS~ on eye {eye_name}: ", int(1 / delta_time.total_seconds()))
 
+    def save_calibration_snapshot(self, eye_name, eye_dict, file_path):
+        """Downloads the latest calibration frame of an eye and saves it as image. Returns False if the eye has no
+        calibration frame yet or fetching failed."""
+        try:
+            frame = fetch_snapshot(eye_dict["eye_data"]["host"], int(vision.mjpeg_stream_port), "calibration")
+        except Exception as e:
+            logger.warning(f"Could not fetch calibration frame from eye {eye_name}: {e}")
+            return False
+        if frame is None:
+            logger.warning(f"No calibration frame from eye {eye_name} yet, image not saved.")
+            return False
+        cv2.imwrite(file_path, frame)
+        return True
+
     def collect_images_from_stream(self, t_max=3000, target_eye_name="eye_0", auto_freq=1.5):
         """Collecting and saving images from all eyes when s button is pressed.
         Quitting when q button is pressed.
@@ -429,9 +621,9 @@ class CoBeMaster(object):
                     # check timer and autocapture status
                     if (datetime.now() - timer).total_seconds() > auto_freq and auto_on:
                         # saving frame as image in every auto_freq seconds
-                        cap = cv2.VideoCapture(f'http://{eye_dict["eye_data"]["host"]}:8000/calibration.mjpg')
-                        ret, frame = cap.read()
-                        cv2.imwrite(os.path.join(save_path, f"{eye_name}_{it}.png"), frame)
+                        if not self.save_calibration_snapshot(eye_name, eye_dict,
+                                                              os.path.join(save_path, f"{eye_name}_{it}.png")):
+                            continue
                         logger.info(f"Auto-saved image {eye_name}_{it}.png")
                         # reset timer
                         timer = datetime.now()
@@ -447,10 +639,9 @@ class CoBeMaster(object):
                             return
                         elif event.key == keyboard.Key.space:
                             # saving frame as image
-                            # todo: cleanup the mjpeg server paths as global settings
-                            cap = cv2.VideoCapture(f'http://{eye_dict["eye_data"]["host"]}:8000/calibration.mjpg')
-                            ret, frame = cap.read()
-                            cv2.imwrite(os.path.join(save_path, f"{eye_name}_{it}.png"), frame)
+                            if not self.save_calibration_snapshot(eye_name, eye_dict,
+                                                                  os.path.join(save_path, f"{eye_name}_{it}.png")):
+                                continue
                             logger.info(f"Saved image {eye_name}_{it}.png")
                         elif event.key == keyboard.Key.up:
                             if auto_on and (datetime.now() - switch_time).total_seconds() > 1:
@@ -465,14 +656,17 @@ class CoBeMaster(object):
                                 switch_time = datetime.now()
         logger.info("Finished collecting images. Bye Bye!")
 
-    def start(self, show_simulation_space=False, target_eye_name="eye_0", t_max=10000, kalman_queue=None):
+    def start(self, show_simulation_space=False, target_eye_name="eye_0", t_max=10000, kalman_queue=None,
+              stream_detections=network.stream_detections):
         """Starts the main action loop of the CoBe project
         :param show_simulation_space: if True, the remapping to simulation space will be visualized as
                                         matplotlib plot
         :param target_eye_name: name of the eye for which remapping should be visualized (only if show_simulation_space
                                 is True)
         :param t_max: maximum number of iterations after which automatically quitting, otherwise press ESC
-        :param kalman_queue: queue for sending data to the Kalman filter"""
+        :param kalman_queue: queue for sending data to the Kalman filter
+        :param stream_detections: if True, eyes push their detections continuously and the loop consumes the latest
+                                  ones instead of requesting inference from each eye"""
 
         # Preparing eyes for running
         try:
@@ -488,8 +682,23 @@ class CoBeMaster(object):
                 return
         logger.info("Calibrating eyes...")
         self.calibrate(with_visualization=True, interactive=True, detach=True)
+        if vision.fit_camera_crop:
+            logger.info("Fitting camera crops to the arena...")
+            self.fit_camera_crops()
+        if vision.remap_on_eye:
+            logger.info("Sending remap tables to eyes...")
+            self.push_remap_luts()
         logger.info("Starting OD detection on eyes...")
         self.initialize_object_detectors()
+        if stream_detections:
+            logger.info("Starting detection streams on eyes...")
+            self.start_detection_streams()
+        else:
+            if odmodel.offload_inference:
+                logger.info("Starting inference offloading pool...")
+                self.start_inference_offloading()
+            if vision.adaptive_resolution:
+                self.start_adaptive_resolution()
 
         # setting up visualization if requested
         if show_simulation_space:
@@ -525,8 +734,14 @@ class CoBeMaster(object):
                             start_time = datetime.now()
                             logger.info("Asking for inference results...")
                             # eye_dict["pyro_proxy"].get_calibration_frame()
-                            req_ts = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S.%f")
-                            detections = eye_dict["pyro_proxy"].inference(confidence=35, img_width=416, img_height=416, req_ts=req_ts)
+                            if stream_detections:
+                                # consuming whatever the eye pushed last, the capture time is used as timestamp
+                                detections, req_ts = self.get_streamed_detections(eye_name, eye_dict)
+                                if detections is None:
+                                    continue
+                            else:
+                                req_ts = now_ns()
+                                detections = self.request_adaptive_detections(eye_name, eye_dict, req_ts)
                             logger.info("Received inference results!")
                             logger.info(detections)
 
@@ -536,13 +751,37 @@ class CoBeMaster(object):
 
                                 # generating predator positions to be sent to the simulation
                                 predator_positions = []
+                                # capture time of the inferred frame is passed to the Kalman filter, falling back
+                                # to the request time for eyes not reporting it
+                                t_cap = detections[0].get("capture_ts", req_ts) if len(detections) > 0 else req_ts
                                 for detection in detections:
                                     logger.info(f"Frame in processing was requested at {detection.get('request_ts')}")
+                                    if "sim_x" in detection and not show_simulation_space:
+                                        # detection was already remapped to simulation space on the eye, the
+                                        # visualization needs the camera and calibration image coordinates of the
+                                        # master-side remap below
+                                        if detection["sim_x"] is None:
+                                            logger.info(f"No predator detected on eye {eye_name}")
+                                            continue
+                                        xreal, yreal = detection["sim_x"], detection["sim_y"]
+                                        predator_positions.append([xreal, yreal])
+                                        logger.info(f"Eye {eye_name} detected predator @ ({xreal}, {yreal})")
+                                        continue
+
+                                    primary_sensor_id = eye_dict["primary_sensor_id"]
+                                    if detection.get("sensor_id", primary_sensor_id) != primary_sensor_id:
+                                        # the calibration maps of the master only cover the primary sensor of an
+                                        # eye
+                                        logger.warning(f"No remapping for sensor {detection['sensor_id']} of eye "
+                                                       f"{eye_name}, detection skipped.")
+                                        continue
+
                                     xcam, ycam = detection["x"], detection["y"]
 
                                     # scaling up the coordinates to the original calibration image size
-                                    xcam, ycam = xcam * (vision.display_width / vision.display_width), ycam * (
-                                            vision.display_height / vision.display_height)
+                                    img_width, img_height = eye_dict.get("inference_size", (416, 416))
+                                    xcam, ycam = xcam * (vision.display_width / img_width), ycam * (
+                                            vision.display_height / img_height)
 
                                     # remapping detection point to simulation space according to ARCO map
                                     xreal, yreal = self.remap_detection_point(eye_dict, xcam, ycam)
@@ -572,20 +811,8 @@ class CoBeMaster(object):
                                             plt.pause(0.001)
 
                                         # scaling down the coordinates from the original calibration image size to the
-                                        # simulation space
-                                        extrapolation_percentage = (vision.interp_map_res + 2 * vision.extrap_skirt) / \
-                                                                    vision.interp_map_res
-                                        theoretical_extrap_space_size = (2 * max_abs_coord) * extrapolation_percentage
-                                        centering_const = theoretical_extrap_space_size / 2
-                                        xreal, yreal = xreal * (
-                                                theoretical_extrap_space_size / aruco.proj_calib_image_width) - centering_const, \
-                                                       yreal * (
-                                                theoretical_extrap_space_size / aruco.proj_calib_image_height) - centering_const
-
-                                        # matching directions in simulation space
-                                        xreal, yreal = yreal, -xreal
-
-                                        # todo: simplify this by merging the 2 scaling commandscobe-pm
+                                        # simulation space and matching directions in simulation space
+                                        xreal, yreal = scale_to_simulation_space(xreal, yreal)
 
                                         predator_positions.append([xreal, yreal])
                                         logger.info(f"Eye {eye_name} detected predator @ ({xreal}, {yreal})")
@@ -596,7 +823,7 @@ class CoBeMaster(object):
                                 # generating predator position
                                 if len(predator_positions) > 0:
                                     if kalman_queue is not None:
-                                        kalman_queue.put((req_ts, datetime.now(), predator_positions))
+                                        kalman_queue.put((t_cap, now_ns(), predator_positions))
                                     else:
                                         generate_pred_json(predator_positions)
 
@@ -635,6 +862,12 @@ class CoBeMaster(object):
         except KeyboardInterrupt:
             logger.error("Interrupt requested by user. Exiting... (For normal business press 'ESC' long to quit!)")
 
+        finally:
+            if stream_detections:
+                self.stop_detection_streams()
+            self.stop_inference_offloading()
+            self.stop_adaptive_resolution()
+
         # todo: decide on cleaning up inference servers here or in the cleanup function
 
     def startup_rendering_stack(self):
@@ -684,19 +917,25 @@ class CoBeCalib(object):
         pass
 
     def fetch_calibration_frames(self, eyes):
-        """Fetches calibration frames from all eyes"""
-        # Generate and publish calibration frames for all eyes
-        for eye_name, eye_dict in eyes.items():
+        """Fetches calibration frames from all eyes concurrently. Every eye publishes a calibration frame, which is
+        then downloaded losslessly at full resolution from the one-shot endpoint of its streaming server. The frame
+        is None if fetching failed."""
+        def fetch(eye_name, eye_dict):
             logger.info(f"Fetching calibration frame from eye {eye_name}")
-            eye_dict["pyro_proxy"].get_calibration_frame()
-
-        # Downloading calibration frames from all eyes
-        for eye_name, eye_dict in eyes.items():
-            logger.debug(eye_dict)
-            cap = cv2.VideoCapture(f'http://{eye_dict["eye_data"]["host"]}:8000/calibration.mjpg')
-            ret, frame = cap.read()
-            eye_dict["calibration_frame"] = frame
-            cap.release()
+            # own proxy of this thread
+            with Proxy(eye_dict["pyro_proxy"]._pyroUri) as proxy:
+                proxy.get_calibration_frame()
+            return fetch_snapshot(eye_dict["eye_data"]["host"], int(vision.mjpeg_stream_port), "calibration",
+                                  fmt=vision.calibration_snapshot_format)
+
+        with ThreadPoolExecutor(max_workers=max(len(eyes), 1)) as executor:
+            futures = {eye_name: executor.submit(fetch, eye_name, eye_dict) for eye_name, eye_dict in eyes.items()}
+            for eye_name, future in futures.items():
+                try:
+                    eyes[eye_name]["calibration_frame"] = future.result()
+                except Exception as e:
+                    logger.error(f"Could not fetch calibration frame from eye {eye_name}: {e}")
+                    eyes[eye_name]["calibration_frame"] = None
 
         logger.info("Calibration frames fetched.")
 
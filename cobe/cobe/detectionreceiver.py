@@ -0,0 +1,109 @@
+"""
+CoBe - CoBe - Detection Receiver
+
+Master-side receiver of detection messages pushed by eyes running in streaming mode. The receiver is exposed as a
+Pyro5 object in a background daemon thread of the master. Eyes call its push_detections method (oneway) after every
+inference, and the master's main loop consumes the latest message of each eye instead of polling the eyes.
+
+A Pyro5 proxy can only be used by the thread that owns it. Threads of the eye pushing messages and worker threads of
+the master calling the eyes therefore connect their own proxies to the same URIs.
+"""
+import threading
+
+from Pyro5.api import expose, behavior, oneway
+from Pyro5.server import Daemon
+
+from cobe.settings import network, logs
+from cobe.tools.iptools import get_local_ip_address
+from cobe.tools.timetools import now_ns
+
+logger = logs.setup_logger("detectionreceiver")
+
+
+def expand_detections(compact_detections):
+    """Expanding compact (class, x, y, width, height, confidence[, sim_x, sim_y]) detection tuples pushed by the eyes
+    into the prediction dicts returned by CoBeEye.inference()"""
+    detections = []
+    for det in compact_detections:
+        detection = {"class": det[0], "x": det[1], "y": det[2], "width": det[3], "height": det[4],
+                     "confidence": det[5]}
+        if len(det) > 6:
+            # already remapped to simulation space on the eye
+            detection["sim_x"], detection["sim_y"] = det[6], det[7]
+        detections.append(detection)
+    return detections
+
+
+@behavior(instance_mode="single")
+@expose
+class DetectionReceiver(object):
+    """Pyro5 object collecting the latest detection message of every streaming eye"""
+
+    def __init__(self):
+        # latest message and its receive time per eye name
+        self._lock = threading.Lock()
+        self._new_message = threading.Condition(self._lock)
+        self._messages = {}
+        # number of received messages per eye name
+        self.num_received = {}
+        # pyro daemon serving the receiver and its thread
+        self.daemon = None
+        self.daemon_thread = None
+        self.uri = None
+
+    @oneway
+    def push_detections(self, message):
+        """Called by the eyes to push their latest detection message containing
+            - eye_name: name of the eye as in cobe.settings.network
+            - seq: increasing sequence number of the message
+            - frame_id: sequence number of the inferred frame on the eye
+            - capture_ts: capture timestamp (ns, see cobe.tools.timetools) of the inferred frame
+            - tracked: True if the positions were tracked with optical flow between inferences
+            - detections: list of compact (class, x, y, width, height, confidence[, sim_x, sim_y]) tuples
+        Oneway calls from different threads of the eye can arrive out of order, a message with a sequence number not
+        larger than the stored one is counted but does not replace it."""
+        eye_name = message["eye_name"]
+        with self._new_message:
+            self.num_received[eye_name] = self.num_received.get(eye_name, 0) + 1
+            entry = self._messages.get(eye_name)
+            if entry is not None and message["seq"] <= entry[0]["seq"]:
+                return
+            self._messages[eye_name] = (message, now_ns())
+            self._new_message.notify_all()
+
+    def get_latest(self, eye_name, after_seq=0, timeout=None):
+        """Returns the latest message of the eye with sequence number larger than after_seq together with its receive
+        time, waiting at most timeout seconds for it. Returns (None, None) if no such message arrived."""
+
+        def has_new_message():
+            entry = self._messages.get(eye_name)
+            return entry is not None and entry[0]["seq"] > after_seq
+
+        with self._new_message:
+            if not self._new_message.wait_for(has_new_message, timeout=timeout):
+                return None, None
+            return self._messages[eye_name]
+
+    def forget(self, eye_name):
+        """Drops the stored message of an eye, e.g. before it (re)starts streaming with new sequence numbers"""
+        with self._new_message:
+            self._messages.pop(eye_name, None)
+
+    def start(self, host=None, port=network.detection_receiver_port):
+        """Starts serving the receiver with a Pyro5 daemon in a background thread and returns its URI"""
+        if host is None:
+            host = get_local_ip_address()
+        self.daemon = Daemon(host=host, port=int(port))
+        self.uri = self.daemon.register(self, objectId="cobe.detectionreceiver")
+        self.daemon_thread = threading.Thread(target=self.daemon.requestLoop, daemon=True)
+        self.daemon_thread.start()
+        logger.info(f"Detection receiver started with URI {self.uri}")
+        return str(self.uri)
+
+    def stop(self):
+        """Stops the Pyro5 daemon of the receiver"""
+        if self.daemon is not None:
+            self.daemon.shutdown()
+            self.daemon = None
+            self.daemon_thread = None
+            logger.info("Detection receiver stopped.")
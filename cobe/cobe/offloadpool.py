@@ -0,0 +1,196 @@
+"""
+CoBe - CoBe - Offload Pool
+
+Master-side pool of CPU detector workers that takes over inference from overloaded eyes (e.g. at thermal throttling or
+after a model upgrade). Instead of running inference, the eye sends a compact JPEG of its latest frame via Pyro
+(CoBeEye.get_encoded_frame) and one of the workers of the pool runs the detector on it. The InferenceRouter measures
+the latency of both routes per eye as exponentially weighted moving averages and sends each request to the faster one,
+probing the other route every few requests so that its estimate stays current. Results of both routes have the
+prediction schema of CoBeEye.inference().
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+import serpent
+
+from cobe.settings import odmodel, logs
+from cobe.vision.detectors import create_detector
+
+logger = logs.setup_logger("offloadpool")
+
+# names of the inference routes
+ROUTE_EYE = "eye"
+ROUTE_POOL = "pool"
+
+
+class OffloadPool(object):
+    """Worker threads each owning a detector instance and inferring JPEG encoded frames from a shared queue. OpenCV
+    decodes and infers without holding the GIL, so the workers run in parallel on the CPU cores of the master.
+
+    :param num_workers: number of worker threads (and detector instances)
+    :param backend: detector backend of the workers (see cobe.vision.detectors.create_detector)
+    :param detector_factory: optional callable returning a detector, used instead of backend"""
+
+    def __init__(self, num_workers=2, backend=None, detector_factory=None):
+        if detector_factory is None:
+            backend = odmodel.offload_backend if backend is None else backend
+            detector_factory = lambda: create_detector(backend)
+        self.num_workers = int(num_workers)
+        self.detector_factory = detector_factory
+        # jobs as (jpeg, confidence, future)
+        self._jobs = queue.Queue()
+        self._workers = []
+        # number of inferred frames
+        self.num_inferred = 0
+
+    def start(self):
+        """Creates the detectors of the workers and starts the worker threads. Errors while creating a detector
+        (e.g. a missing model file) are raised here and no worker is started."""
+        detectors = []
+        try:
+            for _ in range(self.num_workers):
+                detectors.append(self.detector_factory())
+        except Exception:
+            for detector in detectors:
+                detector.close()
+            raise
+        for i, detector in enumerate(detectors):
+            worker = threading.Thread(target=self._work_loop, args=(detector,), name=f"offload-worker-{i}",
+                                      daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Offload pool started with {self.num_workers} workers.")
+
+    def stop(self, timeout=2):
+        """Stops the worker threads after the queued jobs"""
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+
+    def queue_length(self):
+        """Returns the number of frames waiting for a worker"""
+        return self._jobs.qsize()
+
+    def submit(self, jpeg, confidence=40):
+        """Queues a JPEG encoded frame for inference and returns a Future of the predictions"""
+        future = Future()
+        self._jobs.put((jpeg, confidence, future))
+        return future
+
+    def detect(self, jpeg, confidence=40, timeout=None):
+        """Infers a JPEG encoded frame and waits for the predictions in frame pixels"""
+        return self.submit(jpeg, confidence).result(timeout=timeout)
+
+    def _work_loop(self, detector):
+        """Main loop of a worker decoding and inferring queued frames with its detector"""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            jpeg, confidence, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if img is None:
+                    raise ValueError("Could not decode offloaded frame")
+                preds = detector.predict(img, confidence=confidence)
+                self.num_inferred += 1
+                future.set_result(preds)
+            except Exception as e:
+                logger.error(f"Error while inferring offloaded frame: {e}")
+                future.set_exception(e)
+        detector.close()
+
+
+class InferenceRouter(object):
+    """Routes the inference requests of the master either to the eyes or to an OffloadPool based on the measured
+    latency of both routes per eye
+
+    :param pool: OffloadPool taking over offloaded frames
+    :param alpha: weight of the latest measurement in the moving averages of the latencies
+    :param probe_every: every probe_every-th request of an eye takes the slower route to keep its estimate current
+    :param margin: the pool is only preferred when it is faster than the eye by this fraction, avoiding flapping
+    :param jpeg_quality: JPEG quality (0-100) of the frames the eyes send to the pool
+    :param timeout: maximum time (s) to wait for the predictions of the pool"""
+
+    def __init__(self, pool, alpha=0.2, probe_every=20, margin=0.2, jpeg_quality=80, timeout=2.):
+        self.pool = pool
+        self.alpha = float(alpha)
+        self.probe_every = int(probe_every)
+        self.margin = float(margin)
+        self.jpeg_quality = int(jpeg_quality)
+        self.timeout = float(timeout)
+        # latency moving averages (s) by (eye name, route)
+        self.latencies = {}
+        # number of requests by eye name and by (eye name, route)
+        self._num_requests = {}
+        self.num_routed = {}
+
+    def record(self, eye_name, route, seconds):
+        """Adds a latency measurement of a route of an eye to its moving average"""
+        key = (eye_name, route)
+        latency = self.latencies.get(key)
+        self.latencies[key] = seconds if latency is None else (1 - self.alpha) * latency + self.alpha * seconds
+
+    def choose(self, eye_name):
+        """Returns the route of the next request of an eye"""
+        num_requests = self._num_requests.get(eye_name, 0) + 1
+        self._num_requests[eye_name] = num_requests
+        eye_latency = self.latencies.get((eye_name, ROUTE_EYE))
+        pool_latency = self.latencies.get((eye_name, ROUTE_POOL))
+        # measuring the eye first and the pool as soon as the first probe is due
+        if eye_latency is None:
+            return ROUTE_EYE
+        if pool_latency is None:
+            return ROUTE_POOL if num_requests % self.probe_every == 0 else ROUTE_EYE
+        faster, slower = (ROUTE_POOL, ROUTE_EYE) if pool_latency < eye_latency * (1 - self.margin) \
+            else (ROUTE_EYE, ROUTE_POOL)
+        return slower if num_requests % self.probe_every == 0 else faster
+
+    def infer(self, eye_name, eye_dict, confidence=40, img_width=416, img_height=416, req_ts=None):
+        """Returns the predictions of the latest frame of an eye inferred on the chosen route
+        :param eye_dict: eye dict of the master holding the pyro_proxy of the eye and optionally its remap_lut"""
+        route = self.choose(eye_name)
+        t_start = time.perf_counter()
+        if route == ROUTE_POOL:
+            preds = self.infer_on_pool(eye_dict, confidence, img_width, img_height, req_ts=req_ts)
+        else:
+            preds = eye_dict["pyro_proxy"].inference(confidence=confidence, img_width=img_width,
+                                                     img_height=img_height, req_ts=req_ts)
+        self.record(eye_name, route, time.perf_counter() - t_start)
+        self.num_routed[(eye_name, route)] = self.num_routed.get((eye_name, route), 0) + 1
+        return preds
+
+    def infer_on_pool(self, eye_dict, confidence, img_width, img_height, req_ts=None):
+        """Fetches the latest frame of an eye as JPEG, infers it on the pool and returns the predictions with the
+        fields CoBeEye.inference() adds (see CoBeEye.stamp_prediction)"""
+        frame = eye_dict["pyro_proxy"].get_encoded_frame(img_width, img_height, quality=self.jpeg_quality)
+        if frame is None:
+            return []
+        preds = self.pool.detect(serpent.tobytes(frame["jpeg"]), confidence=confidence, timeout=self.timeout)
+        remap_lut = eye_dict.get("remap_lut")
+        frame_size = (img_width, img_height)
+        for pred in preds:
+            pred["capture_ts"] = frame["capture_ts"]
+            if req_ts is not None:
+                pred["request_ts"] = req_ts
+            pred["reused"] = False
+            pred["tracked"] = False
+            pred["sensor_id"] = frame["sensor_id"]
+            if remap_lut is not None:
+                pred["sim_x"], pred["sim_y"] = remap_lut.remap(pred["x"], pred["y"], frame_size=frame_size)
+        return preds
+
+    def get_stats(self):
+        """Returns the latency moving averages (s) and the number of requests per eye and route"""
+        return {"latencies": {f"{eye_name}/{route}": latency
+                              for (eye_name, route), latency in self.latencies.items()},
+                "num_routed": {f"{eye_name}/{route}": num for (eye_name, route), num in self.num_routed.items()},
+                "queue_length": self.pool.queue_length()}
@@ -0,0 +1,113 @@
+"""
+CoBe - CoBe - Resolution Controller
+
+Master-side controller adapting the inference resolution of each eye to a latency budget. The resolution is chosen
+from a ladder of square input sizes (e.g. 320/416/512/640). After every request the controller updates a moving
+average of the round-trip time of the eye and
+    - steps down when the average exceeds the latency budget of the eye
+    - steps up when the next size is expected to stay well within the budget, or within the budget when detections
+      were lost for several requests in a row
+Inference time is assumed to grow with the number of pixels to predict the round trip of the next size. After a
+switch the average is measured anew at the new size before the next switch. Every switch is logged with its reason.
+"""
+from cobe.settings import logs
+
+logger = logs.setup_logger("resolutioncontroller")
+
+
+class ResolutionController(object):
+    """Chooses the inference resolution of every eye from a ladder of sizes based on its measured round-trip times
+
+    :param ladder: increasing input sizes (px) to choose from
+    :param latency_budgets: latency budget (s) by eye name
+    :param default_budget: latency budget (s) of eyes without their own
+    :param alpha: weight of the latest round trip in the moving average
+    :param headroom: a larger size is chosen without lost detections only if its expected round trip stays below this
+                     fraction of the budget
+    :param min_samples: number of requests measured at a size before switching again
+    :param loss_patience: number of requests in a row without detections after which detections count as lost
+    :param initial_size: size eyes start with, default the ladder size closest to 416"""
+
+    def __init__(self, ladder=(320, 416, 512, 640), latency_budgets=None, default_budget=0.1, alpha=0.3,
+                 headroom=0.7, min_samples=5, loss_patience=5, initial_size=416):
+        self.ladder = sorted(int(size) for size in ladder)
+        self.latency_budgets = dict(latency_budgets or {})
+        self.default_budget = float(default_budget)
+        self.alpha = float(alpha)
+        self.headroom = float(headroom)
+        self.min_samples = int(min_samples)
+        self.loss_patience = int(loss_patience)
+        self.initial_index = min(range(len(self.ladder)), key=lambda i: abs(self.ladder[i] - int(initial_size)))
+        # per eye state: ladder index, round-trip moving average, number of samples at the size, number of requests
+        # in a row without detections and whether the eye had detections at all since the last switch
+        self._states = {}
+        # switches as (eye name, old size, new size, reason)
+        self.switches = []
+
+    def _state(self, eye_name):
+        state = self._states.get(eye_name)
+        if state is None:
+            state = {"index": self.initial_index, "latency": None, "num_samples": 0, "num_missed": 0,
+                     "had_detections": False}
+            self._states[eye_name] = state
+        return state
+
+    def budget(self, eye_name):
+        """Returns the latency budget (s) of an eye"""
+        return float(self.latency_budgets.get(eye_name, self.default_budget))
+
+    def size(self, eye_name):
+        """Returns the current inference size (px) of an eye"""
+        return self.ladder[self._state(eye_name)["index"]]
+
+    def expected_latency(self, eye_name, size):
+        """Returns the expected round trip (s) of an eye at another size, scaling the measured average with the
+        number of pixels"""
+        state = self._state(eye_name)
+        return state["latency"] * (size / self.size(eye_name)) ** 2
+
+    def update(self, eye_name, round_trip, num_detections):
+        """Adds the round trip (s) and number of detections of the latest request of an eye and switches its size if
+        needed. Returns the size of the next request."""
+        state = self._state(eye_name)
+        state["latency"] = round_trip if state["latency"] is None \
+            else (1 - self.alpha) * state["latency"] + self.alpha * round_trip
+        state["num_samples"] += 1
+        if num_detections > 0:
+            state["num_missed"] = 0
+            state["had_detections"] = True
+        else:
+            state["num_missed"] += 1
+        if state["num_samples"] < self.min_samples:
+            return self.size(eye_name)
+
+        budget = self.budget(eye_name)
+        index = state["index"]
+        if state["latency"] > budget and index > 0:
+            self._switch(eye_name, index - 1, f"round trip {state['latency'] * 1000:.0f}ms over budget "
+                                              f"{budget * 1000:.0f}ms")
+        elif index < len(self.ladder) - 1:
+            expected = self.expected_latency(eye_name, self.ladder[index + 1])
+            lost = state["had_detections"] and state["num_missed"] >= self.loss_patience
+            if lost and expected < budget:
+                self._switch(eye_name, index + 1, f"detections lost for {state['num_missed']} requests, expected "
+                                                  f"round trip {expected * 1000:.0f}ms within budget "
+                                                  f"{budget * 1000:.0f}ms")
+            elif expected < budget * self.headroom:
+                self._switch(eye_name, index + 1, f"expected round trip {expected * 1000:.0f}ms well within budget "
+                                                  f"{budget * 1000:.0f}ms")
+        return self.size(eye_name)
+
+    def _switch(self, eye_name, index, reason):
+        """Switches the size of an eye to the ladder index and starts measuring anew"""
+        state = self._state(eye_name)
+        old_size, new_size = self.ladder[state["index"]], self.ladder[index]
+        logger.info(f"Switching inference size of {eye_name} from {old_size} to {new_size}: {reason}")
+        self.switches.append((eye_name, old_size, new_size, reason))
+        state.update(index=index, latency=None, num_samples=0, num_missed=0, had_detections=False)
+
+    def get_stats(self):
+        """Returns the current size and round-trip average (s) of every eye and the number of switches"""
+        return {"eyes": {eye_name: {"size": self.ladder[state["index"]], "latency": state["latency"]}
+                         for eye_name, state in self._states.items()},
+                "num_switches": len(self.switches)}
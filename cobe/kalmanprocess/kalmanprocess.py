@@ -13,7 +13,7 @@ from cobe.settings import logs
 logging.basicConfig(level=logs.log_level, format=logs.log_format)
 logger = logs.setup_logger("cobe-kalmanproc")
 
-from datetime import datetime
+from cobe.tools.timetools import now_ns, seconds_between
 from queue import Empty
 from cobe.settings import kalmanprocess as klmp
 
@@ -106,7 +106,7 @@ def kalman_process_OD(od_position_queue, output_queue):
     """Main Kalman-filtering process running in separate thread, getting object detection values from the passed queue.
     The queue is filled by the object detection process, which is running in a separate thread. The elements pushed to the queue
     contain:
-    - timestamp of capture
+    - timestamp of capture (ns, see cobe.tools.timetools)
     - timestamp of pushing in queue
     - x, y coordinate of predator as tuple
     implementation according to: https://cocalc.com/share/public_paths/7557a5ac1c870f1ec8f01271959b16b49df9d087/08-Designing-Kalman-Filters.ipynb
@@ -124,7 +124,7 @@ def kalman_process_OD(od_position_queue, output_queue):
     u_y = 0
     tracker = KalmanFilter(dt, u_x, u_y, process_noise_var, measurement_noise_var, measurement_noise_var) #KalmanFilter(dim_x=4, dim_z=2)
 
-    t_last_predict = t_last_groundtruth = datetime.now()
+    t_last_predict = t_last_groundtruth = now_ns()
     filter_parameters = {}
 
     while True:
@@ -135,24 +135,23 @@ def kalman_process_OD(od_position_queue, output_queue):
             od_element = None
 
         if od_element is not None:
-            (tcap_str, tpush, pred_positions) = od_element
-            tcap = datetime.strptime(tcap_str, "%Y-%m-%d %H:%M:%S.%f")
+            (tcap, tpush, pred_positions) = od_element
             xod, yod = pred_positions[0]
-            t_last_groundtruth = datetime.now()
+            t_last_groundtruth = now_ns()
             logger.debug(f"Kalman process: received element from queue: {od_element}")
 
         # check if time since last process run is greater than 1/process_freq
-        if (datetime.now() - t_last_predict).total_seconds() > 1 / process_freq:
+        if seconds_between(now_ns(), t_last_predict) > 1 / process_freq:
             # update tracker
             # check if we have a ground truth value since last prediction by comparing t_last_predict and t_last_groundtruth
-            if (t_last_predict - t_last_groundtruth).total_seconds() >= 0:
+            if t_last_predict >= t_last_groundtruth:
                 logger.debug(f"Kalman process: no ground truth value since last prediction, use prediction to further predict")
                 (x, y) = tracker.predict()
                 x = x[0, 0]
                 y = y[0, 0]
                 # (x1, y1) = tracker.update(np.array([[x], [y]]))
                 # Saving filter parameters in the blind period until we get a new measurement from the past
-                filter_parameters[datetime.now()] = [tracker.x, tracker.u, tracker.A, tracker.B, tracker.H, tracker.Q, tracker.R, tracker.P]
+                filter_parameters[now_ns()] = [tracker.x, tracker.u, tracker.A, tracker.B, tracker.H, tracker.Q, tracker.R, tracker.P]
             else:
                 logger.debug(f"Kalman process: found ground truth value since last prediction, use ground truth value to further predict")
                 # # since there is a delay we predict as many times as we have to given dt and tcap of ground truth values
@@ -173,7 +172,7 @@ def kalman_process_OD(od_position_queue, output_queue):
                 y = y[0, 0]
                 (x1, y1) = tracker.update(np.array([[xod], [yod]]))
                 # The filter is now in the past and we predict until the current time
-                time_diff = (tcap - datetime.now()).total_seconds()
+                time_diff = seconds_between(tcap, now_ns())
                 num_predictions = abs(int(time_diff * process_freq))
                 logger.info(f"Time difference between tcap and now: {time_diff}, number of predictions: {num_predictions}")
                 for i in range(num_predictions):
@@ -185,17 +184,17 @@ def kalman_process_OD(od_position_queue, output_queue):
 
                 # Cleaning filter parameters from the past
                 filter_parameters = {}
-                filter_parameters[datetime.now()] = [tracker.x, tracker.u, tracker.A, tracker.B, tracker.H, tracker.Q,
+                filter_parameters[now_ns()] = [tracker.x, tracker.u, tracker.A, tracker.B, tracker.H, tracker.Q,
                                                      tracker.R, tracker.P]
 
-            t_last_predict = datetime.now()
+            t_last_predict = now_ns()
 
             logger.debug(f"Kalman process: predicted values: x: {x}, y: {y}")
 
             # check if output queue is not None, if so push predicted values to output queue
             if output_queue is not None:
                 logger.debug(f"Kalman process: output queue is not None, push predicted values to output queue")
-                t_put = datetime.now()
+                t_put = now_ns()
                 output_queue.put((t_put, [(x, y)]))
             else:
                 # logger.info([(x, y)])
@@ -4,6 +4,17 @@ parameters for the Pyro5 local network
 nano_username = "nano"
 nano_cobe_installdir = "/home/nano/Desktop/CoBe"
 unified_eyeserver_port = 1234
+# if True, eyes run their own capture-detect loop and push detections to a receiver on the master instead of being
+# polled with inference() calls
+stream_detections = False
+# port of the Pyro5 daemon serving the detection receiver on the master
+detection_receiver_port = 9095
+# target rate (Hz) of the detection loop on the eyes in streaming mode
+stream_target_rate = 20
+# eyes driving several sensors (cobe.settings.vision.sensor_ids) name the fisheye calibration map of each sensor in
+# "sensor_calibration_maps", e.g. {0: "map_eye_0.npz", 1: "map_eye_0_sensor_1.npz"}
+# with adaptive inference resolution (cobe.settings.vision.adaptive_resolution) eyes can have their own round-trip
+# budget (s) in "latency_budget"
 eyes = {
     "eye_0": {
         "expected_id": 0,
@@ -1,4 +1,10 @@
 """Settings of the object detection model trained on roboflow server"""
+import os
+
+# detector backend of the eyes (see cobe.vision.detectors): "roboflow" (inference server in docker container),
+# "roboflow_http" (same server with lean keep-alive client), "onnx" (exported model run on the CPU of the eye) or
+# "fake" (deterministic predictions for tests and benchmarks)
+detector_backend = os.getenv("DETECTOR_BACKEND", "roboflow")
 # inference docker server name
 inf_server_cont_name = "roboflow_inference_container"
 
@@ -17,4 +23,55 @@ model_name = "cobe"  # "face-detection-mik1i"
 inf_server_url = "http://localhost:9001/"
 model_id = "/" + model_name
 version = "1"
+# JPEG quality (0-100) of the frames sent to the inference server by the roboflow_http backend
+jpeg_quality = os.getenv("INF_JPEG_QUALITY", 90)
+# socket timeout (s) of the connection to the inference server of the roboflow_http backend
+inf_server_timeout = os.getenv("INF_SERVER_TIMEOUT", 5)
+# maximum time (s) an eye waits for its detector backend (e.g. the inference server starting in its container) to
+# answer and finish the warm-up predictions
+ready_timeout = os.getenv("READY_TIMEOUT", 120)
+# interval (s) between readiness probes of the detector backend
+ready_poll_interval = os.getenv("READY_POLL_INTERVAL", 0.5)
+# number of predictions carried out to warm up the model before the eye reports ready
+warmup_num_predictions = os.getenv("WARMUP_NUM_PREDICTIONS", 3)
+
+### ONNX backend settings ###
+# path of the exported ONNX model (YOLOv5/YOLOv8 output layout) on the eye
+onnx_model_path = os.getenv("ONNX_MODEL_PATH", "models/cobe.onnx")
+# comma separated class names in the order of the model outputs
+onnx_class_names = os.getenv("ONNX_CLASS_NAMES", "stick")
+# input size (px) of the network
+onnx_input_size = os.getenv("ONNX_INPUT_SIZE", 416)
+# IoU threshold of non-maximum suppression
+onnx_nms_threshold = os.getenv("ONNX_NMS_THRESHOLD", 0.45)
+# number of CPU threads used by OpenCV DNN (None: OpenCV default)
+onnx_num_threads = os.getenv("ONNX_NUM_THREADS", None)
+
+### Fake backend settings ###
+# time (s) each fake prediction takes to mimic a real backend
+fake_latency = os.getenv("FAKE_LATENCY", 0)
+
+### Inference offloading settings ###
+# if True, the master routes inference requests either to the eyes or to a pool of CPU detector workers on the master
+# depending on their measured latency (see cobe.cobe.offloadpool)
+offload_inference = os.getenv("OFFLOAD_INFERENCE", "False") == "True"
+# detector backend and number of workers of the pool on the master
+offload_backend = os.getenv("OFFLOAD_BACKEND", "onnx")
+offload_num_workers = os.getenv("OFFLOAD_NUM_WORKERS", 2)
+# weight of the latest measurement in the latency moving averages of the routes
+offload_ewma_alpha = os.getenv("OFFLOAD_EWMA_ALPHA", 0.2)
+# every offload_probe_every-th request of an eye takes the slower route to keep its latency estimate current
+offload_probe_every = os.getenv("OFFLOAD_PROBE_EVERY", 20)
+# JPEG quality (0-100) of the frames sent by the eyes to the pool
+offload_jpeg_quality = os.getenv("OFFLOAD_JPEG_QUALITY", 80)
 
+### Docker settings ###
+# unix socket of the Docker daemon on the eye managing the inference server container, the user running the eye
+# needs access to it (e.g. membership in the docker group)
+docker_socket = os.getenv("DOCKER_SOCKET", "/var/run/docker.sock")
+# Docker Engine API version (empty: the version of the daemon)
+docker_api_version = os.getenv("DOCKER_API_VERSION", "v1.41")
+# socket timeout (s) of the requests to the Docker daemon
+docker_timeout = os.getenv("DOCKER_TIMEOUT", 10)
+# time (s) the inference server container gets to stop before it is killed
+docker_stop_timeout = os.getenv("DOCKER_STOP_TIMEOUT", 10)
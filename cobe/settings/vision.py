@@ -22,14 +22,104 @@ display_height = os.getenv("DISPLAY_HEIGHT", 416)  # fisheye calibration maps sh
 end_x = min(start_x + crop_width, capture_width)  # end cropping at this x coordinate
 end_y = min(start_y + crop_height, capture_height)  # end cropping at this y coordinate
 frame_rate = os.getenv("FRAME_RATE", 20)
+# undistort frames with the fisheye calibration map of the eye (cobe.settings.network.eyes[...]["fisheye_calibration_map"])
+undistort_frames = os.getenv("UNDISTORT_FRAMES", "False") == "True"
+# maximum time (s) to wait for the first frame of the background capture thread
+frame_wait_timeout = os.getenv("FRAME_WAIT_TIMEOUT", 1)
+
+### Arena crop settings ###
+# if True, the master fits the sensor crop (start_x, start_y, crop_width, crop_height) of the CSI eyes to the arena
+# footprint found during calibration so that the arena fills the inference frames (see cobe.tools.croptools)
+fit_camera_crop = os.getenv("FIT_CAMERA_CROP", "False") == "True"
+# fraction of the arena size kept around the arena on each side of the fitted crop
+camera_crop_margin = os.getenv("CAMERA_CROP_MARGIN", 0.05)
+
+### Capture source settings ###
+# source of the frames (see cobe.vision.capture): "csi" (CSI camera of the nVidia boards), "video" (replay of the video
+# file capture_path), "folder" (replay of the images in the folder capture_path) or "v4l2" (V4L2/USB camera with
+# device index or path capture_path)
+capture_source = os.getenv("CAPTURE_SOURCE", "csi")
+capture_path = os.getenv("CAPTURE_PATH", "0")
+# replay speed of video and folder sources relative to their native rate or frame_rate (0: as fast as possible)
+capture_rate = os.getenv("CAPTURE_RATE", 1.0)
+# restarting replay sources at their end
+capture_loop = os.getenv("CAPTURE_LOOP", "True") == "True"
+# comma separated ids of the sensors driven by the eye (e.g. "0,1" for both CSI ports of the board). Frames of all
+# sensors are inferred together and predictions are tagged with their sensor_id.
+sensor_ids = os.getenv("SENSOR_IDS", "0")
+# comma separated capture paths of the sensors in the order of sensor_ids, needed for video and folder sources with
+# several sensors. If not given, several v4l2 sensors use their id as device index.
+sensor_capture_paths = os.getenv("SENSOR_CAPTURE_PATHS", None)
+
+### Adaptive inference resolution settings ###
+# if True, the master chooses the inference size of each eye from resolution_ladder so that its round trip stays
+# within its latency budget (cobe.settings.network.eyes[...]["latency_budget"] or latency_budget)
+adaptive_resolution = os.getenv("ADAPTIVE_RESOLUTION", "False") == "True"
+resolution_ladder = os.getenv("RESOLUTION_LADDER", "320,416,512,640")  # comma separated square input sizes (px)
+latency_budget = os.getenv("LATENCY_BUDGET", 0.1)  # default latency budget (s) of the eyes
+# number of requests in a row without detections after which a larger size is tried
+resolution_loss_patience = os.getenv("RESOLUTION_LOSS_PATIENCE", 5)
+
+### Pipelined inference settings ###
+# if True the eye overlaps capturing/preprocessing of the next frame with inference of the current one and inference()
+# returns the latest finished result
+pipelined_inference = os.getenv("PIPELINED_INFERENCE", "False") == "True"
+# number of preprocessed frames waiting for inference (higher: more throughput, staler results)
+inference_queue_depth = os.getenv("INFERENCE_QUEUE_DEPTH", 1)
+# maximum time (s) inference() waits for a new pipeline result
+pipeline_result_timeout = os.getenv("PIPELINE_RESULT_TIMEOUT", 1)
+
+### Dynamic ROI inference settings ###
+# if True, the eye only runs inference in a window around the last recent and confident detection of the target
+# class and falls back to full-frame search on a miss or every roi_full_frame_every frames
+roi_inference = os.getenv("ROI_INFERENCE", "False") == "True"
+roi_target_class = "stick"
+roi_size = os.getenv("ROI_SIZE", 0.4)  # size of the window as fraction of the frame
+roi_input_size = os.getenv("ROI_INPUT_SIZE", 256)  # the window is resized to this size (px) before inference
+roi_min_confidence = os.getenv("ROI_MIN_CONFIDENCE", 0.5)  # minimum confidence of the last detection
+roi_max_age = os.getenv("ROI_MAX_AGE", 0.5)  # maximum age (s) of the last detection
+roi_full_frame_every = os.getenv("ROI_FULL_FRAME_EVERY", 10)
+
+### Motion gated inference settings ###
+# if True, the eye reuses the predictions of the last inferred frame when the arena did not change enough since then
+motion_gating = os.getenv("MOTION_GATING", "False") == "True"
+motion_threshold = os.getenv("MOTION_THRESHOLD", 2.0)  # mean absolute grayscale difference (0-255) of thumbnails
+motion_max_reuse_age = os.getenv("MOTION_MAX_REUSE_AGE", 1.0)  # maximum age (s) of reused predictions
+motion_thumbnail_size = 64  # size (px) of the thumbnails frames are compared on
+
+### Optical flow tracking settings ###
+# if True, the eye follows the last detections of roi_target_class with sparse optical flow on every captured frame and
+# returns/pushes tracked positions between inferences
+flow_tracking = os.getenv("FLOW_TRACKING", "False") == "True"
+flow_max_points = os.getenv("FLOW_MAX_POINTS", 30)  # maximum number of points seeded per box
+flow_min_points = os.getenv("FLOW_MIN_POINTS", 5)  # an object is lost when fewer points could be followed
+flow_max_age = os.getenv("FLOW_MAX_AGE", 1.0)  # maximum time (s) an object is tracked without new detection
+
+### Metrics settings ###
+# number of latest samples per stage the latency percentiles of the eye metrics are calculated on
+metrics_num_samples = os.getenv("METRICS_NUM_SAMPLES", 1024)
 
 ### Published MJPEG stream settings ###
 publish_mjpeg_stream = os.getenv("PUBLISH_MJPEG_STREAM", True)
 mjpeg_stream_port = os.getenv("MJPEG_STREAM_PORT", 8000)
+# resolution of the monitoring stream, by default the frames are streamed in the resolution they were inferred in
+mjpeg_stream_width = os.getenv("MJPEG_STREAM_WIDTH", None)
+mjpeg_stream_height = os.getenv("MJPEG_STREAM_HEIGHT", None)
+# default JPEG quality (1-100) of the streams, clients can request their own with e.g. /stream.mjpg?quality=60 as well
+# as a max frame rate (fps) and width (width)
+mjpeg_stream_quality = os.getenv("MJPEG_STREAM_QUALITY", 80)
+# format of the calibration frames fetched by the master from the one-shot endpoints of the eyes, png (lossless,
+# compressed) or npy (raw array)
+calibration_snapshot_format = os.getenv("CALIBRATION_SNAPSHOT_FORMAT", "png")
+# socket timeout (s) after which stream clients that stopped reading are removed
+mjpeg_client_timeout = os.getenv("MJPEG_CLIENT_TIMEOUT", 10)
 
 ### Mapping parameters
 # resolution of interpolated map
 interp_map_res = os.getenv("INTERP_MAP_RES", 500)
 # number of points to use for extrapolation on sides of map
 extrap_skirt = 50
+# if True, the master pushes a remap table to the eyes after calibration and the eyes return detections already
+# remapped to simulation space
+remap_on_eye = os.getenv("REMAP_ON_EYE", "False") == "True"
 
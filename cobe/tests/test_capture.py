@@ -0,0 +1,114 @@
+"""
+    Testing the capture module of cobe.vision
+    ==========================================
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import cv2
+import numpy as np
+from cobe.vision.capture import FrameGrabber, ImageFolderSource, VideoFileSource, validate_capture_config
+
+
+class FakeCapture(object):
+    """Mimicking cv2.VideoCapture by returning numbered frames"""
+
+    def __init__(self):
+        self.num_reads = 0
+        self.released = False
+
+    def read(self):
+        self.num_reads += 1
+        return True, np.full((4, 4, 3), self.num_reads % 255, dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+class TestFrameGrabber(unittest.TestCase):
+    """ Testing the FrameGrabber class of cobe.vision.capture """
+
+    def test_latest_frame_is_published(self):
+        """ Testing that the capture thread publishes increasing frame ids and releases the capture on stop"""
+        cap = FakeCapture()
+        grabber = FrameGrabber(cap)
+        grabber.start()
+        frame, frame_id, t_cap = grabber.wait_for_frame(timeout=1)
+        self.assertIsNotNone(frame)
+        self.assertIsNotNone(t_cap)
+        _, newer_id, _ = grabber.wait_for_frame(after_id=frame_id, timeout=1)
+        self.assertGreater(newer_id, frame_id)
+        grabber.stop()
+        self.assertTrue(cap.released)
+        self.assertFalse(grabber.is_running())
+
+    def test_reopen_serves_old_frame_until_first_new_one(self):
+        """ Testing that the latest frame of the old capture stays available while the new capture starts up"""
+        old_cap = FakeCapture()
+        grabber = FrameGrabber(old_cap)
+        grabber.start()
+        _, old_id, _ = grabber.wait_for_frame(timeout=1)
+        new_cap = FakeCapture()
+        new_cap_ready = threading.Event()
+        # frames of the new capture are white, the ones of the old capture never are
+        new_cap.read = lambda: (True, np.full((4, 4, 3), 255, dtype=np.uint8)) if new_cap_ready.is_set() \
+            else (False, None)
+        try:
+            grabber.reopen(lambda: new_cap)
+            self.assertTrue(old_cap.released)
+            frame, frame_id, _ = grabber.latest()
+            self.assertNotEqual(frame[0, 0, 0], 255)
+            self.assertGreaterEqual(frame_id, old_id)
+            new_cap_ready.set()
+            new_frame, new_id, _ = grabber.wait_for_frame(after_id=frame_id, timeout=1)
+        finally:
+            grabber.stop()
+        self.assertGreater(new_id, frame_id)
+        self.assertEqual(new_frame[0, 0, 0], 255)
+
+    def test_capture_time_from_pts(self):
+        """ Testing that buffer PTS are mapped to the clock with the smallest observed delivery delay"""
+        cap = FakeCapture()
+        pts_ms = [1000.0]
+        cap.get = lambda prop: pts_ms[0]
+        grabber = FrameGrabber(cap)
+        self.assertEqual(grabber._capture_time(5_000_000_000), 5_000_000_000)
+        # next frame 40 ms later by PTS but delivered with 10 ms extra delay
+        pts_ms[0] = 1040.0
+        self.assertEqual(grabber._capture_time(5_050_000_000), 5_040_000_000)
+        # without PTS the read time is used
+        pts_ms[0] = 0
+        self.assertEqual(grabber._capture_time(6_000_000_000), 6_000_000_000)
+
+
+class TestReplaySources(unittest.TestCase):
+    """ Testing the replay capture sources of cobe.vision.capture """
+
+    def test_image_folder_source(self):
+        """ Testing that images are replayed in order, resized, looped and paced at the frame rate"""
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(3):
+                cv2.imwrite(os.path.join(folder, f"frame_{i}.png"), np.full((20, 30, 3), i * 50, dtype=np.uint8))
+            source = ImageFolderSource(folder, frame_rate=50, frame_size=(16, 8))
+            t_start = time.monotonic()
+            frames = [source.read()[1] for _ in range(6)]
+            self.assertGreaterEqual(time.monotonic() - t_start, 5 / 50 * 0.9)
+        self.assertEqual(frames[0].shape, (8, 16, 3))
+        self.assertEqual([int(frame[0, 0, 0]) for frame in frames], [0, 50, 100, 0, 50, 100])
+
+    def test_video_file_source(self):
+        """ Testing that a recorded video is replayed and stops at its end without looping"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "recording.avi")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (32, 24))
+            for i in range(4):
+                writer.write(np.full((24, 32, 3), i * 60, dtype=np.uint8))
+            writer.release()
+            source = VideoFileSource(path, rate=0, loop=False)
+            reads = [source.read() for _ in range(5)]
+            source.release()
+        self.assertEqual([ret_val for ret_val, _ in reads], [True, True, True, True, False])
+        self.assertEqual(reads[0][1].shape, (24, 32, 3))
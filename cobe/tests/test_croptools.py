@@ -0,0 +1,40 @@
+"""
+    Testing the croptools module of cobe.tools
+    ===========================================
+"""
+import unittest
+
+import numpy as np
+
+from cobe.tools.croptools import arena_crop, crop_calibration_axis
+
+
+class TestCropTools(unittest.TestCase):
+    """ Testing the fitting of sensor crops to the arena footprint """
+
+    def test_arena_crop(self):
+        """ Testing that the fitted crop keeps the frame aspect, contains the arena and that calibration axes are
+        converted to the frames of the new crop"""
+        crop = {"start_x": 1150, "start_y": 850, "end_x": 2150, "end_y": 1850}
+        frame_size, capture_size = (416, 416), (3264, 2464)
+        # arena in the center of the frame, wider than high
+        points = np.array([[100., 150.], [300., 150.], [300., 250.], [100., 250.]])
+        for flip_method in (0, 2):
+            new_crop = arena_crop(points, crop, frame_size, capture_size, flip_method=flip_method, margin=0.05)
+            width, height = new_crop["end_x"] - new_crop["start_x"], new_crop["end_y"] - new_crop["start_y"]
+            self.assertAlmostEqual(width / height, 1, delta=0.01)
+            self.assertLess(width, crop["end_x"] - crop["start_x"])
+            xs = crop_calibration_axis(points[:, 0], crop, new_crop, frame_size, flip_method=flip_method, axis="x")
+            ys = crop_calibration_axis(points[:, 1], crop, new_crop, frame_size, flip_method=flip_method, axis="y")
+            # the arena spans the fitted frame horizontally apart from the margin
+            self.assertTrue(np.all((xs > 0) & (xs < 416) & (ys > 0) & (ys < 416)))
+            self.assertAlmostEqual(np.max(xs) - np.min(xs), 416 / 1.1, delta=3)
+            # axes stay increasing so that lookups in the calibration maps work unchanged
+            self.assertGreater(xs[1], xs[0])
+
+        with self.assertRaises(ValueError):
+            arena_crop(points, crop, frame_size, capture_size, flip_method=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+    Testing the detectionreceiver module of cobe.cobe
+    ==================================================
+"""
+import threading
+import time
+import unittest
+
+from Pyro5.api import Proxy
+
+from cobe.cobe.detectionreceiver import DetectionReceiver, expand_detections
+
+
+def message(seq, eye_name="eye_0", detections=()):
+    return {"eye_name": eye_name, "seq": seq, "frame_id": seq, "capture_ts": seq * 1000, "tracked": False,
+            "detections": list(detections)}
+
+
+class TestExpandDetections(unittest.TestCase):
+    """ Testing the expand_detections function of cobe.cobe.detectionreceiver """
+
+    def test_compact(self):
+        """ Testing that compact tuples are expanded into prediction dicts"""
+        detections = expand_detections([("stick", 10., 20., 5., 6., 0.9), ("ball", 1., 2., 3., 4., 0.5)])
+        self.assertEqual(detections, [{"class": "stick", "x": 10., "y": 20., "width": 5., "height": 6.,
+                                       "confidence": 0.9},
+                                      {"class": "ball", "x": 1., "y": 2., "width": 3., "height": 4.,
+                                       "confidence": 0.5}])
+
+    def test_remapped(self):
+        """ Testing that tuples remapped on the eye additionally carry their simulation space position"""
+        detection, = expand_detections([["stick", 10., 20., 5., 6., 0.9, 0.25, -0.5]])
+        self.assertEqual(detection["class"], "stick")
+        self.assertEqual((detection["x"], detection["y"]), (10., 20.))
+        self.assertEqual((detection["sim_x"], detection["sim_y"]), (0.25, -0.5))
+
+    def test_empty(self):
+        """ Testing that a message without detections is expanded into an empty list"""
+        self.assertEqual(expand_detections([]), [])
+
+
+class TestDetectionReceiver(unittest.TestCase):
+    """ Testing the DetectionReceiver class of cobe.cobe.detectionreceiver """
+
+    def test_latest_wins(self):
+        """ Testing that only the latest message of each eye is kept and returned once per sequence number"""
+        receiver = DetectionReceiver()
+        for seq in (1, 2, 3):
+            receiver.push_detections(message(seq))
+        receiver.push_detections(message(1, eye_name="eye_1"))
+        latest, t_received = receiver.get_latest("eye_0", timeout=0)
+        self.assertEqual(latest["seq"], 3)
+        self.assertIsNotNone(t_received)
+        self.assertEqual(receiver.get_latest("eye_0", after_seq=3, timeout=0.05), (None, None))
+        self.assertEqual(receiver.get_latest("eye_1")[0]["seq"], 1)
+        self.assertEqual(receiver.get_latest("eye_2", timeout=0), (None, None))
+        self.assertEqual(receiver.num_received, {"eye_0": 3, "eye_1": 1})
+
+    def test_late_older_message_is_ignored(self):
+        """ Testing that a message arriving after a newer one of the same eye does not replace it"""
+        receiver = DetectionReceiver()
+        receiver.push_detections(message(1))
+        receiver.push_detections(message(3))
+        receiver.push_detections(message(2))
+        latest, _ = receiver.get_latest("eye_0", after_seq=1, timeout=0)
+        self.assertEqual(latest["seq"], 3)
+        self.assertEqual(receiver.get_latest("eye_0", after_seq=3, timeout=0.05), (None, None))
+        self.assertEqual(receiver.num_received["eye_0"], 3)
+        # a restarted eye counts from 1 again
+        receiver.forget("eye_0")
+        receiver.push_detections(message(1))
+        self.assertEqual(receiver.get_latest("eye_0", timeout=0)[0]["seq"], 1)
+
+    def test_get_latest_waits(self):
+        """ Testing that get_latest returns as soon as a newer message arrives"""
+        receiver = DetectionReceiver()
+        receiver.push_detections(message(1))
+        timer = threading.Timer(0.1, receiver.push_detections, args=(message(2),))
+        timer.start()
+        t_start = time.monotonic()
+        latest, _ = receiver.get_latest("eye_0", after_seq=1, timeout=2)
+        timer.join()
+        self.assertEqual(latest["seq"], 2)
+        self.assertLess(time.monotonic() - t_start, 1)
+
+    def test_push_over_pyro(self):
+        """ Testing that messages pushed through a Pyro5 proxy arrive at the receiver"""
+        receiver = DetectionReceiver()
+        uri = receiver.start(host="127.0.0.1", port=0)
+        try:
+            with Proxy(uri) as proxy:
+                proxy.push_detections(message(1, detections=[("stick", 10., 20., 5., 6., 0.9)]))
+            latest, _ = receiver.get_latest("eye_0", timeout=2)
+        finally:
+            receiver.stop()
+        self.assertEqual(expand_detections(latest["detections"])[0]["x"], 10.)
+
+
+if __name__ == '__main__':
+    unittest.main()
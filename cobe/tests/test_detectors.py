@@ -0,0 +1,35 @@
+"""
+    Testing the detectors module of cobe.vision
+    ============================================
+"""
+import unittest
+import numpy as np
+from cobe.vision.detectors import FakeDetector, create_detector, parse_yolo_output
+
+
+class TestDetectors(unittest.TestCase):
+    """ Testing the detector backends of cobe.vision.detectors """
+
+    def test_fake_detector(self):
+        """ Testing that the fake backend returns the same box in frame pixels and respects the threshold"""
+        detector = create_detector("fake")
+        self.assertIsInstance(detector, FakeDetector)
+        img = np.zeros((200, 400, 3), dtype=np.uint8)
+        preds = detector.predict(img, confidence=40)
+        self.assertEqual(preds, detector.predict(img, confidence=40))
+        self.assertEqual((preds[0]["x"], preds[0]["y"]), (200, 100))
+        self.assertEqual(detector.predict(img, confidence=95), [])
+
+    def test_parse_yolo_output(self):
+        """ Testing parsing of YOLOv8 layout outputs with non-maximum suppression and scaling to the frame"""
+        # 3 candidate boxes (cx, cy, w, h, score class 0, score class 1) in columns, two of them overlapping
+        output = np.array([[[100, 102, 300],
+                            [100, 101, 50],
+                            [20, 20, 10],
+                            [20, 20, 10],
+                            [0.9, 0.8, 0.1],
+                            [0.0, 0.1, 0.7]]])
+        preds = parse_yolo_output(output, ["stick", "fish"], confidence=0.5, nms_threshold=0.45, scale_x=2.)
+        self.assertEqual([pred["class"] for pred in preds], ["stick", "fish"])
+        self.assertAlmostEqual(preds[0]["x"], 200)
+        self.assertAlmostEqual(preds[1]["width"], 20)
@@ -0,0 +1,126 @@
+"""
+    Testing the dockerclient module of cobe.vision
+    ===============================================
+"""
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler
+
+from cobe.vision.dockerclient import DockerClient, DockerError
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    """Mimicking the Docker Engine API with containers kept in memory"""
+    protocol_version = "HTTP/1.1"
+    containers = {}
+    connections = set()
+
+    def address_string(self):
+        return "unix"
+
+    def reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self, method):
+        FakeDockerHandler.connections.add(id(self.connection))
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path.split("/")[2:]
+        if int(self.headers.get("Content-Length", 0)) > 0:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        containers = FakeDockerHandler.containers
+        if url.path == "/v1.41/containers/json":
+            name = json.loads(query["filters"])["name"][0]
+            return self.reply(200, [{"Id": cid, "Names": ["/" + c["name"]]} for cid, c in containers.items()
+                                    if name in c["name"]])
+        if url.path == "/v1.41/containers/create":
+            if body["Image"] != "server:latest":
+                return self.reply(404, {"message": f"No such image: {body['Image']}"})
+            cid = f"{len(containers):064d}"
+            containers[cid] = {"name": query["name"], "running": False}
+            return self.reply(201, {"Id": cid, "Warnings": []})
+        if url.path == "/v1.41/images/create":
+            data = json.dumps({"error": f"pull access denied for {query['fromImage']}"}).encode() + b"\n"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            return self.wfile.write(data)
+        if len(parts) < 2 or parts[1] not in containers:
+            return self.reply(404, {"message": "No such container"})
+        container = containers[parts[1]]
+        if method == "DELETE":
+            del containers[parts[1]]
+            return self.reply(204)
+        if parts[-1] == "json":
+            return self.reply(200, {"State": {"Status": "running" if container["running"] else "exited",
+                                              "Running": container["running"], "ExitCode": 0,
+                                              "StartedAt": "2024-01-01T00:00:00Z"}})
+        running = parts[-1] == "start"
+        if container["running"] == running:
+            return self.reply(304)
+        container["running"] = running
+        return self.reply(204)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TestDockerClient(unittest.TestCase):
+    """ Testing the DockerClient class of cobe.vision.dockerclient """
+
+    def test_container_lifecycle(self):
+        """ Testing create, start, inspect, stop and remove on a fake daemon over a single connection"""
+        with tempfile.TemporaryDirectory() as folder:
+            socket_path = os.path.join(folder, "docker.sock")
+            server = FakeDockerServer(socket_path, FakeDockerHandler)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            client = DockerClient(socket_path, timeout=2)
+            try:
+                self.assertIsNone(client.find_container("inference"))
+                with self.assertRaises(DockerError) as context:
+                    client.create_container("inference", {"Image": "other:latest"})
+                self.assertIn("pull access denied for other", context.exception.message)
+                cid = client.create_container("inference", {"Image": "server:latest"})
+                self.assertEqual(client.find_container("inference"), cid)
+                self.assertTrue(client.start(cid))
+                self.assertFalse(client.start(cid))
+                self.assertEqual(client.health(cid)["status"], "running")
+                self.assertIsNone(client.health(cid)["health"])
+                self.assertTrue(client.stop(cid, timeout=1))
+                self.assertFalse(client.health(cid)["running"])
+                client.remove(cid)
+                self.assertIsNone(client.find_container("inference"))
+                self.assertEqual(client.num_connections, 1)
+                self.assertEqual(len(FakeDockerHandler.connections), 1)
+            finally:
+                client.close()
+                server.shutdown()
+                server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
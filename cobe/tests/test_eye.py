@@ -3,8 +3,14 @@
     ======================================
 """
 import multiprocessing
+import os
+import tempfile
 import unittest
+from unittest import mock
+import cv2
+import numpy as np
 import cobe.vision.eye as eye  # The module to test
+from cobe.vision.capture import ImageFolderSource
 from Pyro5.api import Proxy  # For testing the Pyro5 proxy
 from time import sleep
 
@@ -14,12 +20,157 @@ class TestEye(unittest.TestCase):
 
     def test_eye_return_id(self):
         """ Testing the return_id method of CoBeEye class"""
-        # Create an instance of the class
-        eye_instance = eye.CoBeEye()
+        # Create an instance of the class reading frames from an image folder instead of the camera
+        with tempfile.TemporaryDirectory() as folder:
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye(cap=ImageFolderSource(folder))
         # Call the method
         returned_id = eye_instance.return_id()
         # Check the result
         self.assertEqual(returned_id, eye_instance.id)
+        eye_instance.frame_grabber.stop()
+
+    def test_multi_sensor_inference(self):
+        """ Testing that frames of all sensors are inferred together and predictions are tagged by sensor"""
+        with tempfile.TemporaryDirectory() as folder, mock.patch.object(eye.vision, "publish_mjpeg_stream", False):
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye(caps={0: ImageFolderSource(folder), 1: ImageFolderSource(folder)})
+        eye_instance.initODModel(None, None, None, None, None, backend="fake")
+        preds = eye_instance.inference(confidence=40, img_width=208, img_height=208, req_ts=1)
+        self.assertEqual(eye_instance.get_sensor_ids(), [0, 1])
+        self.assertEqual(sorted(pred["sensor_id"] for pred in preds), [0, 1])
+        self.assertEqual(eye_instance.detector_model.num_predictions, 2)
+        self.assertEqual(eye_instance.get_metrics()["counters"]["inference_batches"], 1)
+        for frame_grabber in eye_instance.frame_grabbers.values():
+            frame_grabber.stop()
+
+    def test_apply_capture_config(self):
+        """ Testing that a new capture configuration is applied at runtime and invalid ones are rejected"""
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.multiple(eye.vision, publish_mjpeg_stream=False, capture_source="folder",
+                                    capture_path=folder, sensor_ids="0", sensor_capture_paths=None):
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye()
+            try:
+                result = eye_instance.apply_capture_config({"display_width": "208", "display_height": 104})
+                frame, _, _ = eye_instance.frame_grabber.wait_for_frame(timeout=1)
+                with self.assertRaises(ValueError):
+                    eye_instance.apply_capture_config({"display_width": -1})
+                with mock.patch.object(eye_instance, "get_frame", return_value=(None, None)) as get_frame:
+                    eye_instance.get_calibration_frame()
+            finally:
+                eye_instance.frame_grabber.stop()
+        self.assertEqual(frame.shape, (104, 208, 3))
+        self.assertEqual(eye_instance.get_capture_config()["display_width"], 208)
+        self.assertGreaterEqual(result["reopen_time"], 0)
+        self.assertIsNotNone(result["first_frame_time"])
+        get_frame.assert_called_once_with(img_width=208, img_height=104, sensor_id=None)
+
+    def test_apply_capture_config_restores_on_failure(self):
+        """ Testing that a configuration failing to open is rolled back and capturing continues with the old one"""
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.multiple(eye.vision, publish_mjpeg_stream=False, capture_source="folder",
+                                    capture_path=folder, sensor_ids="0", sensor_capture_paths=None):
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye()
+            old_config = eye_instance.get_capture_config()
+            open_sensor = eye_instance.open_sensor
+            try:
+                with mock.patch.object(eye_instance, "open_sensor",
+                                       side_effect=[RuntimeError("pipeline failed"), open_sensor(0, old_config)]):
+                    with self.assertRaises(RuntimeError):
+                        eye_instance.apply_capture_config({"display_width": 208})
+                running = eye_instance.frame_grabber.is_running()
+                frame, _, _ = eye_instance.frame_grabber.wait_for_frame(timeout=1)
+            finally:
+                eye_instance.frame_grabber.stop()
+        self.assertTrue(running)
+        self.assertEqual(frame.shape, (416, 416, 3))
+        self.assertEqual(eye_instance.get_capture_config(), old_config)
+        self.assertIs(eye_instance.cap, eye_instance.frame_grabber.cap)
+
+    def test_warm_up(self):
+        """ Testing that the eye waits for the backend, retries failing warm-up predictions and reports ready"""
+        with tempfile.TemporaryDirectory() as folder, mock.patch.object(eye.vision, "publish_mjpeg_stream", False):
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye(cap=ImageFolderSource(folder))
+        eye_instance.initODModel(None, None, None, None, None, backend="fake")
+        self.assertFalse(eye_instance.get_readiness()["ready"])
+        detector = eye_instance.detector_model
+        with mock.patch.object(detector, "is_ready", side_effect=[False, False, True]), \
+                mock.patch.object(detector, "predict", side_effect=[ConnectionError(), [], [], []]):
+            report = eye_instance.warm_up(num_predictions=3, timeout=5, poll_interval=0.01)
+        eye_instance.frame_grabber.stop()
+        self.assertTrue(report["ready"])
+        self.assertEqual(len(report["warmup_latencies"]), 3)
+        self.assertEqual(report["num_failed"], 1)
+        self.assertGreater(report["probe_time"], 0)
+        self.assertEqual(eye_instance.get_readiness(), report)
+
+    def test_roi_miss_falls_back_on_same_frame(self):
+        """ Testing that a miss in the ROI is followed by a full-frame inference of the same frame"""
+        with tempfile.TemporaryDirectory() as folder, mock.patch.object(eye.vision, "publish_mjpeg_stream", False):
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye(cap=ImageFolderSource(folder))
+        eye_instance.initODModel(None, None, None, None, None, backend="fake")
+        eye_instance.roi_inference = True
+        detector = eye_instance.detector_model
+        predict = detector.predict
+        input_shapes = []
+
+        def predict_missing_in_roi(img, confidence=40):
+            input_shapes.append(img.shape[:2])
+            preds = predict(img, confidence=confidence)
+            return [] if img.shape[:2] == (256, 256) else preds
+
+        try:
+            self.assertEqual(len(eye_instance.inference(confidence=40, img_width=416, img_height=416)), 1)
+            with mock.patch.object(detector, "predict", side_effect=predict_missing_in_roi):
+                preds = eye_instance.inference(confidence=40, img_width=416, img_height=416)
+        finally:
+            eye_instance.frame_grabber.stop()
+        self.assertEqual(input_shapes, [(256, 256), (416, 416)])
+        self.assertEqual(len(preds), 1)
+        self.assertAlmostEqual(preds[0]["x"], 208)
+        self.assertEqual(eye_instance.get_roi_stats()["num_misses"], 1)
+        self.assertTrue(eye_instance.roi_tracker.is_tracking())
+
+    def test_motion_gate_is_keyed_on_inference_size(self):
+        """ Testing that cached predictions are reused for the same inference size only"""
+        with tempfile.TemporaryDirectory() as folder, mock.patch.object(eye.vision, "publish_mjpeg_stream", False):
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye(cap=ImageFolderSource(folder))
+        eye_instance.initODModel(None, None, None, None, None, backend="fake")
+        eye_instance.motion_gating = True
+        try:
+            eye_instance.inference(confidence=40, img_width=416, img_height=416)
+            reused = eye_instance.inference(confidence=40, img_width=416, img_height=416)
+            resized = eye_instance.inference(confidence=40, img_width=208, img_height=208)
+        finally:
+            eye_instance.frame_grabber.stop()
+        self.assertTrue(reused[0]["reused"])
+        self.assertFalse(resized[0]["reused"])
+        self.assertAlmostEqual(resized[0]["x"], 104)
+        self.assertEqual(eye_instance.detector_model.num_predictions, 2)
+
+    def test_stream_messages_never_go_back_in_time(self):
+        """ Testing that a detection finishing after positions were tracked on newer frames is not pushed"""
+        with tempfile.TemporaryDirectory() as folder, mock.patch.object(eye.vision, "publish_mjpeg_stream", False):
+            cv2.imwrite(os.path.join(folder, "frame.png"), np.zeros((416, 416, 3), dtype=np.uint8))
+            eye_instance = eye.CoBeEye(cap=ImageFolderSource(folder))
+        eye_instance.frame_grabber.stop()
+        pred = {"class": "stick", "x": 10., "y": 20., "width": 5., "height": 5., "confidence": 0.9}
+        # detection of frame 1, positions tracked on frames 2 and 3 while frame 4 is inferred, then detection of
+        # frame 4 and tracked positions of frame 4 and 5
+        pushes = [(1, False), (2, True), (3, True), (1, False), (4, False), (4, True), (5, True)]
+        messages = [eye_instance.detection_message("eye_0", frame_id, frame_id * 1000, [pred], tracked=tracked)
+                    for frame_id, tracked in pushes]
+        self.assertEqual([message is None for message in messages], [False, False, False, True, False, True, False])
+        pushed = [message for message in messages if message is not None]
+        self.assertEqual([message["seq"] for message in pushed], [1, 2, 3, 4, 5])
+        self.assertEqual([message["frame_id"] for message in pushed], [1, 2, 3, 4, 5])
+        self.assertEqual([message["tracked"] for message in pushed], [False, True, True, False, True])
+        self.assertEqual(eye_instance.get_metrics()["counters"]["stream_messages_dropped"], 2)
 
     ### Template to test private method of CoBeEye class
     # def test_eye_return_secret_id(self):
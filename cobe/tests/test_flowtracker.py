@@ -0,0 +1,37 @@
+"""
+    Testing the flowtracker module of cobe.vision
+    ==============================================
+"""
+import unittest
+import numpy as np
+from cobe.vision.flowtracker import FlowTracker
+
+
+def textured_frame(x_offset, size=200):
+    """Returns a grayscale frame with a textured 40x40 patch at x_offset on a flat background"""
+    rng = np.random.default_rng(0)
+    frame = np.full((size, size), 100, dtype=np.uint8)
+    frame[80:120, x_offset:x_offset + 40] = rng.integers(0, 255, (40, 40), dtype=np.uint8)
+    return frame
+
+
+class TestFlowTracker(unittest.TestCase):
+    """ Testing the FlowTracker class of cobe.vision.flowtracker """
+
+    def test_tracks_moving_box_between_detections(self):
+        """ Testing that a seeded box follows the moving patch, also through frames added before seeding"""
+        tracker = FlowTracker(max_age=10)
+        t_cap = 10 ** 9
+        tracker.add_frame(textured_frame(50), t_cap)
+        # the next two frames are captured while the detection of the first one is running
+        tracker.add_frame(textured_frame(53), t_cap + 50_000_000)
+        tracker.add_frame(textured_frame(56), t_cap + 100_000_000)
+        tracker.seed([{"class": "stick", "x": 70., "y": 100., "width": 40., "height": 40., "confidence": 0.9}], t_cap)
+        tracked = tracker.add_frame(textured_frame(59), t_cap + 150_000_000)
+        self.assertEqual(len(tracked), 1)
+        self.assertAlmostEqual(tracked[0]["x"], 79., delta=0.5)
+        self.assertAlmostEqual(tracked[0]["y"], 100., delta=0.5)
+        # other classes are not tracked
+        tracker.seed([{"class": "fish", "x": 79., "y": 100., "width": 40., "height": 40., "confidence": 0.9}],
+                     t_cap + 150_000_000)
+        self.assertIsNone(tracker.add_frame(textured_frame(62), t_cap + 200_000_000))
@@ -0,0 +1,22 @@
+"""
+    Testing the framebuffers module of cobe.vision
+    ===============================================
+"""
+import unittest
+import numpy as np
+from cobe.vision.framebuffers import FrameBuffers, resize_frame
+
+
+class TestFrameBuffers(unittest.TestCase):
+    """ Testing the allocation-free frame helpers of cobe.vision.framebuffers """
+
+    def test_resize_reuses_buffers(self):
+        """ Testing that matching sizes are not resized and resize buffers are reused per size"""
+        frame = np.ones((8, 16, 3), dtype=np.uint8)
+        self.assertIs(resize_frame(frame, (16, 8)), frame)
+        buffers = FrameBuffers()
+        first = buffers.resize(frame, (32, 16))
+        second = buffers.resize(frame * 2, (32, 16))
+        self.assertIs(first, second)
+        self.assertEqual(second.shape, (16, 32, 3))
+        self.assertEqual(int(second[0, 0, 0]), 2)
@@ -0,0 +1,64 @@
+"""
+    Testing the inferenceclient module of cobe.vision
+    ==================================================
+"""
+import base64
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+from cobe.vision.inferenceclient import InferenceClient, PREDICTION_FIELDS
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Mimicking the roboflow inference server by returning a box at the center of the posted image"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        img = cv2.imdecode(np.frombuffer(base64.b64decode(body), dtype=np.uint8), cv2.IMREAD_COLOR)
+        StandInHandler.requests.append((self.path, self.client_address))
+        response = json.dumps({"predictions": [{"x": img.shape[1] / 2, "y": img.shape[0] / 2, "width": 10,
+                                                "height": 12, "confidence": 0.8, "class": "stick",
+                                                "class_id": 0, "detection_id": "abc"}],
+                               "image": {"width": img.shape[1], "height": img.shape[0]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestInferenceClient(unittest.TestCase):
+    """ Testing the InferenceClient class of cobe.vision.inferenceclient """
+
+    def test_predict_on_stand_in_server(self):
+        """ Testing that predictions are parsed and consecutive requests reuse the same connection"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = InferenceClient(f"http://127.0.0.1:{server.server_address[1]}/", "/cobe", "1", "key")
+            img = np.zeros((120, 160, 3), dtype=np.uint8)
+            for _ in range(3):
+                preds = client.predict(img, confidence=35)
+            self.assertEqual(preds, [{"class": "stick", "x": 80, "y": 60, "width": 10, "height": 12,
+                                      "confidence": 0.8}])
+            self.assertEqual(set(preds[0].keys()), set(PREDICTION_FIELDS))
+            self.assertEqual(client.num_connections, 1)
+            path, _ = StandInHandler.requests[-1]
+            self.assertTrue(path.startswith("/cobe/1?api_key=key"))
+            self.assertIn("confidence=35", path)
+            self.assertEqual(len({address for _, address in StandInHandler.requests}), 1)
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,29 @@
+"""
+    Testing the metrics module of cobe.tools
+    =========================================
+"""
+import unittest
+from cobe.tools.metrics import Metrics, format_metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """ Testing the Metrics class of cobe.tools.metrics """
+
+    def test_percentiles_of_latest_samples(self):
+        """ Testing that percentiles are calculated on the latest samples only and formatted as text"""
+        metrics = Metrics(num_samples=100)
+        for _ in range(100):
+            metrics.observe("inference", 10.)
+        for i in range(100):
+            metrics.observe("inference", i / 1000)
+        metrics.count("inferences", 3)
+        metrics.set_gauge("stream_clients", 2)
+        snapshot = metrics.snapshot()
+        summary = snapshot["stages"]["inference"]
+        self.assertEqual(summary["count"], 200)
+        self.assertAlmostEqual(summary["p50"], 0.0495)
+        self.assertLess(summary["p99"], 0.1)
+        text = format_metrics(snapshot)
+        self.assertIn('cobe_stage_seconds{stage="inference",quantile="0.95"}', text)
+        self.assertIn("cobe_inferences_total 3", text)
+        self.assertIn("cobe_stream_clients 2", text)
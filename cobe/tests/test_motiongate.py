@@ -0,0 +1,58 @@
+"""
+    Testing the motiongate module of cobe.vision
+    =============================================
+"""
+import unittest
+
+import numpy as np
+
+from cobe.vision.motiongate import MotionGate
+
+MS = 1000000  # ns
+
+
+class TestMotionGate(unittest.TestCase):
+    """ Testing the MotionGate class of cobe.vision.motiongate """
+
+    def setUp(self):
+        self.gate = MotionGate(threshold=2.0, max_reuse_age=1.0, thumbnail_size=32)
+        self.frame = np.full((240, 320, 3), 100, dtype=np.uint8)
+        self.preds = [{"x": 10, "y": 20, "width": 5, "height": 5, "confidence": 0.9, "class": "stick"}]
+        self.key = (416, 416, 0)
+        thumbnail, cached = self.gate.check(self.frame, 0, key=self.key)
+        self.assertIsNone(cached)
+        self.gate.update(thumbnail, self.preds, 0, key=self.key)
+
+    def test_reuse_below_threshold(self):
+        """ Testing that predictions are reused for a frame differing less than the threshold"""
+        _, cached = self.gate.check(self.frame + 1, 100 * MS, key=self.key)
+        self.assertIs(cached, self.preds)
+        self.assertAlmostEqual(self.gate.last_diff, 1.0)
+        self.assertEqual((self.gate.num_hits, self.gate.num_misses), (1, 1))
+
+    def test_miss_above_threshold(self):
+        """ Testing that a frame differing more than the threshold is inferred"""
+        _, cached = self.gate.check(self.frame + 5, 100 * MS, key=self.key)
+        self.assertIsNone(cached)
+        self.assertAlmostEqual(self.gate.last_diff, 5.0)
+        self.assertEqual((self.gate.num_hits, self.gate.num_misses), (0, 2))
+
+    def test_expiry_at_max_reuse_age(self):
+        """ Testing that predictions are not reused after max_reuse_age"""
+        self.assertIsNotNone(self.gate.check(self.frame, 1000 * MS, key=self.key)[1])
+        self.assertIsNone(self.gate.check(self.frame, 1001 * MS, key=self.key)[1])
+
+    def test_key_change(self):
+        """ Testing that predictions are not reused for another inference size or sensor"""
+        self.assertIsNone(self.gate.check(self.frame, 100 * MS, key=(208, 208, 0))[1])
+        self.assertIsNone(self.gate.check(self.frame, 100 * MS, key=(416, 416, 1))[1])
+        self.assertIsNotNone(self.gate.check(self.frame, 100 * MS, key=self.key)[1])
+
+    def test_reset(self):
+        """ Testing that the next frame is inferred after a reset"""
+        self.gate.reset()
+        self.assertIsNone(self.gate.check(self.frame, 100 * MS, key=self.key)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
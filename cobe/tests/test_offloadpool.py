@@ -0,0 +1,71 @@
+"""
+    Testing the offloadpool module of cobe.cobe
+    ============================================
+"""
+import time
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from cobe.cobe.offloadpool import OffloadPool, InferenceRouter, ROUTE_EYE, ROUTE_POOL
+from cobe.vision.detectors import FakeDetector
+
+
+class SlowEye(object):
+    """Stand-in for the Pyro proxy of an eye with slow local inference"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.detector = FakeDetector()
+        self.img = np.zeros((208, 208, 3), dtype=np.uint8)
+
+    def inference(self, confidence=40, img_width=416, img_height=416, req_ts=None):
+        time.sleep(self.latency)
+        return [dict(pred, capture_ts=1, request_ts=req_ts, reused=False, tracked=False, sensor_id=0)
+                for pred in self.detector.predict(self.img, confidence)]
+
+    def get_encoded_frame(self, img_width=416, img_height=416, quality=80, sensor_id=None):
+        return {"jpeg": cv2.imencode(".jpg", self.img)[1].tobytes(), "frame_id": 1, "capture_ts": 1, "sensor_id": 0}
+
+
+class TestOffloadPool(unittest.TestCase):
+    """ Testing the master-side worker pool and the routing of inference requests """
+
+    def test_router_offloads_slow_eye(self):
+        """ Testing that requests of a slow eye move to the pool, which returns the predictions of the eye"""
+        pool = OffloadPool(num_workers=2, detector_factory=FakeDetector)
+        pool.start()
+        router = InferenceRouter(pool, probe_every=3)
+        eye_dict = {"pyro_proxy": SlowEye(latency=0.05)}
+        try:
+            for _ in range(10):
+                router.infer("eye_0", eye_dict, req_ts=7)
+            offloaded = router.infer_on_pool(eye_dict, 40, 416, 416, req_ts=7)
+        finally:
+            pool.stop()
+        self.assertEqual(router.choose("eye_0"), ROUTE_POOL)
+        self.assertGreater(router.num_routed[("eye_0", ROUTE_POOL)], router.num_routed[("eye_0", ROUTE_EYE)])
+        self.assertEqual(offloaded, eye_dict["pyro_proxy"].inference(req_ts=7))
+
+    def test_failing_detector_factory(self):
+        """ Testing that an error creating a detector is raised by start and no worker is left running"""
+        detectors = []
+
+        def factory():
+            if len(detectors) == 1:
+                raise FileNotFoundError("models/cobe.onnx")
+            detectors.append(FakeDetector())
+            return detectors[-1]
+
+        pool = OffloadPool(num_workers=2, detector_factory=factory)
+        with mock.patch.object(FakeDetector, "close") as close:
+            with self.assertRaises(FileNotFoundError):
+                pool.start()
+        close.assert_called_once()
+        self.assertEqual(pool._workers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
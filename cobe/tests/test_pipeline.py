@@ -0,0 +1,106 @@
+"""
+    Testing the pipeline module of cobe.vision
+    ===========================================
+"""
+import threading
+import time
+import unittest
+
+from cobe.vision.pipeline import InferencePipeline
+
+
+class ManualFrameGrabber(object):
+    """Latest-wins frame slot like FrameGrabber to which the test publishes frames one by one"""
+
+    def __init__(self):
+        self._new_frame = threading.Condition()
+        self._frame_id = 0
+
+    def publish(self):
+        with self._new_frame:
+            self._frame_id += 1
+            self._new_frame.notify_all()
+
+    def wait_for_frame(self, after_id=0, timeout=None):
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._frame_id > after_id, timeout=timeout)
+            if self._frame_id <= after_id:
+                return None, after_id, None
+            # the frame is its own id, the capture time a fake timestamp in ns
+            return self._frame_id, self._frame_id, self._frame_id * 1000
+
+
+def wait_until(predicate, timeout=2.):
+    """Polls predicate until it is true, returns whether it became true within timeout seconds"""
+    t_end = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > t_end:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class TestInferencePipeline(unittest.TestCase):
+    """ Testing the InferencePipeline class of cobe.vision.pipeline """
+
+    def setUp(self):
+        self.frame_grabber = ManualFrameGrabber()
+        self.detected = []
+        self.detecting = threading.Event()
+        self.release = threading.Event()
+        self.pipeline = InferencePipeline(self.frame_grabber, preprocess=lambda frame, t_cap: frame,
+                                          detect=self.detect, queue_depth=1)
+        self.pipeline.start()
+
+    def tearDown(self):
+        self.release.set()
+        self.pipeline.stop()
+
+    def detect(self, img, t_cap):
+        self.detecting.set()
+        self.release.wait(timeout=2)
+        self.detected.append(img)
+        return [{"frame": img, "t_cap": t_cap}]
+
+    def test_full_queue_drops_oldest(self):
+        """ Testing that frames waiting for a busy inference stage are replaced by newer ones"""
+        self.frame_grabber.publish()
+        self.assertTrue(self.detecting.wait(timeout=2))
+        # frame 2 waits in the queue, frames 3 and 4 replace the one waiting before them
+        self.frame_grabber.publish()
+        self.assertTrue(wait_until(lambda: self.pipeline._frame_queue.qsize() == 1))
+        for num_dropped in (1, 2):
+            self.frame_grabber.publish()
+            self.assertTrue(wait_until(lambda: self.pipeline.num_dropped == num_dropped))
+        self.release.set()
+        self.assertTrue(wait_until(lambda: len(self.detected) == 2))
+        self.assertEqual(self.detected, [1, 4])
+        self.assertEqual(self.pipeline.num_dropped, 2)
+
+    def test_results_in_order(self):
+        """ Testing that results are returned in the order of their frames and only once per after_id"""
+        self.release.set()
+        results = []
+        for _ in range(3):
+            self.frame_grabber.publish()
+            after_id = results[-1]["result_id"] if results else 0
+            results.append(self.pipeline.get_result(after_id=after_id, timeout=2))
+        self.assertEqual([result["result_id"] for result in results], [1, 2, 3])
+        self.assertEqual([result["frame_id"] for result in results], [1, 2, 3])
+        self.assertEqual([result["predictions"][0]["t_cap"] for result in results], [1000, 2000, 3000])
+        self.assertGreaterEqual(results[-1]["staleness"], results[-1]["age"])
+        self.assertIsNone(self.pipeline.get_result(after_id=3, timeout=0.05))
+
+    def test_stop_joins_threads(self):
+        """ Testing that stop returns promptly with both worker threads finished"""
+        threads = list(self.pipeline._threads)
+        self.assertTrue(self.pipeline.is_running())
+        t_start = time.monotonic()
+        self.pipeline.stop()
+        self.assertLess(time.monotonic() - t_start, 1.5)
+        self.assertFalse(self.pipeline.is_running())
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""
+    Testing the publisher module of cobe.vision
+    ============================================
+"""
+import time
+import unittest
+import numpy as np
+from cobe.vision.publisher import AnnotationPublisher
+
+
+class FakeServer(object):
+    """Mimicking the stream broadcaster of web_vision.StreamingServer"""
+    frame = None
+
+    def __init__(self):
+        self.stream = self
+
+    def publish(self, img):
+        self.frame = img
+
+
+class TestAnnotationPublisher(unittest.TestCase):
+    """ Testing the AnnotationPublisher class of cobe.vision.publisher """
+
+    def test_publishes_annotated_copy(self):
+        """ Testing that the published frame is annotated while the handed over frame stays untouched"""
+        server = FakeServer()
+        publisher = AnnotationPublisher(server)
+        publisher.start()
+        img = np.zeros((100, 100, 3), dtype=np.uint8)
+        publisher.submit(img, [{"x": 50, "y": 50, "width": 20, "height": 20, "confidence": 0.9, "class": "stick"}])
+        t_start = time.monotonic()
+        while server.frame is None and time.monotonic() - t_start < 1:
+            time.sleep(0.01)
+        publisher.stop()
+        self.assertIsNotNone(server.frame)
+        self.assertGreater(server.frame.sum(), 0)
+        self.assertEqual(img.sum(), 0)
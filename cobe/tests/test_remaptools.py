@@ -0,0 +1,32 @@
+"""
+    Testing the remaptools module of cobe.tools
+    ============================================
+"""
+import unittest
+import numpy as np
+import serpent
+from cobe.tools.remaptools import build_remap_lut, RemapLUT, scale_to_simulation_space
+
+
+class TestRemapLUT(unittest.TestCase):
+    """ Testing the remap table sent from the master to the eyes """
+
+    def test_lut_matches_master_remapping(self):
+        """ Testing that the remap table gives the same simulation coordinates as remapping on the master"""
+        rng = np.random.default_rng(0)
+        xs = np.linspace(-30, 450, 60)
+        ys = np.linspace(-20, 440, 60)
+        eye_dict = {"cmap_xmap_extrap": rng.uniform(0, 4000, (60, 60)),
+                    "cmap_ymap_extrap": rng.uniform(0, 4000, (60, 60)),
+                    "cmap_x_extrap": xs,
+                    "cmap_y_extrap": ys}
+        # sending the table through the same serializer as Pyro does
+        lut = RemapLUT.from_message(serpent.loads(serpent.dumps(build_remap_lut(eye_dict))))
+        for xcam, ycam in [(10.3, 20.7), (200, 300), (415, 0)]:
+            # remapping as in CoBeMaster.remap_detection_point and CoBeMaster.start
+            x_index = np.abs(xs - xcam).argmin()
+            y_index = np.abs(ys - ycam).argmin()
+            xreal = eye_dict["cmap_ymap_extrap"][y_index, x_index]
+            yreal = eye_dict["cmap_xmap_extrap"][y_index, x_index]
+            expected = scale_to_simulation_space(xreal, yreal)
+            np.testing.assert_allclose(lut.remap(xcam, ycam), expected, rtol=1e-5)
@@ -0,0 +1,43 @@
+"""
+    Testing the resolutioncontroller module of cobe.cobe
+    =====================================================
+"""
+import unittest
+
+from cobe.cobe.resolutioncontroller import ResolutionController
+
+
+class TestResolutionController(unittest.TestCase):
+    """ Testing the adaptation of the inference size to the latency budget """
+
+    def test_switches(self):
+        """ Testing stepping down over budget, up with headroom and up on lost detections"""
+        controller = ResolutionController(ladder=(320, 416, 512, 640), latency_budgets={"slow": 0.1, "lossy": 0.16},
+                                          default_budget=0.2, min_samples=3, loss_patience=3)
+        self.assertEqual(controller.size("slow"), 416)
+        # an overloaded eye steps down until it is within budget
+        for _ in range(3):
+            controller.update("slow", 0.15, 1)
+        self.assertEqual(controller.size("slow"), 320)
+        self.assertIn("over budget", controller.switches[-1][3])
+        for _ in range(10):
+            controller.update("slow", 0.09, 1)
+        self.assertEqual(controller.size("slow"), 320)
+
+        # an idle eye steps up while the larger size is expected to stay well within budget
+        for _ in range(20):
+            controller.update("idle", 0.02, 1)
+        self.assertEqual(controller.size("idle"), 640)
+
+        # lost detections step up as long as the expected round trip is within budget
+        for latency, num_detections in [(0.09, 1)] * 3:
+            controller.update("lossy", latency, num_detections)
+        self.assertEqual(controller.size("lossy"), 416)
+        for latency, num_detections in [(0.09, 0)] * 3:
+            controller.update("lossy", latency, num_detections)
+        self.assertEqual(controller.size("lossy"), 512)
+        self.assertIn("detections lost", controller.switches[-1][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+    Testing the roi module of cobe.vision
+    ======================================
+"""
+import unittest
+
+from cobe.vision.roi import ROITracker, ROIWindow
+
+MS = 1000000  # ns
+
+
+class TestROIWindow(unittest.TestCase):
+    """ Testing the ROIWindow class of cobe.vision.roi """
+
+    def test_mapping_round_trip(self):
+        """ Testing that predictions on the crop are mapped to the full inference frame and back"""
+        # 400x200 window of a 1280x720 frame resized to 256x256, full frame inferred at 416x416
+        window = ROIWindow(640, 300, 1040, 500, (256, 256), (1280, 720), (416, 416))
+        pred = {"x": 128, "y": 128, "width": 64, "height": 32, "class": "stick", "confidence": 0.9}
+        mapped = window.to_frame(dict(pred))
+        # center of the crop is the center of the window in the frame
+        self.assertAlmostEqual(mapped["x"], 840 * 416 / 1280)
+        self.assertAlmostEqual(mapped["y"], 400 * 416 / 720)
+        self.assertAlmostEqual(mapped["width"], 64 * 400 / 256 * 416 / 1280)
+        self.assertAlmostEqual(mapped["height"], 32 * 200 / 256 * 416 / 720)
+        back = window.to_crop(mapped)
+        for key in ("x", "y", "width", "height"):
+            self.assertAlmostEqual(back[key], pred[key])
+        self.assertEqual(back["class"], "stick")
+
+    def test_window_origin(self):
+        """ Testing that the corners of the crop are mapped to the corners of the window"""
+        window = ROIWindow(100, 50, 300, 250, (200, 200), (400, 400), (400, 400))
+        top_left = window.to_frame({"x": 0, "y": 0, "width": 0, "height": 0})
+        bottom_right = window.to_frame({"x": 200, "y": 200, "width": 0, "height": 0})
+        self.assertEqual((top_left["x"], top_left["y"]), (100, 50))
+        self.assertEqual((bottom_right["x"], bottom_right["y"]), (300, 250))
+
+
+class TestROITracker(unittest.TestCase):
+    """ Testing the ROITracker class of cobe.vision.roi """
+
+    def setUp(self):
+        self.tracker = ROITracker(roi_size=0.5, input_size=(128, 128), min_confidence=0.5, max_age=0.5,
+                                  full_frame_every=3)
+        self.frame_size = (400, 400)
+        self.out_size = (200, 200)
+
+    def target(self, x, y, confidence=0.9, class_name="stick"):
+        return {"x": x, "y": y, "width": 10, "height": 10, "confidence": confidence, "class": class_name}
+
+    def test_window_around_target(self):
+        """ Testing that a confident detection starts ROI inference centered on it"""
+        self.assertIsNone(self.tracker.next_window(self.frame_size, self.out_size, 0))
+        self.tracker.update([self.target(100, 100)], self.out_size, 0)
+        window = self.tracker.next_window(self.frame_size, self.out_size, 10 * MS)
+        self.assertEqual((window.x0, window.y0, window.x1, window.y1), (100, 100, 300, 300))
+        self.assertEqual(self.tracker.get_stats(), {"num_roi": 1, "num_full": 1, "num_misses": 0})
+
+    def test_weak_or_other_detections_are_ignored(self):
+        """ Testing that weak detections and other classes do not start ROI inference"""
+        self.tracker.update([self.target(100, 100, confidence=0.3), self.target(100, 100, class_name="ball")],
+                            self.out_size, 0)
+        self.assertFalse(self.tracker.is_tracking())
+        self.assertIsNone(self.tracker.next_window(self.frame_size, self.out_size, 10 * MS))
+
+    def test_reset_on_miss(self):
+        """ Testing that a miss in the ROI is counted and the next frame is searched as a whole"""
+        self.tracker.update([self.target(100, 100)], self.out_size, 0)
+        window = self.tracker.next_window(self.frame_size, self.out_size, 10 * MS)
+        self.tracker.update([], self.out_size, 10 * MS, window=window)
+        self.assertFalse(self.tracker.is_tracking())
+        self.assertIsNone(self.tracker.next_window(self.frame_size, self.out_size, 20 * MS))
+        self.assertEqual(self.tracker.get_stats(), {"num_roi": 1, "num_full": 1, "num_misses": 1})
+
+    def test_full_frame_fallbacks(self):
+        """ Testing that old detections and every N-th frame fall back to a full-frame search"""
+        self.tracker.update([self.target(100, 100)], self.out_size, 0)
+        self.assertIsNone(self.tracker.next_window(self.frame_size, self.out_size, 600 * MS))
+        self.tracker.update([self.target(100, 100)], self.out_size, 600 * MS)
+        windows = [self.tracker.next_window(self.frame_size, self.out_size, (600 + i) * MS) for i in range(1, 5)]
+        self.assertEqual([window is None for window in windows], [False, False, False, True])
+
+    def test_window_follows_velocity_and_stays_in_frame(self):
+        """ Testing that the window is moved to the predicted position and clipped to the frame"""
+        self.tracker.update([self.target(100, 100)], self.out_size, 0)
+        self.tracker.update([self.target(150, 100)], self.out_size, 100 * MS)
+        # moving 1.25 frame widths per second to the right, predicted beyond the border after 100 ms more
+        window = self.tracker.next_window(self.frame_size, self.out_size, 200 * MS)
+        self.assertEqual((window.x0, window.x1), (200, 400))
+        self.assertEqual((window.y0, window.y1), (100, 300))
+
+
+if __name__ == '__main__':
+    unittest.main()
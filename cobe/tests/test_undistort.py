@@ -0,0 +1,69 @@
+"""
+    Testing the undistort module of cobe.vision
+    ============================================
+"""
+import unittest
+
+import cv2
+import numpy as np
+from cobe.vision.undistort import FisheyeUndistorter
+
+
+def fisheye_maps(size):
+    """Returns fixed-point fisheye undistortion maps of a synthetic camera with the given size (w, h)"""
+    w, h = size
+    K = np.array([[w / 2, 0, w / 2], [0, w / 2, h / 2], [0, 0, 1]], dtype=np.float64)
+    D = np.array([0.1, -0.05, 0.01, 0], dtype=np.float64)
+    return cv2.fisheye.initUndistortRectifyMap(K, D, np.eye(3), K, size, cv2.CV_16SC2)
+
+
+def smooth_frame(size):
+    """Returns a smooth test frame, so that interpolation order barely changes pixel values"""
+    w, h = size
+    xs, ys = np.meshgrid(np.arange(w), np.arange(h))
+    img = np.stack([xs * 255 / w, ys * 255 / h, 127 + 100 * np.sin(xs / 40) * np.cos(ys / 30)], axis=-1)
+    return img.astype(np.uint8)
+
+
+class TestFisheyeUndistorter(unittest.TestCase):
+    """ Testing the FisheyeUndistorter class of cobe.vision.undistort """
+
+    def test_fused_remap_matches_two_steps(self):
+        """ Testing that the single fused remap matches undistorting and resizing in two steps"""
+        map1, map2 = fisheye_maps((640, 480))
+        undistorter = FisheyeUndistorter(map1, map2)
+        img = smooth_frame((640, 480))
+        expected = cv2.resize(cv2.remap(img, map1, map2, interpolation=cv2.INTER_LINEAR,
+                                        borderMode=cv2.BORDER_CONSTANT), (320, 240), interpolation=cv2.INTER_LINEAR)
+        fused = undistorter.undistort(img, (320, 240))
+        self.assertEqual(fused.shape, (240, 320, 3))
+        # comparing away from the border, where the black fill is blended differently
+        diff = np.abs(fused.astype(np.int16) - expected.astype(np.int16))[8:-8, 8:-8]
+        self.assertLess(np.mean(diff), 1)
+        self.assertLess(np.percentile(diff, 99), 4)
+
+        # frames already scaled by the pipeline are undistorted with the rescaled maps
+        scaled = undistorter.undistort(cv2.resize(img, (320, 240), interpolation=cv2.INTER_AREA), (320, 240))
+        diff = np.abs(scaled.astype(np.int16) - expected.astype(np.int16))[8:-8, 8:-8]
+        self.assertLess(np.mean(diff), 1.5)
+
+    def test_fused_maps_are_cached(self):
+        """ Testing that fused maps are built once per input and output size"""
+        undistorter = FisheyeUndistorter(*fisheye_maps((640, 480)))
+        maps = undistorter.get_maps((640, 480), (320, 240))
+        self.assertIs(undistorter.get_maps((640, 480), (320, 240)), maps)
+        self.assertIsNot(undistorter.get_maps((640, 480), (416, 416)), maps)
+        self.assertIsNot(undistorter.get_maps((320, 240), (320, 240)), maps)
+        self.assertEqual(len(undistorter._fused_maps), 3)
+
+    def test_calibrated_size_uses_maps_as_they_are(self):
+        """ Testing that frames of the calibrated and output size are remapped with the undistortion maps"""
+        map1, map2 = fisheye_maps((416, 416))
+        undistorter = FisheyeUndistorter(map1, map2)
+        fused_map1, fused_map2 = undistorter.get_maps((416, 416), (416, 416))
+        self.assertIs(fused_map1, map1)
+        self.assertIs(fused_map2, map2)
+
+
+if __name__ == '__main__':
+    unittest.main()
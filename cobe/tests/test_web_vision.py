@@ -0,0 +1,84 @@
+"""
+    Testing the web_vision module of cobe.vision
+    =============================================
+"""
+import threading
+import unittest
+import urllib.error
+
+import cv2
+import numpy as np
+from cobe.vision.web_vision import FrameBroadcaster, StreamingHandler, StreamingServer, fetch_snapshot, \
+    parse_stream_params
+
+
+class TestFrameBroadcaster(unittest.TestCase):
+    """ Testing the FrameBroadcaster class of cobe.vision.web_vision """
+
+    def test_encode_once_fan_out(self):
+        """ Testing that all waiting clients get the same bytes of a frame that is encoded only once"""
+        broadcaster = FrameBroadcaster(frame_size=(32, 16))
+        results = []
+
+        def client():
+            results.append(broadcaster.wait_for_frame(after_seq=0, timeout=2))
+
+        clients = [threading.Thread(target=client) for _ in range(3)]
+        for thread in clients:
+            thread.start()
+        broadcaster.publish(np.full((48, 64, 3), 200, dtype=np.uint8))
+        for thread in clients:
+            thread.join()
+        self.assertEqual(len({id(jpeg) for jpeg, _ in results}), 1)
+        self.assertEqual([seq for _, seq in results], [1, 1, 1])
+        self.assertEqual(broadcaster.num_encoded, 1)
+        img = cv2.imdecode(np.frombuffer(results[0][0], dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(img.shape, (16, 32, 3))
+
+        # without a new frame clients block until the timeout instead of resending the last one
+        self.assertEqual(broadcaster.wait_for_frame(after_seq=1, timeout=0.05), (None, 1))
+        # clients with another profile get their own encoding, clients sharing it the same bytes
+        broadcaster.publish(np.full((48, 64, 3), 100, dtype=np.uint8))
+        small, seq = broadcaster.wait_for_frame(after_seq=1, timeout=1, max_width=16, quality=50)
+        self.assertEqual(seq, 2)
+        self.assertIs(broadcaster.wait_for_frame(after_seq=1, timeout=1, max_width=16, quality=50)[0], small)
+        self.assertIsNot(broadcaster.wait_for_frame(after_seq=1, timeout=1)[0], small)
+        self.assertEqual(broadcaster.num_encoded, 3)
+        img = cv2.imdecode(np.frombuffer(small, dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(img.shape, (8, 16, 3))
+        broadcaster.close()
+        self.assertEqual(broadcaster.wait_for_frame(after_seq=2), (None, 2))
+
+    def test_parse_stream_params(self):
+        """ Testing the per-client stream parameters of the query string"""
+        self.assertEqual(parse_stream_params("fps=5&width=320&quality=60"), {"fps": 5, "width": 320, "quality": 60})
+        self.assertEqual(parse_stream_params(""), {"fps": None, "width": None, "quality": None})
+        for query in ("fps=0", "width=abc", "quality=101"):
+            with self.assertRaises(ValueError):
+                parse_stream_params(query)
+
+
+class TestSnapshots(unittest.TestCase):
+    """ Testing the one-shot snapshot endpoints of the streaming server """
+
+    def test_fetch_calibration_snapshot(self):
+        """ Testing that the latest calibration frame is returned losslessly as PNG and raw array"""
+        server = StreamingServer(("127.0.0.1", 0), StreamingHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        port = server.server_address[1]
+        try:
+            with self.assertRaises(urllib.error.HTTPError):
+                fetch_snapshot("127.0.0.1", port, "calibration")
+            frame = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+            server.calibration.publish(frame)
+            for fmt in ("png", "npy"):
+                np.testing.assert_array_equal(fetch_snapshot("127.0.0.1", port, "calibration", fmt=fmt), frame)
+            self.assertEqual(server.num_clients, 0)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
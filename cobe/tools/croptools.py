@@ -0,0 +1,82 @@
+"""Tools to derive the sensor crop of an eye from the footprint of the arena in its calibration frame.
+
+The CSI pipeline of an eye crops the sensor to (start_x, start_y, end_x, end_y) and resizes the crop to the frame
+size (display_width x display_height), optionally flipping it (nvvidconv flip-method). After calibration the master
+knows where the projected ArUco markers, i.e. the arena, appear in the frame. arena_crop returns the tightest sensor
+crop around them, and crop_calibration_axis converts the axes of the calibration maps to frames of the new crop, which
+is an affine transformation per axis."""
+import numpy as np
+
+# axes (x, y) mirrored by the nvvidconv flip methods that keep the orientation of the frame
+FLIPPED_AXES = {0: (False, False), 2: (True, True), 4: (True, False), 6: (False, True)}
+
+
+def flipped_axes(flip_method):
+    """Returns whether the x and y axes of the frame are mirrored with respect to the sensor"""
+    flip_method = int(flip_method)
+    if flip_method not in FLIPPED_AXES:
+        raise ValueError(f"Cropping is not supported with rotating flip method {flip_method}")
+    return FLIPPED_AXES[flip_method]
+
+
+def frame_to_sensor(values, start, end, size, flipped):
+    """Converts frame coordinates along one axis of size pixels to sensor coordinates of the crop (start, end)"""
+    scale = (end - start) / size
+    values = np.asarray(values, dtype=np.float64)
+    return end - values * scale if flipped else start + values * scale
+
+
+def sensor_to_frame(values, start, end, size, flipped):
+    """Converts sensor coordinates to frame coordinates along one axis of size pixels of the crop (start, end)"""
+    scale = size / (end - start)
+    values = np.asarray(values, dtype=np.float64)
+    return (end - values) * scale if flipped else (values - start) * scale
+
+
+def arena_points(eye_dict):
+    """Returns the frame points (N x 2) covered by the arena in the calibration of an eye: the corners of the detected
+    ArUco markers or, for calibrations loaded from file, the corners of the interpolated calibration maps"""
+    detected = eye_dict.get("detected_aruco")
+    if detected is not None and len(detected["corners"]) > 0:
+        return np.concatenate([np.asarray(corners, dtype=np.float64).reshape(-1, 2)
+                               for corners in detected["corners"]])
+    xs, ys = eye_dict["cmap_x_interp"], eye_dict["cmap_y_interp"]
+    return np.array([[np.min(xs), np.min(ys)], [np.max(xs), np.max(ys)]], dtype=np.float64)
+
+
+def arena_crop(points, crop, frame_size, capture_size, flip_method=0, margin=0.05):
+    """Returns the tightest sensor crop as dict (start_x, start_y, end_x, end_y) around the arena points given in
+    frame pixels of the current crop
+    :param crop: current crop as dict with start_x, start_y, end_x, end_y in sensor pixels
+    :param frame_size: (w, h) of the frames the crop is resized to
+    :param capture_size: (w, h) of the sensor, the crop is clipped to it
+    :param margin: fraction of the arena size added around the arena on each side
+    The crop is widened to the aspect ratio of the frame so that frames are not stretched, and rounded to even pixels
+    as required by nvvidconv."""
+    flip_x, flip_y = flipped_axes(flip_method)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    xs = frame_to_sensor(points[:, 0], crop["start_x"], crop["end_x"], frame_size[0], flip_x)
+    ys = frame_to_sensor(points[:, 1], crop["start_y"], crop["end_y"], frame_size[1], flip_y)
+    x0, x1, y0, y1 = np.min(xs), np.max(xs), np.min(ys), np.max(ys)
+    width, height = (x1 - x0) * (1 + 2 * margin), (y1 - y0) * (1 + 2 * margin)
+    # widening the shorter side to the aspect ratio of the frame
+    aspect = frame_size[0] / frame_size[1]
+    width, height = max(width, height * aspect), max(height, width / aspect)
+    width, height = min(width, capture_size[0]), min(height, capture_size[1])
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    start_x = int(np.clip(cx - width / 2, 0, capture_size[0] - width)) // 2 * 2
+    start_y = int(np.clip(cy - height / 2, 0, capture_size[1] - height)) // 2 * 2
+    end_x = min(start_x + int(np.ceil(width / 2)) * 2, int(capture_size[0]) // 2 * 2)
+    end_y = min(start_y + int(np.ceil(height / 2)) * 2, int(capture_size[1]) // 2 * 2)
+    return {"start_x": start_x, "start_y": start_y, "end_x": end_x, "end_y": end_y}
+
+
+def crop_calibration_axis(values, old_crop, new_crop, frame_size, flip_method=0, axis="x"):
+    """Converts frame coordinates along axis ("x" or "y") of the old crop to frame coordinates of the new crop, e.g.
+    the axes cmap_x_* / cmap_y_* of the calibration maps. The map values stay valid as they belong to the same sensor
+    points."""
+    index = 0 if axis == "x" else 1
+    flipped = flipped_axes(flip_method)[index]
+    start, end = f"start_{axis}", f"end_{axis}"
+    sensor = frame_to_sensor(values, old_crop[start], old_crop[end], frame_size[index], flipped)
+    return sensor_to_frame(sensor, new_crop[start], new_crop[end], frame_size[index], flipped)
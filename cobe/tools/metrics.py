@@ -0,0 +1,100 @@
+"""Tools to collect low-overhead latency metrics and counters of running processes (e.g. the eyes).
+
+Durations are kept in fixed-size ring buffers holding the latest samples of each stage. Recording a sample is a
+single array write, percentiles are only calculated when the metrics are read."""
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# percentiles reported for every stage
+PERCENTILES = (50, 95, 99)
+
+
+class RollingHistogram(object):
+    """Latest num_samples values of a measure with percentiles calculated on demand"""
+
+    def __init__(self, num_samples=1024):
+        self._values = np.zeros(int(num_samples))
+        self._num_added = 0
+
+    def add(self, value):
+        """Adds a new value, overwriting the oldest one if the buffer is full"""
+        self._values[self._num_added % len(self._values)] = value
+        self._num_added += 1
+
+    def summary(self):
+        """Returns the number of values added so far together with the mean and percentiles of the buffered ones"""
+        values = self._values[:min(self._num_added, len(self._values))]
+        if len(values) == 0:
+            return {"count": 0}
+        summary = {"count": self._num_added, "mean": float(np.mean(values))}
+        for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            summary[f"p{percentile}"] = float(value)
+        return summary
+
+
+class Metrics(object):
+    """Registry of per-stage durations (s), counters and gauges
+
+    :param num_samples: number of latest samples per stage the percentiles are calculated on"""
+
+    def __init__(self, num_samples=1024):
+        self.num_samples = int(num_samples)
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        """Records the duration of a stage"""
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, RollingHistogram(self.num_samples))
+        histogram.add(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Context manager recording the duration of the enclosed block as stage"""
+        t_start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter_ns() - t_start) / 1e9)
+
+    def count(self, counter, num=1):
+        """Increases a counter"""
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + num
+
+    def set_gauge(self, gauge, value):
+        """Sets a value reported as is, e.g. a number of connected clients"""
+        self._gauges[gauge] = value
+
+    def snapshot(self):
+        """Returns the stage summaries (s), counters and gauges as a dict"""
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+        return {"stages": {stage: histogram.summary() for stage, histogram in stages.items()},
+                "counters": counters,
+                "gauges": dict(self._gauges)}
+
+
+def format_metrics(snapshot, prefix="cobe"):
+    """Formats a metrics snapshot as plain text with one 'name{labels} value' line per measure"""
+    lines = []
+    for stage, summary in sorted(snapshot["stages"].items()):
+        lines.append(f'{prefix}_stage_count{{stage="{stage}"}} {summary["count"]}')
+        for key, value in summary.items():
+            if key.startswith("p"):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="0.{key[1:]}"}} {value:.6f}')
+            elif key == "mean":
+                lines.append(f'{prefix}_stage_seconds_mean{{stage="{stage}"}} {value:.6f}')
+    for counter, value in sorted(snapshot["counters"].items()):
+        lines.append(f"{prefix}_{counter}_total {value}")
+    for gauge, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"{prefix}_{gauge} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,77 @@
+"""Tools to remap detections from camera space to simulation space according to the calibration maps of the eyes"""
+import numpy as np
+import serpent
+
+from cobe.settings import aruco, vision
+from cobe.settings.pmodulesettings import max_abs_coord
+
+
+def scale_to_simulation_space(xreal, yreal):
+    """Scaling down coordinates from the original calibration image size to the simulation space and matching
+    directions of the simulation"""
+    extrapolation_percentage = (vision.interp_map_res + 2 * vision.extrap_skirt) / vision.interp_map_res
+    theoretical_extrap_space_size = (2 * max_abs_coord) * extrapolation_percentage
+    centering_const = theoretical_extrap_space_size / 2
+    xreal, yreal = xreal * (theoretical_extrap_space_size / aruco.proj_calib_image_width) - centering_const, \
+                   yreal * (theoretical_extrap_space_size / aruco.proj_calib_image_height) - centering_const
+    # matching directions in simulation space
+    return yreal, -xreal
+
+
+def build_remap_lut(eye_dict):
+    """Building a compact remap table of an eye from its extrapolated calibration maps (cmap_*_extrap) that maps
+    camera pixels directly to simulation space. The table can be sent to the eye via Pyro and loaded with
+    RemapLUT.from_message. Points that the master would drop as (0, 0) remappings are marked as NaN."""
+    xmap = np.asarray(eye_dict["cmap_xmap_extrap"], dtype=np.float64)
+    ymap = np.asarray(eye_dict["cmap_ymap_extrap"], dtype=np.float64)
+    xs = np.asarray(eye_dict["cmap_x_extrap"], dtype=np.float64)
+    ys = np.asarray(eye_dict["cmap_y_extrap"], dtype=np.float64)
+    # the master switches coordinates after looking up the calibration maps (see CoBeMaster.remap_detection_point)
+    xsim, ysim = scale_to_simulation_space(ymap, xmap)
+    invalid = (xmap == 0) & (ymap == 0)
+    xsim[invalid] = np.nan
+    ysim[invalid] = np.nan
+    return {"x0": float(xs[0]),
+            "dx": float(xs[1] - xs[0]),
+            "y0": float(ys[0]),
+            "dy": float(ys[1] - ys[0]),
+            "shape": list(xsim.shape),
+            # size of the calibration frames the camera coordinates of the maps belong to
+            "frame_size": [int(vision.display_width), int(vision.display_height)],
+            "xsim": xsim.astype(np.float32).tobytes(),
+            "ysim": ysim.astype(np.float32).tobytes()}
+
+
+class RemapLUT(object):
+    """Remap table on the eye converting camera pixel coordinates of detections to simulation space with a
+    nearest-neighbour lookup on the (uniform) grid of the calibration maps"""
+
+    def __init__(self, x0, dx, y0, dy, xsim, ysim, frame_size=None):
+        self.x0, self.dx = x0, dx
+        self.y0, self.dy = y0, dy
+        self.xsim = xsim
+        self.ysim = ysim
+        self.frame_size = tuple(frame_size) if frame_size is not None else None
+
+    @classmethod
+    def from_message(cls, message):
+        """Creates the table from the output of build_remap_lut after it has been sent through Pyro
+        (serpent serializes bytes as base64 dicts)"""
+        shape = tuple(message["shape"])
+        xsim = np.frombuffer(serpent.tobytes(message["xsim"]), dtype=np.float32).reshape(shape)
+        ysim = np.frombuffer(serpent.tobytes(message["ysim"]), dtype=np.float32).reshape(shape)
+        return cls(message["x0"], message["dx"], message["y0"], message["dy"], xsim, ysim,
+                   frame_size=message.get("frame_size"))
+
+    def remap(self, xcam, ycam, frame_size=None):
+        """Returns the simulation space coordinates of a camera point or (None, None) if the point has no valid
+        remapping
+        :param frame_size: (w, h) of the frame the point belongs to if it differs from the calibration frames"""
+        if frame_size is not None and self.frame_size is not None:
+            xcam, ycam = xcam * self.frame_size[0] / frame_size[0], ycam * self.frame_size[1] / frame_size[1]
+        x_index = min(max(int(round((xcam - self.x0) / self.dx)), 0), self.xsim.shape[1] - 1)
+        y_index = min(max(int(round((ycam - self.y0) / self.dy)), 0), self.xsim.shape[0] - 1)
+        xsim, ysim = self.xsim[y_index, x_index], self.ysim[y_index, x_index]
+        if np.isnan(xsim) or np.isnan(ysim):
+            return None, None
+        return float(xsim), float(ysim)
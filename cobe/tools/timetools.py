@@ -0,0 +1,30 @@
+"""Tools to handle timestamps passed between eyes, master and the Kalman process.
+
+Timestamps are integer nanoseconds of the monotonic clock shifted by a constant epoch offset measured once per
+process. They can not jump with wall clock adjustments within a process, but are still comparable between hosts
+whose wall clocks are synchronized (e.g. via NTP)."""
+import time
+from datetime import datetime
+
+# offset between the wall clock and the monotonic clock of this process (ns)
+EPOCH_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+
+def now_ns():
+    """Returns the current timestamp in epoch aligned monotonic nanoseconds"""
+    return time.monotonic_ns() + EPOCH_OFFSET_NS
+
+
+def monotonic_to_ns(monotonic_ns):
+    """Converts a reading of the monotonic clock (ns) to an epoch aligned timestamp"""
+    return monotonic_ns + EPOCH_OFFSET_NS
+
+
+def seconds_between(t_end_ns, t_start_ns):
+    """Returns the time passed between two timestamps in seconds"""
+    return (t_end_ns - t_start_ns) / 1e9
+
+
+def to_datetime(t_ns):
+    """Converts a timestamp to a datetime object, e.g. for logging"""
+    return datetime.fromtimestamp(t_ns / 1e9)
@@ -0,0 +1,244 @@
+"""
+CoBe - Vision - Benchmark
+
+Micro-benchmarks of the hot path of the eye that can run without camera and inference server, e.g. on a developer
+machine or directly on the nVidia boards. Run with
+
+    python cobe/vision/benchmark.py <benchmark name> [--num-iter N]
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from cobe.settings import vision, odmodel, logs
+from cobe.vision.capture import ImageFolderSource, open_capture_source
+from cobe.vision.detectors import FakeDetector, create_detector
+from cobe.vision.framebuffers import FrameBuffers, JpegEncoder, resize_frame
+from cobe.vision.inferenceclient import InferenceClient
+from cobe.vision.undistort import FisheyeUndistorter
+
+logging.basicConfig(level=logs.log_level, format=logs.log_format)
+logger = logs.setup_logger("vision.benchmark")
+
+
+def time_per_call(func, num_iter=200, num_warmup=10):
+    """Returns the mean and the 95th percentile of the wall time (ms) of calling func num_iter times"""
+    for _ in range(num_warmup):
+        func()
+    timings = np.empty(num_iter)
+    for i in range(num_iter):
+        t_start = time.perf_counter()
+        func()
+        timings[i] = (time.perf_counter() - t_start) * 1000
+    return float(np.mean(timings)), float(np.percentile(timings, 95))
+
+
+def synthetic_fisheye_maps(width, height):
+    """Creates fisheye undistortion maps for a made-up camera to benchmark without calibration files"""
+    K = np.array([[width / 2, 0, width / 2], [0, height / 2, height / 2], [0, 0, 1]], dtype=np.float64)
+    D = np.array([0.1, -0.05, 0.01, 0], dtype=np.float64)
+    return cv2.fisheye.initUndistortRectifyMap(K, D, np.eye(3), K, (width, height), cv2.CV_16SC2)
+
+
+def benchmark_undistort(num_iter=200, in_size=None, out_size=(416, 416), calibration_map=None):
+    """Comparing preprocessing of a frame with plain resize (current default), undistortion followed by resize and
+    the fused undistortion+resize remap of FisheyeUndistorter"""
+    if in_size is None:
+        in_size = (int(vision.display_width), int(vision.display_height))
+    frame = np.random.randint(0, 255, (in_size[1], in_size[0], 3), dtype=np.uint8)
+    if calibration_map is not None:
+        undistorter = FisheyeUndistorter.from_file(calibration_map)
+    else:
+        undistorter = FisheyeUndistorter(*synthetic_fisheye_maps(*in_size))
+    map1, map2 = undistorter.map1, undistorter.map2
+
+    results = {
+        "resize": time_per_call(lambda: cv2.resize(frame, out_size), num_iter),
+        "remap+resize": time_per_call(lambda: cv2.resize(
+            cv2.remap(frame, map1, map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT),
+            out_size), num_iter),
+        "fused remap": time_per_call(lambda: undistorter.undistort(frame, out_size), num_iter),
+    }
+    return results
+
+
+def benchmark_detect(num_iter=200, in_size=None, out_size=(416, 416)):
+    """Timing resize and detection of a frame with the detector backends that can run on this machine: the fake
+    backend (overhead of the eye without any model) and the in-process ONNX backend if its model file exists. The
+    roboflow backend needs a running inference server and is not included."""
+    if in_size is None:
+        in_size = (int(vision.display_width), int(vision.display_height))
+    frame = np.random.randint(0, 255, (in_size[1], in_size[0], 3), dtype=np.uint8)
+    detectors = {"fake": FakeDetector()}
+    if os.path.isfile(odmodel.onnx_model_path):
+        detectors["onnx"] = create_detector("onnx")
+    else:
+        logger.warning(f"ONNX model {odmodel.onnx_model_path} not found, skipping onnx backend.")
+
+    results = {}
+    for name, detector in detectors.items():
+        results[name] = time_per_call(lambda: detector.predict(cv2.resize(frame, out_size), confidence=40), num_iter)
+    return results
+
+
+class StandInInferenceHandler(BaseHTTPRequestHandler):
+    """Stand-in of the roboflow inference server decoding the posted frame and returning a fixed prediction"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        cv2.imdecode(np.frombuffer(base64.b64decode(body), dtype=np.uint8), cv2.IMREAD_COLOR)
+        response = json.dumps({"predictions": [{"x": 100, "y": 120, "width": 10, "height": 12, "confidence": 0.9,
+                                                "class": "stick", "class_id": 0}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def allocated_per_call(func, num_iter=50):
+    """Returns the mean size (kB) of the memory blocks allocated by a call of func and not freed yet when it returns
+    together with the mean peak (kB) of traced memory during the call"""
+    func()
+    tracemalloc.start()
+    total_kb, peak_kb = 0., 0.
+    for _ in range(num_iter):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+        total_kb += (current - start) / 1024
+        peak_kb += (peak - start) / 1024
+    tracemalloc.stop()
+    return total_kb / num_iter, peak_kb / num_iter
+
+
+def benchmark_inference_client(num_iter=200, out_size=(416, 416)):
+    """Comparing the per-request latency and allocations of the roboflow SDK and the lean keep-alive client of
+    cobe.vision.inferenceclient against a local stand-in of the inference server"""
+    from roboflow.models.object_detection import ObjectDetectionModel
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInInferenceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    frame = np.random.randint(0, 255, (out_size[1], out_size[0], 3), dtype=np.uint8)
+    # newer SDK releases expect the version in the model id as well
+    sdk = ObjectDetectionModel(api_key=odmodel.api_key, name=odmodel.model_name,
+                               id=f"{odmodel.model_id}/{odmodel.version}", local=url, version=odmodel.version)
+    client = InferenceClient(url, odmodel.model_id, odmodel.version, odmodel.api_key,
+                             jpeg_quality=int(odmodel.jpeg_quality))
+    calls = {"roboflow sdk": lambda: sdk.predict(frame, confidence=40).json(),
+             "keep-alive client": lambda: client.predict(frame, confidence=40)}
+
+    results = {}
+    try:
+        for name, call in calls.items():
+            results[name] = time_per_call(call, num_iter)
+            retained_kb, peak_kb = allocated_per_call(call)
+            logger.info(f"inference_client - {name}: {peak_kb:.1f} kB peak allocations per request, "
+                        f"{retained_kb:.1f} kB retained")
+        logger.info(f"inference_client - keep-alive client opened {client.num_connections} connection(s)")
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def benchmark_eye(num_iter=200, out_size=(416, 416)):
+    """Timing inference() requests of a complete eye with the fake detector backend. Frames are read from the
+    configured capture source (cobe.settings.vision.capture_source), or from synthetic images replayed as fast as
+    possible if the CSI camera is configured."""
+    from cobe.vision.eye import CoBeEye
+
+    with tempfile.TemporaryDirectory() as folder:
+        if vision.capture_source == "csi":
+            for i in range(10):
+                cv2.imwrite(os.path.join(folder, f"frame_{i}.png"),
+                            np.random.randint(0, 255, (out_size[1], out_size[0], 3), dtype=np.uint8))
+            cap = ImageFolderSource(folder, frame_rate=0, frame_size=out_size)
+        else:
+            cap = open_capture_source()
+        eye = CoBeEye(cap=cap)
+    eye.detector_model = FakeDetector()
+    try:
+        results = {"inference": time_per_call(lambda: eye.inference(40, *out_size), num_iter)}
+    finally:
+        eye.close()
+    return results
+
+
+def benchmark_frame_path(num_iter=200, out_size=(416, 416)):
+    """Comparing time and allocations per frame of preparing an inference input from a frame already scaled by the
+    GStreamer pipeline and encoding it for the monitoring stream: the former path (resize to the same size, colour
+    conversion and upscaling to half capture resolution, PIL encoding) and the current one (no resize when sizes
+    match, reused resize buffers, direct BGR encoding)"""
+    from PIL import Image
+    import io
+
+    frame = np.random.randint(0, 255, (out_size[1], out_size[0], 3), dtype=np.uint8)
+    stream_res = (int(vision.capture_width) // 2, int(vision.capture_height) // 2)
+
+    def former_path():
+        img = cv2.resize(frame, out_size)
+        jpg = Image.fromarray(cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), stream_res).astype('uint8'))
+        buf = io.BytesIO()
+        jpg.save(buf, format='JPEG')
+        return buf.getvalue()
+
+    buffers = FrameBuffers()
+    encoder = JpegEncoder()
+
+    def current_path():
+        return encoder.encode(resize_frame(frame, out_size))
+
+    def current_path_upscaled():
+        return encoder.encode(buffers.resize(resize_frame(frame, out_size), stream_res))
+
+    calls = {"former": former_path, "current": current_path, "current, upscaled stream": current_path_upscaled}
+    results = {}
+    for name, call in calls.items():
+        results[name] = time_per_call(call, num_iter)
+        retained_kb, peak_kb = allocated_per_call(call)
+        logger.info(f"frame_path - {name}: {peak_kb:.1f} kB peak allocations per frame")
+    return results
+
+
+benchmarks = {
+    "undistort": benchmark_undistort,
+    "detect": benchmark_detect,
+    "inference_client": benchmark_inference_client,
+    "eye": benchmark_eye,
+    "frame_path": benchmark_frame_path,
+}
+
+
+def main():
+    """Runs the requested benchmark and logs its results"""
+    args = argparse.ArgumentParser(description="Benchmarks of the hot path of CoBe eyes")
+    args.add_argument("benchmark", choices=sorted(benchmarks.keys()), help="Name of the benchmark to run")
+    args.add_argument("--num-iter", default=200, type=int, help="Number of timed iterations")
+    args = args.parse_args()
+
+    results = benchmarks[args.benchmark](num_iter=args.num_iter)
+    for name, (mean_ms, p95_ms) in results.items():
+        logger.info(f"{args.benchmark} - {name}: mean {mean_ms:.3f} ms, p95 {p95_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
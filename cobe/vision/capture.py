@@ -0,0 +1,434 @@
+"""
+CoBe - Vision - Capture
+
+Methods and classes to continuously read frames from the camera of an eye in a background thread so that
+consumers (inference, calibration, streaming) never have to wait for a blocking read of the camera.
+
+The capture source is selected with cobe.settings.vision.capture_source:
+    - csi: the CSI camera of the nVidia boards via GStreamer (default)
+    - video: replay of a recorded video file at native or accelerated rate
+    - folder: replay of the images of a folder at a fixed frame rate
+    - v4l2: a generic V4L2/USB camera
+The replay sources allow running and benchmarking the eye on machines without camera. An eye can drive several
+sensors (cobe.settings.vision.sensor_ids), each opened as its own source (see open_sensor_sources).
+"""
+import os
+import threading
+import time
+
+import cv2
+
+from cobe.settings import vision, logs
+from cobe.tools.timetools import now_ns
+
+logger = logs.setup_logger("vision.capture")
+
+# image file extensions read by ImageFolderSource
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# parameters of a capture configuration (see validate_capture_config), all in pixels of the sensor apart from the
+# frame size (display_*), the frame rate (frames/s) and the nvvidconv flip method (0-7)
+CAPTURE_CONFIG_KEYS = ("capture_width", "capture_height", "start_x", "start_y", "end_x", "end_y", "display_width",
+                       "display_height", "framerate", "flip_method")
+
+
+def gstreamer_pipeline(
+        sensor_id=0,
+        capture_width=vision.capture_width,
+        capture_height=vision.capture_height,
+        start_x=vision.start_x,
+        start_y=vision.start_y,
+        end_x=vision.end_x,
+        end_y=vision.end_y,
+        display_width=vision.display_width,
+        display_height=vision.display_height,
+        framerate=vision.frame_rate,
+        flip_method=vision.flip_method,
+):
+    """Returns a GStreamer pipeline string to start stream with the CSI camera sensor_id
+    on nVidia Jetson Nano"""
+    logger.info("Creating GStreamer pipeline string with the following parameters:"
+                "sensor_id: %d, "
+                "capture_width: %d, "
+                "capture_height: %d, "
+                "start_x: %d, "
+                "start_y: %d, "
+                "end_x: %d, "
+                "end_y: %d, "
+                "display_width: %d, "
+                "display_height: %d, "
+                "framerate: %d, "
+                "flip_method: %d" % (
+                    sensor_id,
+                    capture_width,
+                    capture_height,
+                    start_x,
+                    start_y,
+                    end_x,
+                    end_y,
+                    display_width,
+                    display_height,
+                    framerate,
+                    flip_method
+                ))
+    return (
+            "nvarguscamerasrc sensor-id=%d ! "
+            "video/x-raw(memory:NVMM), "
+            "width=(int)%d, height=(int)%d, framerate=(fraction)%d/1 ! " 
+            "nvvidconv flip-method=%d left=%d right=%d top=%d bottom=%d ! "
+            "video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
+            "videoconvert ! "
+            "video/x-raw, format=(string)BGR ! appsink drop=true sync=false"
+            % (
+                sensor_id,
+                capture_width,
+                capture_height,
+                framerate,
+                flip_method,
+                start_x,
+                end_x,
+                start_y,
+                end_y,
+                display_width,
+                display_height
+            )
+    )
+
+
+def default_capture_config():
+    """Returns the capture configuration of cobe.settings.vision with parameters converted to int"""
+    start_x, start_y = int(vision.start_x), int(vision.start_y)
+    capture_width, capture_height = int(vision.capture_width), int(vision.capture_height)
+    return {"capture_width": capture_width,
+            "capture_height": capture_height,
+            "start_x": start_x,
+            "start_y": start_y,
+            "end_x": min(start_x + int(vision.crop_width), capture_width),
+            "end_y": min(start_y + int(vision.crop_height), capture_height),
+            "display_width": int(vision.display_width),
+            "display_height": int(vision.display_height),
+            "framerate": int(vision.frame_rate),
+            "flip_method": int(vision.flip_method)}
+
+
+def validate_capture_config(config, base=None):
+    """Returns a complete capture configuration with the parameters of config (e.g. strings from a UI or the
+    environment) converted to int, taking missing parameters from base (default: default_capture_config()).
+    crop_width and crop_height are accepted instead of end_x and end_y. Raises ValueError for unknown parameters,
+    values that are not integers and inconsistent crops."""
+    config = dict(config)
+    new_config = dict(default_capture_config() if base is None else base)
+    unknown = set(config) - set(CAPTURE_CONFIG_KEYS) - {"crop_width", "crop_height"}
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown capture parameters {sorted(unknown)}, choose from {CAPTURE_CONFIG_KEYS}, "
+                         f"crop_width or crop_height")
+    converted = {}
+    for key, value in config.items():
+        try:
+            converted[key] = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Capture parameter {key} must be an integer, got {value!r}")
+        if converted[key] != float(value):
+            raise ValueError(f"Capture parameter {key} must be an integer, got {value!r}")
+    new_config.update({key: value for key, value in converted.items() if key in CAPTURE_CONFIG_KEYS})
+    for axis, crop_size in (("x", "crop_width"), ("y", "crop_height")):
+        if crop_size in converted:
+            new_config[f"end_{axis}"] = new_config[f"start_{axis}"] + converted[crop_size]
+
+    for key in ("capture_width", "capture_height", "display_width", "display_height", "framerate"):
+        if new_config[key] <= 0:
+            raise ValueError(f"Capture parameter {key} must be positive, got {new_config[key]}")
+    if not 0 <= new_config["flip_method"] <= 7:
+        raise ValueError(f"Flip method must be between 0 and 7, got {new_config['flip_method']}")
+    for axis, size in (("x", "capture_width"), ("y", "capture_height")):
+        start, end = new_config[f"start_{axis}"], new_config[f"end_{axis}"]
+        if not 0 <= start < end <= new_config[size]:
+            raise ValueError(f"Crop {start}-{end} along {axis} must lie within the sensor size {new_config[size]}")
+    return new_config
+
+
+class ReplaySource(object):
+    """Base of sources replaying recorded frames with the read/release interface of cv2.VideoCapture. Frames are
+    delivered paced at frame_rate (frames/s, 0: as fast as possible) and resized to frame_size (w, h) if given."""
+
+    def __init__(self, frame_rate, frame_size=None, loop=True):
+        self.frame_rate = float(frame_rate)
+        self.frame_size = frame_size
+        self.loop = loop
+        self._t_next = None
+
+    def _next_frame(self):
+        """Returns the next recorded frame or None at the end of the recording"""
+        raise NotImplementedError
+
+    def _rewind(self):
+        """Restarts the recording from the beginning"""
+        raise NotImplementedError
+
+    def _wait_for_frame_time(self):
+        """Sleeps until the next frame is due according to the frame rate"""
+        if self.frame_rate <= 0:
+            return
+        now = time.monotonic()
+        if self._t_next is not None and self._t_next > now:
+            time.sleep(self._t_next - now)
+            now = self._t_next
+        # not accumulating delay of slow consumers
+        self._t_next = max(now, self._t_next or now) + 1 / self.frame_rate
+
+    def read(self):
+        img = self._next_frame()
+        if img is None and self.loop:
+            self._rewind()
+            img = self._next_frame()
+        if img is None:
+            return False, None
+        self._wait_for_frame_time()
+        if self.frame_size is not None and (img.shape[1], img.shape[0]) != tuple(self.frame_size):
+            img = cv2.resize(img, tuple(self.frame_size))
+        return True, img
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class VideoFileSource(ReplaySource):
+    """Replays a recorded video file at its native frame rate multiplied by rate (0: as fast as possible)"""
+
+    def __init__(self, path, rate=1., frame_size=None, loop=True):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open video file {path}")
+        native_fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        super().__init__(native_fps * float(rate), frame_size=frame_size, loop=loop)
+        logger.info(f"Replaying {path} at {self.frame_rate:.1f} fps")
+
+    def _next_frame(self):
+        ret_val, img = self.cap.read()
+        return img if ret_val else None
+
+    def _rewind(self):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageFolderSource(ReplaySource):
+    """Replays the images of a folder in alphabetical order at frame_rate. Images are decoded once when opening the
+    source and kept in memory so that disk access does not distort benchmarks."""
+
+    def __init__(self, folder, frame_rate=20, frame_size=None, loop=True):
+        paths = sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                       if name.lower().endswith(IMAGE_EXTENSIONS))
+        if len(paths) == 0:
+            raise IOError(f"No images found in {folder}")
+        super().__init__(frame_rate, frame_size=frame_size, loop=loop)
+        self.images = [cv2.imread(path) for path in paths]
+        self._index = 0
+        logger.info(f"Replaying {len(paths)} images from {folder} at {self.frame_rate:.1f} fps")
+
+    def _next_frame(self):
+        if self._index >= len(self.images):
+            return None
+        img = self.images[self._index]
+        self._index += 1
+        # consumers must not modify frames in place, but a copy keeps the images safe from misbehaving ones
+        return img.copy()
+
+    def _rewind(self):
+        self._index = 0
+
+
+def open_capture_source(source=None, path=None, sensor_id=0, config=None):
+    """Opens the capture source with the given name (default: cobe.settings.vision.capture_source) and returns an
+    object with the read/release interface of cv2.VideoCapture
+    :param path: video file (video), image folder (folder) or device (v4l2), default cobe.settings.vision.capture_path
+    :param sensor_id: CSI sensor of the board (csi)
+    :param config: capture configuration (see validate_capture_config), default from cobe.settings.vision. Replay and
+                   V4L2 sources only use its frame size and rate."""
+    if source is None:
+        source = vision.capture_source
+    if path is None:
+        path = vision.capture_path
+    if config is None:
+        config = default_capture_config()
+    frame_size = (config["display_width"], config["display_height"])
+    logger.info(f"Opening capture source {source} {path} for sensor {sensor_id}")
+    if source == "csi":
+        cap = cv2.VideoCapture(gstreamer_pipeline(sensor_id=sensor_id, **config), cv2.CAP_GSTREAMER)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    elif source == "video":
+        return VideoFileSource(path, rate=float(vision.capture_rate), frame_size=frame_size,
+                               loop=vision.capture_loop)
+    elif source == "folder":
+        return ImageFolderSource(path, frame_rate=config["framerate"] * float(vision.capture_rate),
+                                 frame_size=frame_size, loop=vision.capture_loop)
+    elif source == "v4l2":
+        device = int(path) if str(path).isdigit() else path
+        cap = cv2.VideoCapture(device, cv2.CAP_V4L2)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, config["display_width"])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config["display_height"])
+        cap.set(cv2.CAP_PROP_FPS, config["framerate"])
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    raise ValueError(f"Unknown capture source {source}, choose from csi, video, folder or v4l2")
+
+
+def parse_sensor_ids(sensor_ids=None):
+    """Returns the sensor ids of a comma separated string (default: cobe.settings.vision.sensor_ids) as list of
+    ints"""
+    if sensor_ids is None:
+        sensor_ids = vision.sensor_ids
+    return [int(sensor_id) for sensor_id in str(sensor_ids).split(",") if sensor_id.strip() != ""]
+
+
+def sensor_capture_paths(sensor_ids=None, paths=None):
+    """Returns the capture paths of the sensors as dict by sensor id
+    :param sensor_ids: list of sensor ids, default cobe.settings.vision.sensor_ids
+    :param paths: comma separated source paths in the order of sensor_ids, default
+                  cobe.settings.vision.sensor_capture_paths. Without paths a single sensor uses
+                  cobe.settings.vision.capture_path and several sensors use their id (e.g. the V4L2 device index)."""
+    if sensor_ids is None:
+        sensor_ids = parse_sensor_ids()
+    if paths is None:
+        paths = vision.sensor_capture_paths
+    if paths is not None:
+        paths = str(paths).split(",")
+        if len(paths) != len(sensor_ids):
+            raise ValueError(f"Got {len(paths)} capture paths for {len(sensor_ids)} sensors")
+    elif len(sensor_ids) == 1:
+        paths = [None]
+    else:
+        paths = [str(sensor_id) for sensor_id in sensor_ids]
+    return dict(zip(sensor_ids, paths))
+
+
+def open_sensor_sources(sensor_ids=None, source=None, paths=None, config=None):
+    """Opens one capture source per sensor (see sensor_capture_paths) and returns them as dict by sensor id"""
+    return {sensor_id: open_capture_source(source, path, sensor_id=sensor_id, config=config)
+            for sensor_id, path in sensor_capture_paths(sensor_ids, paths).items()}
+
+
+class FrameGrabber(object):
+    """Reads frames from a cv2.VideoCapture (or any object with the same read/release interface) in a dedicated
+    thread and publishes only the newest frame together with its sequence number and capture time in a
+    lock-protected slot. Capture times are timestamps as in cobe.tools.timetools, taken from the presentation
+    timestamps (PTS) of the GStreamer buffers when available."""
+
+    def __init__(self, cap, name="frame-grabber", use_pts=True, metrics=None):
+        # capture object to read frames from
+        self.cap = cap
+        # optional cobe.tools.metrics.Metrics instance recording read durations and captured frames
+        self.metrics = metrics
+        # estimating capture times from buffer PTS, anchored with the smallest observed PTS to read delay
+        self.use_pts = use_pts
+        self._pts_offset_ns = None
+        # name of the capture thread
+        self.name = name
+        # lock protecting the latest frame slot and condition to notify waiting consumers
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        # latest frame slot
+        self._frame = None
+        self._frame_id = 0
+        self._t_cap = None
+        # capture thread and its stopping flag
+        self._thread = None
+        self._is_running = False
+
+    def start(self):
+        """Starts the background capture thread"""
+        if self._thread is not None and self._thread.is_alive():
+            logger.warning("Capture thread is already running.")
+            return
+        self._is_running = True
+        self._thread = threading.Thread(target=self._capture_loop, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"Capture thread {self.name} started.")
+
+    def stop(self, timeout=2):
+        """Stops the background capture thread and releases the capture object"""
+        self._is_running = False
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        if self.cap is not None:
+            self.cap.release()
+        logger.info(f"Capture thread {self.name} stopped.")
+
+    def reopen(self, open_capture, start=None):
+        """Stops capturing, releases the capture object and continues with the one returned by open_capture() (e.g.
+        the same camera with another configuration, which can only be opened once the old one is released). Frame
+        sequence numbers continue, and the latest frame of the old capture stays in the slot until the new capture
+        delivers its first frame, so that consumers reading latest() are served meanwhile. Consumers waiting for a
+        newer frame (wait_for_frame) get the first frame of the new capture. If open_capture fails, the grabber
+        stays stopped and the exception is raised. Returns the sequence number of the last frame of the old capture.
+        :param start: whether to start capturing from the new capture object, default if the grabber was running.
+                      Needed to restart a grabber that a failed reopen left stopped."""
+        if start is None:
+            start = self.is_running()
+        self.stop()
+        cap = open_capture()
+        with self._new_frame:
+            self.cap = cap
+            self._pts_offset_ns = None
+            last_frame_id = self._frame_id
+        if start:
+            self.start()
+        return last_frame_id
+
+    def is_running(self):
+        """Returns whether the capture thread is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _capture_loop(self):
+        """Main loop of the capture thread continuously overwriting the latest frame slot"""
+        while self._is_running:
+            t_start = time.perf_counter_ns()
+            ret_val, img = self.cap.read()
+            if not ret_val or img is None:
+                # camera not (yet) delivering frames, avoid spinning on a dead capture
+                time.sleep(0.01)
+                continue
+            t_cap = self._capture_time(now_ns())
+            with self._new_frame:
+                self._frame = img
+                self._frame_id += 1
+                self._t_cap = t_cap
+                self._new_frame.notify_all()
+            if self.metrics is not None:
+                self.metrics.observe("capture", (time.perf_counter_ns() - t_start) / 1e9)
+                self.metrics.count("frames_captured")
+
+    def _capture_time(self, t_read):
+        """Returns the capture time of the frame that was just read at t_read. If the capture exposes buffer PTS,
+        these are mapped to our clock with the smallest offset seen so far (the frame with the shortest delivery
+        delay), otherwise the time of the read is used."""
+        if not self.use_pts or not hasattr(self.cap, "get"):
+            return t_read
+        pts_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if pts_ms is None or pts_ms <= 0:
+            return t_read
+        pts_ns = int(pts_ms * 1e6)
+        if self._pts_offset_ns is None or t_read - pts_ns < self._pts_offset_ns:
+            self._pts_offset_ns = t_read - pts_ns
+        return pts_ns + self._pts_offset_ns
+
+    def latest(self):
+        """Returns the latest frame, its sequence number and capture time without blocking.
+        The frame is None if no frame has been captured yet. The returned frame is shared with other consumers
+        and must not be modified in place."""
+        with self._lock:
+            return self._frame, self._frame_id, self._t_cap
+
+    def wait_for_frame(self, after_id=0, timeout=None):
+        """Blocks until a frame newer than after_id is available or timeout (s) passed and returns the latest slot
+        in the same format as latest()"""
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._frame_id > after_id and self._frame is not None, timeout=timeout)
+            return self._frame, self._frame_id, self._t_cap
@@ -0,0 +1,255 @@
+"""
+CoBe - Vision - Detectors
+
+Object detector backends of the eye. Every backend takes a preprocessed BGR frame and a confidence threshold (in
+percent as with roboflow) and returns a list of predictions as dicts with the keys x, y (box center), width, height
+(in pixels of the frame), confidence (0-1) and class. Backends:
+    - roboflow: the roboflow inference server running in a docker container on the eye (HTTP via roboflow SDK)
+    - roboflow_http: the same server via the lean keep-alive client of cobe.vision.inferenceclient
+    - onnx: an exported ONNX model (YOLOv5/YOLOv8 output layout) run in-process with OpenCV DNN on the CPU
+    - fake: deterministic predictions without any model, for tests and benchmarks
+The backend is selected with cobe.settings.odmodel.detector_backend. Frames of several sensors can be passed to
+predict_batch, which the onnx backend runs as a single batched forward pass and the others frame by frame.
+"""
+import socket
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+from cobe.settings import odmodel, logs
+from cobe.vision.inferenceclient import InferenceClient
+
+logger = logs.setup_logger("vision.detectors")
+
+
+class Detector(object):
+    """Interface of object detector backends"""
+    name = None
+
+    def predict(self, img, confidence=40):
+        """Returns the list of predictions on img with confidence above the threshold (percent)"""
+        raise NotImplementedError
+
+    def is_ready(self):
+        """Returns whether the backend can take predictions, e.g. whether its inference server accepts connections.
+        Backends running in-process are always ready."""
+        return True
+
+    def predict_batch(self, imgs, confidence=40):
+        """Returns one list of predictions per image of imgs. Backends that can infer several frames at once
+        override this, by default the images are predicted one by one."""
+        return [self.predict(img, confidence=confidence) for img in imgs]
+
+    def close(self):
+        """Releases resources held by the backend"""
+        pass
+
+
+def server_accepts_connections(url, timeout=1.):
+    """Returns whether the server at url (e.g. http://localhost:9001/) accepts TCP connections"""
+    url = urllib.parse.urlsplit(url)
+    try:
+        with socket.create_connection((url.hostname, url.port or 80), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class RoboflowDetector(Detector):
+    """Predictions of a roboflow inference server (local docker container) via the roboflow package"""
+    name = "roboflow"
+
+    def __init__(self, api_key, model_name, inf_server_url, model_id, version):
+        # importing here so that other backends work without the roboflow package
+        from roboflow.models.object_detection import ObjectDetectionModel
+        self.model = ObjectDetectionModel(api_key=api_key,
+                                          name=model_name,
+                                          id=model_id,
+                                          local=inf_server_url,
+                                          version=version)
+        self.inf_server_url = inf_server_url
+
+    def is_ready(self):
+        return server_accepts_connections(self.inf_server_url)
+
+    def predict(self, img, confidence=40):
+        try:
+            detections = self.model.predict(img, confidence=confidence)
+        except KeyError:
+            logger.error("KeyError in roboflow inference code, can mean that your authentication"
+                         "is invalid to the inference server or you are over quota.")
+            return []
+        preds = detections.json().get("predictions")
+        # removing image path from predictions as it will hold the whole array
+        for pred in preds:
+            pred.pop("image_path", None)
+        return preds
+
+
+class RoboflowHTTPDetector(Detector):
+    """Predictions of a roboflow inference server via a persistent keep-alive connection"""
+    name = "roboflow_http"
+
+    def __init__(self, api_key, model_name, inf_server_url, model_id, version):
+        self.client = InferenceClient(inf_server_url, model_id, version, api_key,
+                                      jpeg_quality=int(odmodel.jpeg_quality),
+                                      timeout=float(odmodel.inf_server_timeout))
+
+    def is_ready(self):
+        return self.client.is_ready()
+
+    def predict(self, img, confidence=40):
+        return self.client.predict(img, confidence=confidence)
+
+    def close(self):
+        self.client.close()
+
+
+def parse_yolo_output(output, class_names, confidence, nms_threshold, scale_x=1., scale_y=1.):
+    """Converts the raw output of a YOLO model to predictions
+    :param output: network output, either YOLOv5 layout (N, 5 + num_classes) with objectness or YOLOv8 layout
+                   (4 + num_classes, N), with or without leading batch dimension. Boxes are (cx, cy, w, h).
+    :param confidence: minimum confidence (0-1)
+    :param scale_x, scale_y: factors from network input to frame pixels"""
+    output = np.squeeze(np.asarray(output, dtype=np.float32))
+    if output.ndim == 1:
+        output = output[np.newaxis, :]
+    num_classes = len(class_names)
+    if output.shape[0] in (4 + num_classes, 5 + num_classes) and output.shape[1] not in (4 + num_classes,
+                                                                                          5 + num_classes):
+        output = output.T
+    if output.shape[1] == 5 + num_classes:
+        scores = output[:, 5:] * output[:, 4:5]
+    elif output.shape[1] == 4 + num_classes:
+        scores = output[:, 4:]
+    else:
+        raise ValueError(f"Unexpected output shape {output.shape} for {num_classes} classes")
+
+    class_ids = np.argmax(scores, axis=1)
+    class_scores = scores[np.arange(len(class_ids)), class_ids]
+    keep = class_scores >= confidence
+    boxes, class_ids, class_scores = output[keep, :4], class_ids[keep], class_scores[keep]
+    if len(boxes) == 0:
+        return []
+
+    # NMSBoxes expects (left, top, width, height)
+    nms_boxes = [[float(cx - w / 2), float(cy - h / 2), float(w), float(h)] for cx, cy, w, h in boxes]
+    indices = cv2.dnn.NMSBoxes(nms_boxes, class_scores.tolist(), confidence, nms_threshold)
+    preds = []
+    for i in np.array(indices).flatten():
+        cx, cy, w, h = boxes[i]
+        preds.append({"x": float(cx * scale_x),
+                      "y": float(cy * scale_y),
+                      "width": float(w * scale_x),
+                      "height": float(h * scale_y),
+                      "confidence": float(class_scores[i]),
+                      "class": class_names[class_ids[i]],
+                      "class_id": int(class_ids[i])})
+    return preds
+
+
+class OnnxDetector(Detector):
+    """In-process CPU inference of an exported ONNX YOLO model with OpenCV DNN, without an HTTP hop to a server
+
+    :param model_path: path of the .onnx file
+    :param class_names: list of class names in the order of the model outputs
+    :param input_size: (w, h) input size of the network
+    :param nms_threshold: IoU threshold of non-maximum suppression
+    :param num_threads: number of CPU threads OpenCV may use (None: OpenCV default)"""
+    name = "onnx"
+
+    def __init__(self, model_path, class_names, input_size=(416, 416), nms_threshold=0.45, num_threads=None):
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        if num_threads is not None:
+            cv2.setNumThreads(int(num_threads))
+        self.class_names = list(class_names)
+        self.input_size = tuple(int(s) for s in input_size)
+        self.nms_threshold = float(nms_threshold)
+        # models exported with a fixed batch size of 1 can not infer batches, they are then predicted one by one
+        self.supports_batch = True
+        logger.info(f"ONNX model loaded from {model_path} with classes {self.class_names}")
+
+    def predict(self, img, confidence=40):
+        blob = cv2.dnn.blobFromImage(img, scalefactor=1 / 255., size=self.input_size, swapRB=True, crop=False)
+        self.net.setInput(blob)
+        output = self.net.forward()
+        return self.parse_output(output, img, confidence)
+
+    def predict_batch(self, imgs, confidence=40):
+        if len(imgs) < 2 or not self.supports_batch:
+            return super().predict_batch(imgs, confidence=confidence)
+        blob = cv2.dnn.blobFromImages(imgs, scalefactor=1 / 255., size=self.input_size, swapRB=True, crop=False)
+        self.net.setInput(blob)
+        try:
+            outputs = self.net.forward()
+        except cv2.error as e:
+            logger.warning(f"ONNX model can not infer batches, predicting frames one by one: {e}")
+            self.supports_batch = False
+            return super().predict_batch(imgs, confidence=confidence)
+        return [self.parse_output(output, img, confidence) for output, img in zip(outputs, imgs)]
+
+    def parse_output(self, output, img, confidence):
+        """Converts the network output of a single image to predictions in pixels of img"""
+        return parse_yolo_output(output, self.class_names, confidence / 100., self.nms_threshold,
+                                 scale_x=img.shape[1] / self.input_size[0],
+                                 scale_y=img.shape[0] / self.input_size[1])
+
+
+class FakeDetector(Detector):
+    """Deterministic predictions without a model: a single box of the given class at a fixed relative position,
+    optionally after a fixed delay mimicking the inference time of a real backend
+
+    :param class_name: class of the returned prediction
+    :param position: (x, y) center of the box relative to the frame size
+    :param box_size: (w, h) of the box relative to the frame size
+    :param fake_confidence: confidence (0-1) of the returned prediction
+    :param latency: time (s) each prediction takes"""
+    name = "fake"
+
+    def __init__(self, class_name="stick", position=(0.5, 0.5), box_size=(0.05, 0.05), fake_confidence=0.9,
+                 latency=0.):
+        self.class_name = class_name
+        self.position = position
+        self.box_size = box_size
+        self.fake_confidence = float(fake_confidence)
+        self.latency = float(latency)
+        self.num_predictions = 0
+
+    def predict(self, img, confidence=40):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        self.num_predictions += 1
+        if self.fake_confidence * 100 < confidence:
+            return []
+        h, w = img.shape[:2]
+        return [{"x": self.position[0] * w,
+                 "y": self.position[1] * h,
+                 "width": self.box_size[0] * w,
+                 "height": self.box_size[1] * h,
+                 "confidence": self.fake_confidence,
+                 "class": self.class_name}]
+
+
+def create_detector(backend=None, **roboflow_params):
+    """Creates the detector backend with the given name (default: cobe.settings.odmodel.detector_backend).
+    The roboflow backend takes its model parameters as keyword arguments, the other backends are configured in
+    cobe.settings.odmodel."""
+    if backend is None:
+        backend = odmodel.detector_backend
+    if backend == "roboflow":
+        return RoboflowDetector(**roboflow_params)
+    elif backend == "roboflow_http":
+        return RoboflowHTTPDetector(**roboflow_params)
+    elif backend == "onnx":
+        return OnnxDetector(odmodel.onnx_model_path,
+                            class_names=odmodel.onnx_class_names.split(","),
+                            input_size=(int(odmodel.onnx_input_size), int(odmodel.onnx_input_size)),
+                            nms_threshold=float(odmodel.onnx_nms_threshold),
+                            num_threads=odmodel.onnx_num_threads)
+    elif backend == "fake":
+        return FakeDetector(latency=float(odmodel.fake_latency))
+    raise ValueError(f"Unknown detector backend {backend}, choose from roboflow, roboflow_http, onnx or fake")
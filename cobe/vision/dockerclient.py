@@ -0,0 +1,204 @@
+"""
+CoBe - Vision - Docker Client
+
+Lean client of the Docker Engine API used by the eye to manage the container of the roboflow inference server.
+Instead of running the docker CLI with sudo for every operation and parsing its text output, it sends the requests
+over a single keep-alive connection to the unix socket of the Docker daemon and returns the decoded JSON replies.
+The user running the eye needs access to the socket (e.g. membership in the docker group).
+"""
+import http.client
+import json
+import socket
+import urllib.parse
+
+from cobe.settings import logs
+
+logger = logs.setup_logger("vision.dockerclient")
+
+
+class DockerError(Exception):
+    """Error reply of the Docker daemon
+
+    :param status: HTTP status of the reply
+    :param message: error message of the daemon"""
+
+    def __init__(self, status, message):
+        super().__init__(f"Docker daemon returned {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a unix socket"""
+
+    def __init__(self, socket_path, timeout=10.):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class DockerClient(object):
+    """Persistent client of the Docker Engine API
+
+    :param socket_path: unix socket of the Docker daemon
+    :param api_version: API version prefixed to all paths, e.g. v1.41 (None: the version of the daemon)
+    :param timeout: socket timeout (s) of the connection"""
+
+    def __init__(self, socket_path="/var/run/docker.sock", api_version="v1.41", timeout=10.):
+        self.socket_path = socket_path
+        self.timeout = float(timeout)
+        self._prefix = f"/{api_version.strip('/')}" if api_version else ""
+        self._connection = None
+        # number of (re)opened connections, stays 1 as long as the daemon keeps the connection alive
+        self.num_connections = 0
+
+    def _connect(self):
+        """Opens a new connection to the daemon"""
+        self.close()
+        self._connection = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        self._connection.connect()
+        self.num_connections += 1
+
+    def _send(self, method, path, body, headers):
+        """Sends the request on the persistent connection and returns status and body of the reply"""
+        if self._connection is None:
+            self._connect()
+        try:
+            self._connection.request(method, path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            data = response.read()
+        except Exception:
+            # connection is in an unknown state
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response.status, data
+
+    def _call(self, method, path, params=None, body=None, timeout=None):
+        """Sends a request to the API and returns status and body of the reply. Raises DockerError for replies with
+        status 400 or above."""
+        if params:
+            query = {key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                     for key, value in params.items()}
+            path = f"{path}?{urllib.parse.urlencode(query)}"
+        path = self._prefix + path
+        headers = {"Host": "docker"}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        try:
+            if timeout is not None and self._connection is not None:
+                self._connection.sock.settimeout(timeout)
+            try:
+                status, data = self._send(method, path, body, headers)
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError,
+                    ConnectionResetError):
+                # the daemon closed the idle keep-alive connection, retrying once on a new one
+                logger.debug("Connection to docker daemon lost, reconnecting.")
+                self._connect()
+                if timeout is not None:
+                    self._connection.sock.settimeout(timeout)
+                status, data = self._send(method, path, body, headers)
+        finally:
+            if self._connection is not None:
+                self._connection.sock.settimeout(self.timeout)
+        if status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except (ValueError, AttributeError):
+                message = data[:200]
+            raise DockerError(status, message)
+        return status, data
+
+    def request(self, method, path, params=None, body=None, timeout=None):
+        """Sends a request to the API and returns status and decoded JSON reply (None for empty replies). Raises
+        DockerError for replies with status 400 or above.
+        :param params: query parameters, dicts and lists are sent as JSON (e.g. filters)
+        :param body: JSON serializable request body
+        :param timeout: socket timeout (s) of this request, e.g. for stopping containers"""
+        status, data = self._call(method, path, params=params, body=body, timeout=timeout)
+        return status, json.loads(data) if data.strip() else None
+
+    def ping(self):
+        """Returns whether the daemon is reachable"""
+        try:
+            return self._call("GET", "/_ping")[0] == 200
+        except (OSError, http.client.HTTPException, DockerError):
+            return False
+
+    def find_container(self, name):
+        """Returns the id of the container (running or not) with the given name, None if there is none"""
+        _, containers = self.request("GET", "/containers/json", params={"all": 1, "filters": {"name": [name]}})
+        # the name filter matches substrings, names are listed with a leading slash
+        for container in containers:
+            if f"/{name}" in container.get("Names", []):
+                return container["Id"]
+        return None
+
+    def pull_image(self, image, timeout=600.):
+        """Pulls an image (name:tag) from its registry, raising DockerError if the pull fails"""
+        name, _, tag = image.rpartition(":") if ":" in image.split("/")[-1] else (image, "", "latest")
+        logger.info(f"Pulling image {name}:{tag}...")
+        _, data = self._call("POST", "/images/create", params={"fromImage": name, "tag": tag}, timeout=timeout)
+        # the reply streams one JSON progress message per line
+        for line in data.splitlines():
+            if line.strip() and "error" in json.loads(line):
+                raise DockerError(500, json.loads(line)["error"])
+
+    def create_container(self, name, config):
+        """Creates a container and returns its id, pulling its image first if it is missing
+        :param config: container configuration of the API, e.g. {"Image": ..., "HostConfig": {...}}"""
+        try:
+            _, reply = self.request("POST", "/containers/create", params={"name": name}, body=config)
+        except DockerError as e:
+            if e.status != 404:
+                raise
+            self.pull_image(config["Image"])
+            _, reply = self.request("POST", "/containers/create", params={"name": name}, body=config)
+        for warning in reply.get("Warnings") or []:
+            logger.warning(f"Creating container {name}: {warning}")
+        return reply["Id"]
+
+    def start(self, container):
+        """Starts a container, returns False if it was already running"""
+        return self.request("POST", f"/containers/{container}/start")[0] != 304
+
+    def stop(self, container, timeout=10):
+        """Stops a container, killing it after timeout (s). Returns False if it was not running."""
+        status, _ = self.request("POST", f"/containers/{container}/stop", params={"t": int(timeout)},
+                                 timeout=self.timeout + timeout)
+        return status != 304
+
+    def remove(self, container, force=False):
+        """Removes a container, with force also if it is running"""
+        self.request("DELETE", f"/containers/{container}", params={"force": int(bool(force))})
+
+    def inspect(self, container):
+        """Returns the low-level information of a container as dict"""
+        return self.request("GET", f"/containers/{container}/json")[1]
+
+    def health(self, container):
+        """Returns the state of a container as dict with its status (e.g. running, exited), running flag, health
+        status of its healthcheck (None without healthcheck), exit code and start time"""
+        state = self.inspect(container)["State"]
+        return {"status": state.get("Status"),
+                "running": bool(state.get("Running")),
+                "health": (state.get("Health") or {}).get("Status"),
+                "exit_code": state.get("ExitCode"),
+                "started_at": state.get("StartedAt")}
+
+    def close(self):
+        """Closes the connection to the daemon"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -9,12 +9,11 @@ They
     - return bounding box coordinates
 """
 import argparse
-import datetime
+import itertools
 import time
 
 import cv2
 import os
-import subprocess
 import threading
 
 import logging  # must be imported and set before pyro
@@ -23,72 +22,38 @@ logging.basicConfig(level=logs.log_level, format=logs.log_format)
 logger = logs.setup_logger("vision")
 
 import numpy as np
-from Pyro5.api import expose, behavior, oneway
+from Pyro5.api import expose, behavior, oneway, Proxy
+from Pyro5.errors import CommunicationError
 from Pyro5.server import Daemon
-from roboflow.models.object_detection import ObjectDetectionModel
 from cobe.tools.iptools import get_local_ip_address
-from cobe.tools.detectiontools import annotate_detections
-from cobe.settings import vision, odmodel
+from cobe.tools.remaptools import RemapLUT
+from cobe.tools.timetools import now_ns, seconds_between
+from cobe.tools.metrics import Metrics, format_metrics
+from cobe.settings import vision, odmodel, network
 from cobe.vision import web_vision
+from cobe.vision.capture import FrameGrabber, open_sensor_sources, open_capture_source, sensor_capture_paths, \
+    default_capture_config, validate_capture_config
+from cobe.vision.pipeline import InferencePipeline
+from cobe.vision.undistort import FisheyeUndistorter
+from cobe.vision.roi import ROITracker
+from cobe.vision.motiongate import MotionGate
+from cobe.vision.detectors import create_detector
+from cobe.vision.publisher import AnnotationPublisher
+from cobe.vision.framebuffers import resize_frame, JpegEncoder
+from cobe.vision.flowtracker import FlowTracker
+from cobe.vision.dockerclient import DockerClient, DockerError
 
-
-def gstreamer_pipeline(
-        capture_width=vision.capture_width,
-        capture_height=vision.capture_height,
-        start_x=vision.start_x,
-        start_y=vision.start_y,
-        end_x=vision.end_x,
-        end_y=vision.end_y,
-        display_width=vision.display_width,
-        display_height=vision.display_height,
-        framerate=vision.frame_rate,
-        flip_method=vision.flip_method,
-):
-    """Returns a GStreamer pipeline string to start stream with the CSI camera
-    on nVidia Jetson Nano"""
-    logger.info("Creating GStreamer pipeline string with the following parameters:"
-                "capture_width: %d, "
-                "capture_height: %d, "
-                "start_x: %d, "
-                "start_y: %d, "
-                "end_x: %d, "
-                "end_y: %d, "
-                "display_width: %d, "
-                "display_height: %d, "
-                "framerate: %d, "
-                "flip_method: %d" % (
-                    capture_width,
-                    capture_height,
-                    start_x,
-                    start_y,
-                    end_x,
-                    end_y,
-                    display_width,
-                    display_height,
-                    framerate,
-                    flip_method
-                ))
-    return (
-            "nvarguscamerasrc sensor-id=0 ! "
-            "video/x-raw(memory:NVMM), "
-            "width=(int)%d, height=(int)%d, framerate=(fraction)%d/1 ! " 
-            "nvvidconv flip-method=%d left=%d right=%d top=%d bottom=%d ! "
-            "video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! "
-            "videoconvert ! "
-            "video/x-raw, format=(string)BGR ! appsink drop=true sync=false"
-            % (
-                capture_width,
-                capture_height,
-                framerate,
-                flip_method,
-                start_x,
-                end_x,
-                start_y,
-                end_y,
-                display_width,
-                display_height
-            )
-    )
+# configurations of the roboflow inference server container by board version (Docker Engine API, the equivalent of
+# the former docker run commands)
+INFERENCE_SERVER_CONTAINERS = {
+    "ORIN": {"Image": "roboflow/roboflow-inference-server-trt-jetson-5.1.1:latest",
+             "Env": ["NUM_WORKERS=1"],
+             "HostConfig": {"NetworkMode": "host", "Privileged": True, "Runtime": "nvidia",
+                            "Mounts": [{"Type": "volume", "Source": "roboflow", "Target": "/tmp/cache"}]}},
+    "JETSON": {"Image": "roboflow/inference-server:jetson",
+               "HostConfig": {"NetworkMode": "host",
+                              "DeviceRequests": [{"Driver": "", "Count": -1, "Capabilities": [["gpu"]]}]}},
+}
 
 
 @behavior(instance_mode="single")
@@ -97,7 +62,13 @@ class CoBeEye(object):
     """Class serving as input generator of CoBe running on nVidia boards to carry out
     object detection on the edge and forward detection coordinates via Pyro5"""
 
-    def __init__(self):
+    def __init__(self, cap=None, caps=None):
+        """
+        :param cap: capture object with the read/release interface of cv2.VideoCapture to read frames from. Defaults
+                    to the source configured in cobe.settings.vision.capture_source.
+        :param caps: capture objects of several sensors as dict by sensor id, used instead of cap. Defaults to one
+                     source per sensor in cobe.settings.vision.sensor_ids.
+        """
         # Mimicking initialization of eye using e.g. environment parameters or
         # other setting files distributed before
         # ID of the Nano module
@@ -108,53 +79,383 @@ class CoBeEye(object):
         # IP address of the Nano module in the local network
         self.local_ip = get_local_ip_address()
 
-        # ObjectDetectionModel instance to carry out predictions on a roboflow server
+        # detector backend instance to carry out predictions (see cobe.vision.detectors)
         self.detector_model = None
+        # readiness report of the detector backend (see warm_up)
+        self.readiness = {"ready": False, "backend": None}
         # Docker ID of the roboflow inference server running on the Nano module
         self.inference_server_id = None
+        # client of the Docker daemon managing the inference server container, Pyro calls share its connection
+        self.docker = DockerClient(odmodel.docker_socket, api_version=odmodel.docker_api_version,
+                                   timeout=float(odmodel.docker_timeout))
+        self._docker_lock = threading.Lock()
+
+        # Per-stage latency histograms and counters of the eye (see get_metrics)
+        self.metrics = Metrics(num_samples=int(vision.metrics_num_samples))
+        # sequence number of the last camera frame taken for inference to count frames that were never inferred
+        self._last_inferred_frame_id = 0
+
+        # Starting cv2 capture streams from the cameras (or the configured replay sources), one per sensor
+        # source and paths the sensors were opened with, None for capture objects passed in
+        self.capture_source = None
+        self.capture_paths = None
+        if caps is None:
+            if cap is not None:
+                caps = {0: cap}
+            else:
+                self.capture_source = vision.capture_source
+                self.capture_paths = sensor_capture_paths()
+                caps = open_sensor_sources()
+        self.caps = dict(caps)
+        self.sensor_ids = sorted(self.caps)
+        # the first sensor is the primary one used by ROI inference, motion gating, flow tracking, pipelined and
+        # streaming mode and the monitoring stream
+        self.primary_sensor_id = self.sensor_ids[0]
+        self.cap = self.caps[self.primary_sensor_id]
+        # Continuously reading the cameras in background threads so that consumers get the latest frame
+        # without waiting for a blocking read
+        self.frame_grabbers = {sensor_id: FrameGrabber(sensor_cap, name=f"frame-grabber-{sensor_id}",
+                                                       metrics=self.metrics)
+                               for sensor_id, sensor_cap in self.caps.items()}
+        self.frame_grabber = self.frame_grabbers[self.primary_sensor_id]
+        for frame_grabber in self.frame_grabbers.values():
+            frame_grabber.start()
+        logger.info(f"Capturing frames from sensors {self.sensor_ids}")
+        # capture configurations (crop, frame size and rate) by sensor id, can be changed at runtime with
+        # apply_capture_config, which holds the capture lock while reopening a sensor
+        self.capture_configs = {sensor_id: default_capture_config() for sensor_id in self.sensor_ids}
+        self._capture_lock = threading.Lock()
+
+        # Remap tables per sensor pushed by the master to return detections in simulation space (see set_remap_lut)
+        self.remap_luts = {}
 
-        # Starting cv2 capture stream from camera
-        self.cap = cv2.VideoCapture(gstreamer_pipeline(), cv2.CAP_GSTREAMER)
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Tracking-driven ROI inference running the detector only around the last detection when possible
+        self.roi_inference = vision.roi_inference
+        self.roi_tracker = ROITracker(roi_size=vision.roi_size,
+                                      input_size=(vision.roi_input_size, vision.roi_input_size),
+                                      min_confidence=vision.roi_min_confidence,
+                                      max_age=vision.roi_max_age,
+                                      full_frame_every=vision.roi_full_frame_every,
+                                      target_class=vision.roi_target_class)
 
-        # Opening fisheye unwarping calibration maps
-        self.fisheye_calibration_map = None
-        self.map1 = None
-        self.map2 = None
+        # Motion gate reusing the last predictions when the arena did not change since the last inferred frame
+        self.motion_gating = vision.motion_gating
+        self.motion_gate = MotionGate(threshold=vision.motion_threshold,
+                                      max_reuse_age=vision.motion_max_reuse_age,
+                                      thumbnail_size=vision.motion_thumbnail_size)
+
+        # Optical flow tracker following the last detections on every captured frame between inferences
+        self.flow_tracking = vision.flow_tracking
+        self.flow_tracker = FlowTracker(target_class=vision.roi_target_class,
+                                        max_points=vision.flow_max_points,
+                                        min_points=vision.flow_min_points,
+                                        max_age=vision.flow_max_age)
+        self.flow_tracking_thread = None
+        self._is_flow_tracking = False
+        # size of the inference frames the tracker works on
+        self._flow_size = None
+        # latest tracked predictions together with their capture time and frame id
+        self._tracked_lock = threading.Lock()
+        self._tracked = None
+        # capture time of the latest predictions returned in pipelined mode (detected or tracked)
+        self._last_returned_t_cap = None
+
+        # Opening fisheye unwarping calibration maps by sensor id
+        self.fisheye_calibration_maps = {}
+        # fused undistortion and resize maps by sensor id built from the calibration maps on first use
+        self.undistort_frames = vision.undistort_frames
+        self.undistorters = {}
 
         # creating streaming server for image data (slows stream)
         self.publish_mjpeg_stream = vision.publish_mjpeg_stream
         self.streaming_server = None
         self.streaming_thread = None
+        # worker annotating and publishing inferred frames off the inference reply path
+        self.annotation_publisher = None
         if self.publish_mjpeg_stream:
             self.setup_streaming_server()
 
+        # pipelined inference overlapping capture/preprocessing with inference (see start_pipelined_inference)
+        # the pipeline is started with the parameters of the first inference() request
+        self.pipelined_inference = vision.pipelined_inference
+        self.inference_pipeline = None
+        self.inference_pipeline_params = None
+        self._last_pipeline_result_id = 0
+
+        # streaming mode pushing detections to a receiver on the master (see start_detection_stream)
+        self.detection_stream_thread = None
+        self._is_streaming_detections = False
+        # receiver URI and eye name while streaming, also used to push tracked positions
+        self._stream_target = None
+        # sequence numbers of pushed messages shared by detected and tracked positions and capture time of the
+        # latest pushed message, messages about older frames are not pushed
+        self._stream_lock = threading.Lock()
+        self._stream_seq = itertools.count(1)
+        self._last_pushed_t_cap = None
+
+        # JPEG encoders by quality of the frames sent to the master for offloaded inference (see get_encoded_frame)
+        self._offload_encoders = {}
+
         # pyro5 daemon stopping flag
         self._is_running = True
 
-        # sudo pswd
-        self.pswd = None
+    @expose
+    def get_sensor_ids(self):
+        """Returns the ids of the sensors driven by the eye"""
+        return list(self.sensor_ids)
+
+    @expose
+    def get_capture_config(self, sensor_id=None):
+        """Returns the capture configuration of a sensor (default: the primary sensor)"""
+        if sensor_id is None:
+            sensor_id = self.primary_sensor_id
+        return dict(self.capture_configs[sensor_id])
 
     @expose
-    def has_pswd(self):
-        """Returns whether the eye has a password set"""
-        logger.debug("Password status requested.")
-        if self.pswd is None:
+    def apply_capture_config(self, config, sensor_id=None):
+        """Applies a new capture configuration to a sensor (default: the primary sensor) at runtime, without restarting
+        the eye. config holds the parameters to change (see cobe.vision.capture.validate_capture_config), e.g.
+        {"framerate": 30, "display_width": 640, "display_height": 640}, as numbers or strings. The capture of the
+        sensor is reopened under the capture lock while its consumers keep running, they are served the latest frame
+        of the previous configuration until the first frame of the new one arrives. If the new configuration can not
+        be opened, the previous one is restored and the error is raised.
+        Returns a dict with the applied config, the time (s) reopening took (reopen_time) and the time (s) until the
+        first frame of the new configuration arrived (first_frame_time, None if it did not arrive in time)."""
+        if sensor_id is None:
+            sensor_id = self.primary_sensor_id
+        if self.capture_source is None:
+            raise ValueError("Capture objects passed to the eye can not be reconfigured")
+        with self._capture_lock:
+            old_config = self.capture_configs[sensor_id]
+            new_config = validate_capture_config(config, base=old_config)
+            frame_grabber = self.frame_grabbers[sensor_id]
+            was_running = frame_grabber.is_running()
+            t_start = time.perf_counter()
+            try:
+                last_frame_id = frame_grabber.reopen(lambda: self.open_sensor(sensor_id, new_config))
+            except Exception as e:
+                logger.error(f"Could not apply capture configuration to sensor {sensor_id}: {e}. Restoring previous "
+                             f"configuration.")
+                # the failed reopen left the grabber stopped
+                frame_grabber.reopen(lambda: self.open_sensor(sensor_id, old_config), start=was_running)
+                self._set_sensor_capture(sensor_id, frame_grabber.cap)
+                raise
+            reopen_time = time.perf_counter() - t_start
+            self.capture_configs[sensor_id] = new_config
+            self._set_sensor_capture(sensor_id, frame_grabber.cap)
+            frame, frame_id, _ = frame_grabber.wait_for_frame(after_id=last_frame_id,
+                                                              timeout=float(vision.frame_wait_timeout))
+            first_frame_time = time.perf_counter() - t_start if frame_id > last_frame_id else None
+
+        self.metrics.observe("capture_reopen", reopen_time)
+        view_changed = any(new_config[key] != old_config[key]
+                           for key in ("start_x", "start_y", "end_x", "end_y", "flip_method"))
+        if view_changed and sensor_id == self.primary_sensor_id:
+            # positions in frames of the previous view can not be reused or tracked, flow tracking restarts with the
+            # next inference
+            self.motion_gate.reset()
+            self.roi_tracker.reset()
+            self.stop_flow_tracking()
+        if view_changed and self.undistort_frames and sensor_id in self.fisheye_calibration_maps:
+            logger.warning(f"The fisheye calibration map of sensor {sensor_id} belongs to the previous crop.")
+        logger.info(f"Capture configuration {new_config} applied to sensor {sensor_id}, reopening took "
+                    f"{reopen_time:.3f}s, first frame after {first_frame_time}s.")
+        return {"config": new_config, "reopen_time": reopen_time, "first_frame_time": first_frame_time}
+
+    def _set_sensor_capture(self, sensor_id, cap):
+        """Updates the references to the capture object of a sensor after it was reopened"""
+        self.caps[sensor_id] = cap
+        if sensor_id == self.primary_sensor_id:
+            self.cap = cap
+
+    def open_sensor(self, sensor_id, config):
+        """Opens the capture source of a sensor with a capture configuration, raising RuntimeError if it can not be
+        opened"""
+        cap = open_capture_source(self.capture_source, self.capture_paths[sensor_id], sensor_id=sensor_id,
+                                  config=config)
+        if hasattr(cap, "isOpened") and not cap.isOpened():
+            cap.release()
+            raise RuntimeError(f"Could not open capture source {self.capture_source} of sensor {sensor_id}")
+        return cap
+
+    @expose
+    def get_camera_crop(self, sensor_id=None):
+        """Returns the sensor crop of a sensor (default: the primary sensor) together with the sensor size, frame size
+        and flip method of the CSI pipeline, so that the master can fit the crop to the arena (see
+        cobe.tools.croptools)"""
+        config = self.get_capture_config(sensor_id)
+        return {"crop": {key: config[key] for key in ("start_x", "start_y", "end_x", "end_y")},
+                "capture_size": (config["capture_width"], config["capture_height"]),
+                "frame_size": (config["display_width"], config["display_height"]),
+                "flip_method": config["flip_method"]}
+
+    @expose
+    def set_camera_crop(self, start_x, start_y, end_x, end_y, sensor_id=None):
+        """Reopens the CSI pipeline of a sensor (default: the primary sensor) with a new sensor crop (see
+        apply_capture_config). Returns False if the capture source of the sensor can not be cropped."""
+        if self.capture_source != "csi":
+            logger.warning(f"Capture source {self.capture_source} can not be cropped.")
             return False
+        self.apply_capture_config({"start_x": start_x, "start_y": start_y, "end_x": end_x, "end_y": end_y},
+                                  sensor_id=sensor_id)
+        return True
+
+    @expose
+    def set_fisheye_calibration_map(self, calibration_map, sensor_id=None):
+        """Sets the fisheye calibration map of a sensor (default: the primary sensor) of the eye"""
+        if sensor_id is None:
+            sensor_id = self.primary_sensor_id
+        self.fisheye_calibration_maps[sensor_id] = calibration_map
+        self.undistorters.pop(sensor_id, None)
+        logger.info(f"Fisheye calibration map of sensor {sensor_id} set to {calibration_map}.")
+
+    def get_undistorter(self, sensor_id):
+        """Returns the undistorter of a sensor, loading its fisheye calibration map on first use. Returns None if
+        the sensor has no map or the map can not be loaded, in which case the sensor continues without
+        undistortion."""
+        undistorter = self.undistorters.get(sensor_id)
+        if undistorter is not None or sensor_id not in self.fisheye_calibration_maps:
+            return undistorter
+        calibration_map = self.fisheye_calibration_maps[sensor_id]
+        try:
+            undistorter = FisheyeUndistorter.from_file(calibration_map)
+        except (OSError, KeyError) as e:
+            logger.error(f"Could not load fisheye calibration map {calibration_map} of sensor {sensor_id}: {e}. "
+                         f"Continuing without undistortion.")
+            del self.fisheye_calibration_maps[sensor_id]
+            return None
+        self.undistorters[sensor_id] = undistorter
+        return undistorter
+
+    @expose
+    def set_remap_lut(self, lut_message, sensor_id=None):
+        """Loads the remap table built by the master from the calibration maps of a sensor (default: the primary
+        sensor) of the eye (see cobe.tools.remaptools.build_remap_lut). With a loaded table, predictions of the
+        sensor also hold their simulation space coordinates as sim_x and sim_y."""
+        if sensor_id is None:
+            sensor_id = self.primary_sensor_id
+        self.remap_luts[sensor_id] = RemapLUT.from_message(lut_message)
+        logger.info(f"Remap table of sensor {sensor_id} with shape {self.remap_luts[sensor_id].xsim.shape} loaded.")
+
+    @expose
+    def clear_remap_lut(self, sensor_id=None):
+        """Removes the remap table of a sensor (default: all sensors) so that its predictions are returned only in
+        camera space"""
+        if sensor_id is None:
+            self.remap_luts = {}
         else:
-            return True
+            self.remap_luts.pop(sensor_id, None)
+        logger.info("Remap table removed.")
+
+    @expose
+    def set_roi_inference(self, enabled):
+        """Turns tracking-driven ROI inference on or off"""
+        self.roi_inference = bool(enabled)
+        logger.info(f"ROI inference {'enabled' if self.roi_inference else 'disabled'}.")
+
+    @expose
+    def get_roi_stats(self):
+        """Returns the number of ROI and full-frame inferences and the number of misses in ROI"""
+        return self.roi_tracker.get_stats()
+
+    @expose
+    def set_motion_gating(self, enabled, threshold=None, max_reuse_age=None):
+        """Turns motion gated inference on or off and optionally changes its threshold (mean absolute grayscale
+        difference) and the maximum age (s) of reused predictions"""
+        self.motion_gating = bool(enabled)
+        if threshold is not None:
+            self.motion_gate.threshold = float(threshold)
+        if max_reuse_age is not None:
+            self.motion_gate.max_reuse_age = float(max_reuse_age)
+        self.motion_gate.reset()
+        logger.info(f"Motion gating {'enabled' if self.motion_gating else 'disabled'} with threshold "
+                    f"{self.motion_gate.threshold} and max reuse age {self.motion_gate.max_reuse_age}s.")
+
+    @expose
+    def get_motion_gate_stats(self):
+        """Returns the motion gate settings together with the number of reused (hits) and inferred (misses) frames"""
+        return self.motion_gate.get_stats()
 
     @expose
-    def set_pswd(self, pswd):
-        """Sets the password of the eye"""
-        self.pswd = pswd
-        logger.info("Password set.")
+    def set_flow_tracking(self, enabled):
+        """Switches optical flow tracking of the detections between inferences on or off. The tracker starts with
+        the next inference."""
+        self.flow_tracking = enabled
+        if not enabled:
+            self.stop_flow_tracking()
+        logger.info(f"Optical flow tracking {'enabled' if enabled else 'disabled'}.")
 
     @expose
-    def set_fisheye_calibration_map(self, calibration_map):
-        """Sets the fisheye calibration map for the eye"""
-        self.fisheye_calibration_map = calibration_map
-        logger.info("Fisheye calibration map set.")
+    def get_flow_tracking_stats(self):
+        """Returns the number of frames with tracked objects and of re-seeds by detections"""
+        return self.flow_tracker.get_stats()
+
+    def seed_flow_tracker(self, preds, t_cap, out_size):
+        """Re-seeding the optical flow tracker with fresh detections of the frame captured at t_cap, (re)starting
+        the tracking thread on frames of out_size (w, h) if needed"""
+        if not self._is_flow_tracking or self._flow_size != out_size:
+            self.start_flow_tracking(*out_size)
+        self.flow_tracker.seed(preds, t_cap)
+
+    def start_flow_tracking(self, img_width, img_height):
+        """Starts the thread tracking the detections on every captured frame"""
+        self.stop_flow_tracking()
+        self._flow_size = (img_width, img_height)
+        self._is_flow_tracking = True
+        self.flow_tracking_thread = threading.Thread(target=self._flow_tracking_loop, name="flow-tracking",
+                                                     daemon=True)
+        self.flow_tracking_thread.start()
+        logger.info(f"Optical flow tracking started on {img_width}x{img_height} frames.")
+
+    def stop_flow_tracking(self):
+        """Stops the flow tracking thread"""
+        self._is_flow_tracking = False
+        if self.flow_tracking_thread is not None:
+            self.flow_tracking_thread.join(timeout=2)
+            self.flow_tracking_thread = None
+            logger.info("Optical flow tracking stopped.")
+        with self._tracked_lock:
+            self._tracked = None
+
+    def _flow_tracking_loop(self):
+        """Main loop of the flow tracking thread following the seeded detections into every new frame. Tracked
+        positions are kept for pipelined inference() calls and pushed to the master in streaming mode."""
+        # own proxy of this thread
+        receiver, receiver_uri = None, None
+        last_frame_id = 0
+        while self._is_flow_tracking:
+            frame, frame_id, t_cap = self.frame_grabber.wait_for_frame(after_id=last_frame_id, timeout=0.5)
+            if frame is None or frame_id == last_frame_id:
+                continue
+            last_frame_id = frame_id
+            with self.metrics.timer("flow"):
+                img = self.preprocess_frame(frame, *self._flow_size)
+                if img is None:
+                    continue
+                tracked = self.flow_tracker.add_frame(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), t_cap)
+            if tracked is None:
+                continue
+            for pred in tracked:
+                self.stamp_prediction(pred, t_cap, tracked=True, frame_size=self._flow_size)
+            self.metrics.count("frames_tracked")
+            with self._tracked_lock:
+                self._tracked = (tracked, t_cap, frame_id)
+
+            stream_target = self._stream_target
+            if stream_target is not None:
+                if receiver_uri != stream_target[0]:
+                    if receiver is not None:
+                        receiver._pyroRelease()
+                    receiver_uri = stream_target[0]
+                    receiver = Proxy(receiver_uri)
+                message = self.detection_message(stream_target[1], frame_id, t_cap, tracked, tracked=True)
+                try:
+                    if message is not None:
+                        receiver.push_detections(message)
+                except CommunicationError as e:
+                    logger.warning(f"Could not push tracked positions to master: {e}")
+        if receiver is not None:
+            receiver._pyroRelease()
 
     def is_running(self):
         """Returns the running status of the eye"""
@@ -164,96 +465,171 @@ class CoBeEye(object):
         """Sets up a streaming server for the image data from the camera"""
         address = (self.local_ip, port)
         self.streaming_server = web_vision.StreamingServer(address, web_vision.StreamingHandler)
-        self.streaming_server.des_res = (int(vision.capture_width / 2), int(vision.capture_height / 2))
+        if vision.mjpeg_stream_width is not None:
+            self.streaming_server.des_res = (int(vision.mjpeg_stream_width), int(vision.mjpeg_stream_height))
+        for broadcaster in self.streaming_server.broadcasters.values():
+            broadcaster.quality = int(vision.mjpeg_stream_quality)
+        self.streaming_server.client_timeout = float(vision.mjpeg_client_timeout)
         self.streaming_server.eye_id = self.id
-        self.streaming_thread = threading.Thread(target=self.streaming_server.serve_forever)
+        self.streaming_server.frame_grabber = self.frame_grabber
+        self.streaming_server.metrics = self.metrics
+        self.streaming_thread = threading.Thread(target=self.streaming_server.serve_forever, daemon=True)
         self.streaming_thread.start()
+        self.annotation_publisher = AnnotationPublisher(self.streaming_server, metrics=self.metrics)
+        self.annotation_publisher.start()
         logger.info("Streaming server started with address %s and port %d" % (self.local_ip, port))
 
     @expose
-    def initODModel(self, api_key, model_name, inf_server_url, model_id, version):
-        """Initialize the object detection model with desired model parameters"""
+    def initODModel(self, api_key, model_name, inf_server_url, model_id, version, backend=None):
+        """Initialize the object detection model with desired model parameters. The roboflow parameters are only
+        used by the roboflow backend, backend defaults to cobe.settings.odmodel.detector_backend"""
         # Definign the object detection model instance
-        self.detector_model = ObjectDetectionModel(api_key=api_key,
-                                                   name=model_name,
-                                                   id=model_id,
-                                                   local=inf_server_url,
-                                                   version=version)
-        # Carry out a single prediction to initialize the model weights
-        # todo: carry out a single prediction but with a wrapper that also captures a single image from camera
-        # self.detector_model.predict(None)
-        logger.info("Object detection model initialized with parameters: %s, %s, %s, %s" % (
-                    model_name, inf_server_url, model_id, version))
+        if self.detector_model is not None:
+            self.detector_model.close()
+        self.detector_model = create_detector(backend,
+                                              api_key=api_key,
+                                              model_name=model_name,
+                                              model_id=model_id,
+                                              inf_server_url=inf_server_url,
+                                              version=version)
+        # the model is warmed up separately as the backend may still be starting (see warm_up)
+        self.readiness = {"ready": False, "backend": self.detector_model.name}
+        logger.info("Object detection model initialized with backend %s and parameters: %s, %s, %s, %s" % (
+                    self.detector_model.name, model_name, inf_server_url, model_id, version))
+
+    @expose
+    def warm_up(self, num_predictions=odmodel.warmup_num_predictions, timeout=odmodel.ready_timeout,
+                poll_interval=odmodel.ready_poll_interval, img_width=416, img_height=416):
+        """Waits until the detector backend answers (e.g. the inference server in its container accepts connections),
+        then carries out num_predictions warm-up predictions on the latest camera frame (a gray frame if there is
+        none yet) so that the first inference request does not hit a cold model. Predictions failing while the
+        server is still loading the model are retried every poll_interval seconds until timeout.
+        Returns the readiness report (see get_readiness)."""
+        if self.detector_model is None:
+            raise RuntimeError("Object detection model not initialized, call initODModel first.")
+        num_predictions, timeout, poll_interval = int(num_predictions), float(timeout), float(poll_interval)
+        t_start = time.perf_counter()
+        deadline = t_start + timeout
+        report = {"ready": False, "backend": self.detector_model.name, "probe_time": None, "warmup_latencies": [],
+                  "num_failed": 0, "total_time": None, "error": None}
+        self.readiness = report
+
+        while not self.detector_model.is_ready():
+            if time.perf_counter() > deadline:
+                report["error"] = f"Detector backend did not answer within {timeout}s"
+                break
+            time.sleep(poll_interval)
+        else:
+            report["probe_time"] = time.perf_counter() - t_start
+            frame, _, _ = self.frame_grabber.latest()
+            if frame is None:
+                img = np.full((img_height, img_width, 3), 127, dtype=np.uint8)
+            else:
+                img = self.preprocess_frame(frame, img_width, img_height)
+            while len(report["warmup_latencies"]) < num_predictions:
+                t_pred = time.perf_counter()
+                try:
+                    self.detector_model.predict(img, confidence=40)
+                except Exception as e:
+                    # the server may answer before it finished loading the model
+                    report["num_failed"] += 1
+                    if time.perf_counter() > deadline:
+                        report["error"] = f"Warm-up predictions failed within {timeout}s: {e}"
+                        break
+                    logger.debug(f"Warm-up prediction failed, retrying: {e}")
+                    time.sleep(poll_interval)
+                    continue
+                report["warmup_latencies"].append(time.perf_counter() - t_pred)
+                self.metrics.observe("warmup", report["warmup_latencies"][-1])
+            report["ready"] = report["error"] is None
+
+        report["total_time"] = time.perf_counter() - t_start
+        if report["ready"]:
+            latencies = report["warmup_latencies"]
+            logger.info(f"Detector ready after {report['total_time']:.3f}s, warm-up latencies "
+                        f"{', '.join(f'{latency * 1000:.0f}ms' for latency in latencies)}")
+        else:
+            logger.error(f"Detector not ready: {report['error']}")
+        return report
+
+    @expose
+    def get_readiness(self):
+        """Returns the readiness report of the detector as dict with ready flag, backend name, time (s) until the
+        backend answered (probe_time), latencies (s) of the warm-up predictions, number of failed predictions,
+        total warm-up time (s) and the error if the eye did not get ready"""
+        return dict(self.readiness)
 
     def search_for_docker_container(self):
-        """Searches for a docker container with a given container name"""
-        command = 'docker ps -a --filter=name=%s' % odmodel.inf_server_cont_name
-        logger.info("created command")
-        response = subprocess.getoutput('echo %s|sudo -S %s' % (self.pswd, command)).splitlines()
-        logger.info("got response")
-        if len(response) > 1:
-            container_id = response[1].split()[0]
-            logger.info("Found docker container with id %s" % container_id)
+        """Searches for a docker container with a given container name, returns its id or None"""
+        container_id = self.docker.find_container(odmodel.inf_server_cont_name)
+        if container_id is not None:
+            logger.info(f"Found docker container with id {container_id[:12]}")
         else:
-            container_id = None
-            logger.info("No docker container found with name %s" % odmodel.inf_server_cont_name)
+            logger.info(f"No docker container found with name {odmodel.inf_server_cont_name}")
         return container_id
 
     @expose
     def start_inference_server(self):
-        """Starts the roboflow inference server via docker."""
+        """Starts the roboflow inference server via the Docker Engine API, creating its container if there is none.
+        Returns the id of the container."""
         # # First searching for a previously created inference container.
         # # Note, if you want to deploy a newly trained model, first cleanup the containers, so they won't be found
-        found_cid = self.search_for_docker_container()
-        if found_cid is not None:
-            self.inference_server_id = found_cid
-
-        if self.inference_server_id is None:
-            # Command on Orin Nano
-            if self.version == "ORIN":
-                command = ("docker run --name %s --privileged --net=host --runtime=nvidia --mount source=roboflow,"
-                           "target=/tmp/cache -e NUM_WORKERS=1 "
-                           "roboflow/roboflow-inference-server-trt-jetson-5.1.1:latest") % odmodel.inf_server_cont_name
-            # Command on normal Nano
-            elif self.version == "JETSON":
-                command = "docker run --name %s --net=host --gpus all -d roboflow/inference-server:jetson" % odmodel.inf_server_cont_name
-            # calling command with os.system and saving the resulting  STD output in string variable
-            pid = subprocess.getoutput('echo %s|sudo -S %s' % (self.pswd, command))
-            logger.info("Inference server container created and started with pid %s" % pid)
-            self.inference_server_id = pid
-        else:
-            command = "docker start %s" % self.inference_server_id
-            pid = subprocess.getoutput('echo %s|sudo -S %s' % (self.pswd, command))
-            logger.info("Inference server container was found and (re)started with pid %s" % pid)
-            logger.warning("If you want to deploy a newly trained model, first cleanup the containers, so they "
-                           "won't be found. For the first time you will need internet access to download the model.")
-        return pid
+        t_start = time.perf_counter()
+        with self._docker_lock:
+            container_id = self.search_for_docker_container()
+            if container_id is None:
+                container_id = self.docker.create_container(odmodel.inf_server_cont_name,
+                                                            INFERENCE_SERVER_CONTAINERS[self.version])
+                logger.info(f"Inference server container created with id {container_id[:12]}")
+            else:
+                logger.warning("If you want to deploy a newly trained model, first cleanup the containers, so they "
+                               "won't be found. For the first time you will need internet access to download the "
+                               "model.")
+            self.docker.start(container_id)
+            self.inference_server_id = container_id
+        logger.info(f"Inference server container {container_id[:12]} started in {time.perf_counter() - t_start:.3f}s")
+        return container_id
 
     @expose
     def stop_inference_server(self):
-        """Stops the roboflow inference server via docker."""
+        """Stops the roboflow inference server via the Docker Engine API. Returns whether it was running."""
         if self.inference_server_id is None:
             logger.warning("Inference server not found. Nothing to stop!")
             return None
 
-        command = "docker stop " + str(self.inference_server_id)
-        pid = subprocess.getoutput('echo %s|sudo -S %s' % (self.pswd, command))
-        logger.info("Inference server container was stopped with pid %s" % pid)
-        return pid
+        with self._docker_lock:
+            try:
+                was_running = self.docker.stop(self.inference_server_id, timeout=int(odmodel.docker_stop_timeout))
+            except DockerError as e:
+                logger.warning(f"Could not stop inference server container: {e}")
+                return None
+        logger.info(f"Inference server container {self.inference_server_id[:12]} stopped.")
+        return was_running
 
     @oneway
     @expose
     def remove_inference_server(self):
-        """Removes the roboflow inference server via docker."""
+        """Removes the roboflow inference server via the Docker Engine API."""
         if self.inference_server_id is None:
             logger.warning("Inference server not found. Nothing to remove!")
             return None
 
-        command = "docker rm " + str(self.inference_server_id)
-        pid = subprocess.getoutput('echo %s|sudo -S %s' % (self.pswd, command))
-        logger.info("Inference server container was removed with pid %s" % pid)
-        self.inference_server_id = None
-        return pid
+        with self._docker_lock:
+            try:
+                self.docker.remove(self.inference_server_id)
+                logger.info(f"Inference server container {self.inference_server_id[:12]} removed.")
+            except DockerError as e:
+                logger.warning(f"Could not remove inference server container: {e}")
+            self.inference_server_id = None
+
+    @expose
+    def get_inference_server_state(self):
+        """Returns the state of the inference server container (see cobe.vision.dockerclient.DockerClient.health),
+        None if it was not started"""
+        if self.inference_server_id is None:
+            return None
+        with self._docker_lock:
+            return self.docker.health(self.inference_server_id)
 
     @expose
     def return_id(self):
@@ -261,49 +637,183 @@ class CoBeEye(object):
         logger.debug(f"ID was requested and returned: {self.id}")
         return self.id
 
-    def get_frame(self, img_width, img_height):
-        """getting single camera frame according to stream parameters and resizing it to desired dimensions"""
-        # if self.map1 is None and self.fisheye_calibration_map is not None:
-        #     cmap_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration_maps', self.fisheye_calibration_map)
-        #     print(f"Fisheye map file provided but not yet loaded, loading it first from {cmap_path}...")
-        #     maps = np.load(cmap_path)
-        #     self.map1, self.map2 = maps["map1"], maps["map2"]
-        #     print("Fisheye map file loaded successfully")
-
-        t_cap = datetime.datetime.now()
-        logger.debug("Taking single frame.")
-        # getting single frame in high resolution
-        ret_val, imgo = self.cap.read()
-
-        # if self.map1 is not None:
-        #     # undistorting image according to fisheye calibration map
-        #     imgo = cv2.remap(imgo, self.map1, self.map2, interpolation=cv2.INTER_LINEAR,
-        #                      borderMode=cv2.BORDER_CONSTANT)
-
-        # resizing image to requested w and h
+    def preprocess_frame(self, imgo, img_width, img_height, sensor_id=None):
+        """Undistorting (if requested) and resizing a raw camera frame of a sensor (default: the primary sensor) to
+        the desired dimensions"""
+        if sensor_id is None:
+            sensor_id = self.primary_sensor_id
+        if self.undistort_frames:
+            undistorter = self.get_undistorter(sensor_id)
+            if undistorter is not None:
+                # undistorting image according to fisheye calibration map and resizing it in a single pass
+                return undistorter.undistort(imgo, (img_width, img_height))
+
+        # resizing image to requested w and h, frames that already have that size (e.g. scaled by the GStreamer
+        # pipeline) are used as they are without allocating a copy
         try:
-            img = cv2.resize(imgo, (img_width, img_height))
+            return resize_frame(imgo, (img_width, img_height))
         except cv2.error as e:
             logger.error(f"Error while capturing calibration frame: {e}")
             return None
+
+    def prepare_inference_input(self, imgo, img_width, img_height, t_cap):
+        """Preparing the image to send to the detector from a raw camera frame. In ROI mode this is a crop around the
+        predicted position of the tracked target, otherwise the whole preprocessed frame.
+        Returns the image and the ROIWindow of the crop (None for full frames)."""
+        window = None
+        if self.roi_inference:
+            window = self.roi_tracker.next_window((imgo.shape[1], imgo.shape[0]), (img_width, img_height), t_cap)
+        if window is None:
+            with self.metrics.timer("resize"):
+                return self.preprocess_frame(imgo, img_width, img_height), None
+
+        undistorter = self.get_undistorter(self.primary_sensor_id) if self.undistort_frames else None
+        if undistorter is not None:
+            # cropping from the undistorted frame so that mapped back boxes match full-frame inference
+            imgo = undistorter.undistort(imgo, (imgo.shape[1], imgo.shape[0]))
+        crop = imgo[window.y0:window.y1, window.x0:window.x1]
+        with self.metrics.timer("resize"):
+            return cv2.resize(crop, window.input_size), window
+
+    def prepare_inference(self, imgo, img_width, img_height, t_cap):
+        """Preparing the inference of a raw camera frame. Returns a dict with
+            - img, window: the input of the detector and its ROIWindow (see prepare_inference_input)
+            - cached: predictions of the last inferred frame if the motion gate allows reusing them, otherwise None
+            - thumbnail: thumbnail of the frame for the motion gate
+            - frame, size: the raw frame and the inference size, for a full-frame search after a miss in the ROI and
+              as key of the motion gate"""
+        job = {"img": None, "window": None, "cached": None, "thumbnail": None, "frame": imgo,
+               "size": (img_width, img_height)}
+        if self.motion_gating:
+            # cached predictions are only valid for the same inference size and sensor
+            job["thumbnail"], job["cached"] = self.motion_gate.check(imgo, t_cap, key=self.motion_gate_key(job))
+            if job["cached"] is not None:
+                return job
+        job["img"], job["window"] = self.prepare_inference_input(imgo, img_width, img_height, t_cap)
+        return job
+
+    def motion_gate_key(self, job):
+        """Returns the key the predictions of a prepared inference are cached under in the motion gate"""
+        return job["size"] + (self.primary_sensor_id,)
+
+    def run_inference(self, job, confidence, t_cap, req_ts=None):
+        """Carrying out a prepared inference (see prepare_inference) and publishing its results. If the motion gate
+        allowed it, the cached predictions are returned with the new timestamps and the reused flag set."""
+        if job["cached"] is not None:
+            preds = []
+            for pred in job["cached"]:
+                pred = dict(pred, reused=True, capture_ts=t_cap)
+                if req_ts is not None:
+                    pred["request_ts"] = req_ts
+                preds.append(pred)
+            logger.debug(f"Motion below threshold, reusing {len(preds)} cached predictions.")
+            self.metrics.count("inferences_reused")
+            return preds
+
+        preds = self.detect(job["img"], confidence, t_cap, req_ts=req_ts, window=job["window"])
+        if job["window"] is not None and not self.roi_tracker.is_tracking():
+            # the target was lost in the ROI, searching the same frame as a whole instead of the next one
+            logger.debug("Target missed in ROI, falling back to full-frame inference.")
+            with self.metrics.timer("resize"):
+                img = self.preprocess_frame(job["frame"], *job["size"])
+            if img is not None:
+                job["img"], job["window"] = img, None
+                preds = self.detect(img, confidence, t_cap, req_ts=req_ts)
+        if job["thumbnail"] is not None:
+            self.motion_gate.update(job["thumbnail"], preds, t_cap, key=self.motion_gate_key(job))
+        if self.flow_tracking:
+            out_size = (job["img"].shape[1], job["img"].shape[0]) if job["window"] is None else job["window"].out_size
+            self.seed_flow_tracker(preds, t_cap, out_size)
+        # annotating the image with bounding boxes and labels and publish on mjpeg streaming server
+        self.publish_detections(job["img"], preds, window=job["window"])
+        return preds
+
+    def count_dropped_frames(self, frame_id):
+        """Counting the camera frames captured since the last frame taken for inference as dropped"""
+        if self._last_inferred_frame_id > 0 and frame_id > self._last_inferred_frame_id + 1:
+            self.metrics.count("frames_dropped", frame_id - self._last_inferred_frame_id - 1)
+        self._last_inferred_frame_id = max(self._last_inferred_frame_id, frame_id)
+
+    @expose
+    def get_metrics(self, as_text=False):
+        """Returns the per-stage latency summaries (count, mean, p50, p95, p99 in seconds), counters and gauges of
+        the eye, as dict or as the plain text also served on /metrics of the streaming server"""
+        snapshot = self.metrics.snapshot()
+        if as_text:
+            return format_metrics(snapshot, prefix="cobe_eye")
+        return snapshot
+
+    def get_raw_frame(self, sensor_id=None):
+        """getting the latest raw camera frame of a sensor (default: the primary sensor), its sequence number and
+        capture time from the capture thread"""
+        logger.debug("Taking latest frame from capture thread.")
+        frame_grabber = self.frame_grabber if sensor_id is None else self.frame_grabbers[sensor_id]
+        imgo, frame_id, t_cap = frame_grabber.latest()
+        if imgo is None:
+            # no frame captured yet (e.g. right after startup), waiting for the first one
+            imgo, frame_id, t_cap = frame_grabber.wait_for_frame(timeout=float(vision.frame_wait_timeout))
+            if imgo is None:
+                logger.error(f"No frame received from capture thread of sensor {sensor_id}.")
+        logger.debug(f"Using frame {frame_id} captured at {t_cap}")
+        return imgo, frame_id, t_cap
+
+    def get_frame(self, img_width, img_height, sensor_id=None):
+        """getting the latest camera frame of a sensor (default: the primary sensor) from the capture thread and
+        resizing it to desired dimensions"""
+        imgo, frame_id, t_cap = self.get_raw_frame(sensor_id)
+        if imgo is None:
+            return None, None
+
+        img = self.preprocess_frame(imgo, img_width, img_height, sensor_id=sensor_id)
+        if img is None:
+            return None, None
         # returning image and timestamp
         return img, t_cap
 
     @expose
-    def get_calibration_frame(self, width=None, height=None):
-        """Used for calibrating the camera with ARUCO codes by publishing a single high resolution image on the
-        local network."""
+    def get_encoded_frame(self, img_width=416, img_height=416, quality=80, sensor_id=None):
+        """Returns the latest preprocessed frame of a sensor (default: the primary sensor) as compact JPEG for
+        inference on the master (see cobe.cobe.offloadpool) in a dict with
+            - jpeg: JPEG encoded frame as bytes
+            - frame_id, capture_ts: sequence number and capture timestamp (ns) of the frame
+            - sensor_id: sensor the frame was captured with
+        Returns None if no frame is available."""
+        if sensor_id is None:
+            sensor_id = self.primary_sensor_id
+        imgo, frame_id, t_cap = self.get_raw_frame(sensor_id)
+        if imgo is None:
+            return None
+        if sensor_id == self.primary_sensor_id:
+            self.count_dropped_frames(frame_id)
+        with self.metrics.timer("resize"):
+            img = self.preprocess_frame(imgo, img_width, img_height, sensor_id=sensor_id)
+        if img is None:
+            return None
+        encoder = self._offload_encoders.get(quality)
+        if encoder is None:
+            encoder = self._offload_encoders.setdefault(quality, JpegEncoder(quality=quality))
+        with self.metrics.timer("encode"):
+            jpeg = encoder.encode(img).tobytes()
+        self.metrics.count("frames_offloaded")
+        return {"jpeg": jpeg, "frame_id": frame_id, "capture_ts": t_cap, "sensor_id": sensor_id}
+
+    @expose
+    def get_calibration_frame(self, width=None, height=None, sensor_id=None):
+        """Used for calibrating the camera with ARUCO codes by publishing a single high resolution image of a sensor
+        (default: the primary sensor) on the local network. The image has the frame size of the active capture
+        configuration of the sensor unless width and height are given."""
+        config = self.get_capture_config(sensor_id)
         if width is None:
-            width = vision.display_width
+            width = config["display_width"]
         if height is None:
-            height = vision.display_height
+            height = config["display_height"]
         # taking single image with max possible resolution given the GStreamer pipeline
-        img, t_cap = self.get_frame(img_width=width, img_height=height)
+        img, t_cap = self.get_frame(img_width=width, img_height=height, sensor_id=sensor_id)
         # adding high resolution image to calibration frame to publish on local network
         if self.publish_mjpeg_stream:
             if self.streaming_server is None:
                 self.setup_streaming_server()
-            self.streaming_server.calib_frame = img
+            self.streaming_server.calibration.publish(img)
         else:
             logger.error("MJPEG stream not enabled when eye was initialized. Cannot publish calibration frame."
                          "Set vision.publish_mjpeg_stream to True and restart eye.")
@@ -312,54 +822,316 @@ class CoBeEye(object):
     def shutdown(self):
         """Shutting down the eye by setting the Daemon's loop condition to False"""
         self._is_running = False
+        self.close()
         logger.info("Eye shutdown initiated.")
         time.sleep(3)
         raise KeyboardInterrupt
 
+    def close(self):
+        """Stops all background threads of the eye (streams, pipeline, tracking, publishing, streaming server and
+        capture) and releases its capture objects"""
+        self.stop_detection_stream()
+        self.stop_pipelined_inference()
+        self.stop_flow_tracking()
+        if self.annotation_publisher is not None:
+            self.annotation_publisher.stop()
+            self.annotation_publisher = None
+        if self.streaming_server is not None:
+            self.streaming_server.shutdown()
+            self.streaming_server.server_close()
+            self.streaming_thread.join(timeout=2)
+            self.streaming_server = None
+            self.streaming_thread = None
+        for frame_grabber in self.frame_grabbers.values():
+            frame_grabber.stop()
+
+    def detect(self, img, confidence, t_cap, req_ts=None, window=None):
+        """Running the detector backend on a preprocessed frame and returning the cleaned up predictions
+        :param window: ROIWindow if img is a crop of the frame, predictions are then mapped back to the full frame"""
+        logger.info("Sending frame to inference server")
+        with self.metrics.timer("inference"):
+            preds = self.detector_model.predict(img, confidence=confidence)
+        logger.info("Received predictions from inference server")
+        self.metrics.count("inferences")
+
+        t_start = time.perf_counter_ns()
+        out_size = (img.shape[1], img.shape[0]) if window is None else window.out_size
+        for pred in preds:
+            if window is not None:
+                window.to_frame(pred)
+            self.stamp_prediction(pred, t_cap, req_ts=req_ts, frame_size=out_size)
+
+        logger.debug(f"Number of predictions: {len(preds)}")
+        if self.roi_inference:
+            self.roi_tracker.update(preds, out_size, t_cap, window=window)
+        self.metrics.observe("cleanup", (time.perf_counter_ns() - t_start) / 1e9)
+        return preds
+
+    def detect_batch(self, imgs, confidence, t_caps, sensor_ids, req_ts=None):
+        """Running the detector backend on the preprocessed frames of several sensors in a single batch and returning
+        the cleaned up predictions of all frames tagged with their sensor_id"""
+        with self.metrics.timer("inference"):
+            batch_preds = self.detector_model.predict_batch(imgs, confidence=confidence)
+        self.metrics.count("inferences", len(imgs))
+        self.metrics.count("inference_batches")
+
+        t_start = time.perf_counter_ns()
+        all_preds = []
+        for preds, img, t_cap, sensor_id in zip(batch_preds, imgs, t_caps, sensor_ids):
+            for pred in preds:
+                all_preds.append(self.stamp_prediction(pred, t_cap, req_ts=req_ts, sensor_id=sensor_id,
+                                                       frame_size=(img.shape[1], img.shape[0])))
+        self.metrics.observe("cleanup", (time.perf_counter_ns() - t_start) / 1e9)
+        return batch_preds, all_preds
+
+    def stamp_prediction(self, pred, t_cap, req_ts=None, tracked=False, sensor_id=None, frame_size=None):
+        """Adding timestamps, flags, the sensor id (default: the primary sensor) and (if the master pushed a remap
+        table for the sensor) simulation space coordinates to a prediction in full-frame coordinates in place
+        :param frame_size: (w, h) of the inferred frame, predictions of frames with another size than the calibration
+                           frames are scaled before remapping"""
+        if sensor_id is None:
+            sensor_id = self.primary_sensor_id
+        # passing capture timestamp (ns, see cobe.tools.timetools)
+        pred["capture_ts"] = t_cap
+        if req_ts is not None:
+            pred["request_ts"] = req_ts
+        pred["reused"] = False
+        pred["tracked"] = tracked
+        pred["sensor_id"] = sensor_id
+        # remapping to simulation space if the master pushed a remap table
+        remap_lut = self.remap_luts.get(sensor_id)
+        if remap_lut is not None:
+            pred["sim_x"], pred["sim_y"] = remap_lut.remap(pred["x"], pred["y"], frame_size=frame_size)
+        return pred
+
+    def publish_detections(self, img, preds, window=None):
+        """Handing the image and its predictions over to the publisher worker that annotates a copy of the image with
+        bounding boxes and labels and publishes it on the mjpeg streaming server. Does not wait for the annotation.
+        :param window: ROIWindow if img is a crop of the frame, boxes are then drawn in crop coordinates"""
+        if self.publish_mjpeg_stream:
+            if self.streaming_server is None:
+                self.setup_streaming_server()
+            if window is not None:
+                preds = [window.to_crop(pred) for pred in preds]
+            self.annotation_publisher.submit(img, preds)
+            logger.debug("Image handed over for annotation and publishing")
+
+    @expose
+    def start_pipelined_inference(self, confidence=40, img_width=416, img_height=416, queue_depth=None):
+        """Starts pipelined inference in which capturing/preprocessing of the next frame overlaps with inference of
+        the current one. Subsequent inference() calls return the latest finished result.
+        :param queue_depth: number of preprocessed frames that can wait for inference, larger values increase
+                            throughput but also the staleness of the results"""
+        if queue_depth is None:
+            queue_depth = vision.inference_queue_depth
+        self.stop_pipelined_inference()
+
+        def prepare(frame, t_cap):
+            job = self.prepare_inference(frame, img_width, img_height, t_cap)
+            return None if job["img"] is None and job["cached"] is None else job
+
+        self.inference_pipeline = InferencePipeline(
+            self.frame_grabber,
+            preprocess=prepare,
+            detect=lambda job, t_cap: self.run_inference(job, confidence, t_cap),
+            queue_depth=int(queue_depth),
+            metrics=self.metrics)
+        self.inference_pipeline_params = (confidence, img_width, img_height)
+        self._last_pipeline_result_id = 0
+        self.inference_pipeline.start()
+        self.pipelined_inference = True
+
+    @expose
+    def stop_pipelined_inference(self):
+        """Stops pipelined inference and switches back to on-request inference"""
+        if self.inference_pipeline is not None:
+            self.inference_pipeline.stop()
+            self.inference_pipeline = None
+            self.inference_pipeline_params = None
+        self.pipelined_inference = False
+
+    def pipelined_inference_result(self, confidence, img_width, img_height, req_ts=None):
+        """Returning the latest result of the inference pipeline that was not returned before. Each prediction is
+        extended with the staleness of the result, i.e. the seconds passed since the corresponding frame was
+        captured."""
+        if self.inference_pipeline is None or self.inference_pipeline_params != (confidence, img_width, img_height):
+            logger.info("(Re)starting inference pipeline with requested parameters.")
+            self.start_pipelined_inference(confidence=confidence, img_width=img_width, img_height=img_height)
+
+        result = self.inference_pipeline.get_result(after_id=self._last_pipeline_result_id, timeout=0)
+        # positions tracked on a frame newer than the latest detection are returned right away
+        with self._tracked_lock:
+            tracked = self._tracked
+        if tracked is not None and (self._last_returned_t_cap is None or tracked[1] > self._last_returned_t_cap) \
+                and (result is None or tracked[1] > result["t_cap"]):
+            tracked_preds, t_cap, frame_id = tracked
+            self._last_returned_t_cap = t_cap
+            staleness = seconds_between(now_ns(), t_cap)
+            preds = []
+            for pred in tracked_preds:
+                pred = dict(pred, staleness=staleness, frame_id=frame_id)
+                if req_ts is not None:
+                    pred["request_ts"] = req_ts
+                preds.append(pred)
+            return preds
+
+        if result is None:
+            result = self.inference_pipeline.get_result(after_id=self._last_pipeline_result_id,
+                                                        timeout=float(vision.pipeline_result_timeout))
+        if result is None:
+            logger.warning("No new result from inference pipeline.")
+            return []
+        self._last_pipeline_result_id = result["result_id"]
+        self._last_returned_t_cap = result["t_cap"]
+        logger.debug(f"Pipeline result of frame {result['frame_id']} with staleness {result['staleness']}s, "
+                     f"queue wait {result['queue_wait']}s, dropped frames: {self.inference_pipeline.num_dropped}")
+
+        preds = []
+        for pred in result["predictions"]:
+            pred = dict(pred, staleness=result["staleness"], frame_id=result["frame_id"])
+            if req_ts is not None:
+                pred["request_ts"] = req_ts
+            preds.append(pred)
+        return preds
+
+    @expose
+    def start_detection_stream(self, receiver_uri, eye_name, target_rate=None, confidence=40, img_width=416,
+                               img_height=416):
+        """Starts a capture-detect loop on the eye pushing compact detection messages to a DetectionReceiver Pyro
+        object on the master at most with target_rate (Hz)
+        :param receiver_uri: Pyro URI of the master-side DetectionReceiver
+        :param eye_name: name of the eye as in cobe.settings.network used by the master to identify messages"""
+        if target_rate is None:
+            target_rate = network.stream_target_rate
+        self.stop_detection_stream()
+        self._is_streaming_detections = True
+        with self._stream_lock:
+            self._last_pushed_t_cap = None
+        self._stream_target = (receiver_uri, eye_name)
+        self.detection_stream_thread = threading.Thread(
+            target=self._detection_stream_loop,
+            args=(receiver_uri, eye_name, float(target_rate), confidence, img_width, img_height),
+            daemon=True)
+        self.detection_stream_thread.start()
+        logger.info(f"Detection stream to {receiver_uri} started with target rate {target_rate}Hz")
+
+    @expose
+    def stop_detection_stream(self):
+        """Stops pushing detections to the master"""
+        self._is_streaming_detections = False
+        self._stream_target = None
+        if self.detection_stream_thread is not None:
+            self.detection_stream_thread.join(timeout=2)
+            self.detection_stream_thread = None
+            logger.info("Detection stream stopped.")
+
+    def detection_message(self, eye_name, frame_id, t_cap, preds, tracked=False):
+        """Returns the compact message pushed to the DetectionReceiver of the master in streaming mode. Sequence
+        numbers are shared by detected and tracked (optical flow) positions and increase with the capture time.
+        Returns None for frames older than the latest pushed one, e.g. for a detection finishing after positions
+        were tracked on newer frames (it still re-seeds the flow tracker), so that positions never go back in time
+        on the master."""
+        with self._stream_lock:
+            if self._last_pushed_t_cap is not None and \
+                    (t_cap < self._last_pushed_t_cap or (tracked and t_cap == self._last_pushed_t_cap)):
+                self.metrics.count("stream_messages_dropped")
+                return None
+            self._last_pushed_t_cap = t_cap
+            seq = next(self._stream_seq)
+        return {"eye_name": eye_name,
+                "seq": seq,
+                "frame_id": frame_id,
+                "capture_ts": t_cap,
+                "tracked": tracked,
+                "detections": [(pred["class"], pred["x"], pred["y"], pred["width"], pred["height"],
+                                pred["confidence"]) + ((pred["sim_x"], pred["sim_y"]) if "sim_x" in pred else ())
+                               for pred in preds]}
+
+    def _detection_stream_loop(self, receiver_uri, eye_name, target_rate, confidence, img_width, img_height):
+        """Main loop of streaming mode running inference on every new frame and pushing the results to the master"""
+        # own proxy of this thread
+        receiver = Proxy(receiver_uri)
+        period = 1 / target_rate
+        last_frame_id = 0
+        while self._is_streaming_detections:
+            t_start = time.monotonic()
+            frame, frame_id, t_cap = self.frame_grabber.wait_for_frame(after_id=last_frame_id, timeout=0.5)
+            if frame is None or frame_id == last_frame_id:
+                continue
+            last_frame_id = frame_id
+            self.count_dropped_frames(frame_id)
+            job = self.prepare_inference(frame, img_width, img_height, t_cap)
+            if job["img"] is None and job["cached"] is None:
+                continue
+            preds = self.run_inference(job, confidence, t_cap)
+
+            message = self.detection_message(eye_name, frame_id, t_cap, preds)
+            try:
+                if message is not None:
+                    receiver.push_detections(message)
+                else:
+                    logger.debug(f"Positions were tracked beyond frame {frame_id}, not pushing its detections.")
+            except CommunicationError as e:
+                logger.warning(f"Could not push detections to master: {e}")
+
+            # keeping target rate
+            t_left = period - (time.monotonic() - t_start)
+            if t_left > 0:
+                time.sleep(t_left)
+        receiver._pyroRelease()
+
     @expose
     def inference(self, confidence=40, img_width=416, img_height=416, req_ts=None):
-        """Carrying out inference on the edge on single captured fram and returning the bounding box coordinates"""
-        logger.info("Clearing capture buffer")
-        img, t_cap = self.get_frame(img_width=img_width, img_height=img_height)
+        """Carrying out inference on the edge on single captured fram and returning the bounding box coordinates
+        :param req_ts: timestamp of the request (ns, see cobe.tools.timetools), returned as request_ts of the
+                       predictions. Predictions carry the capture time of their frame as capture_ts."""
+        if self.pipelined_inference:
+            return self.pipelined_inference_result(confidence, img_width, img_height, req_ts=req_ts)
+        if len(self.sensor_ids) > 1:
+            return self.multi_sensor_inference(confidence, img_width, img_height, req_ts=req_ts)
+
         logger.info("Capturing frame")
-        img, t_cap = self.get_frame(img_width=img_width, img_height=img_height)
+        imgo, frame_id, t_cap = self.get_raw_frame()
+        if imgo is None:
+            return []
+        self.count_dropped_frames(frame_id)
+        job = self.prepare_inference(imgo, img_width, img_height, t_cap)
+        if job["img"] is None and job["cached"] is None:
+            return []
 
         if req_ts is not None:
-            req_ts = datetime.datetime.strptime(req_ts, "%Y-%m-%d %H:%M:%S.%f")
-            req_cap_dt = (t_cap - req_ts).total_seconds()
+            req_cap_dt = seconds_between(t_cap, req_ts)
             logger.info(f"Request timestamp: {req_ts}, capture timestamp: {t_cap}, difference: {req_cap_dt}s")
         else:
             req_cap_dt = 0
 
-        try:
-            logger.info("Sending frame to inference server")
-            detections = self.detector_model.predict(img, confidence=confidence)
-            logger.info("Received predictions from inference server")
-        except KeyError:
-            logger.error("KeyError in roboflow inference code, can mean that your authentication"
-                         "is invalid to the inference server or you are over quota.")
-
-        preds = detections.json().get("predictions")
-        # logger.info(preds["image_path"].shape)
+        return self.run_inference(job, confidence, t_cap, req_ts=req_ts)
 
-        # removing image path from predictions as it will hold the whole array
-        for pred in preds:
-            del pred["image_path"]
-            # passing capture timestamp as string
-            pred["capture_ts"] = datetime.datetime.strftime(t_cap, "%Y-%m-%d %H:%M:%S.%f")
-            if req_ts is not None:
-                pred["request_ts"] = datetime.datetime.strftime(req_ts, "%Y-%m-%d %H:%M:%S.%f")
-
-        logger.debug(f"Number of predictions: {len(preds)}")
-
-        # annotating the image with bounding boxes and labels and publish on mjpeg streaming server
-        if self.publish_mjpeg_stream:
-            if self.streaming_server is None:
-                self.setup_streaming_server()
-            logger.info("Annotating image with bounding boxes and labels")
-            self.streaming_server.frame = annotate_detections(img, preds)
-            logger.info("Image annotated and published on mjpeg streaming server")
+    def multi_sensor_inference(self, confidence=40, img_width=416, img_height=416, req_ts=None):
+        """Carrying out inference on the latest frames of all sensors in a single batch and returning the predictions
+        of all sensors tagged with sensor_id. Frames are inferred as a whole, ROI inference and motion gating only
+        apply to single-sensor eyes."""
+        imgs, t_caps, sensor_ids = [], [], []
+        for sensor_id in self.sensor_ids:
+            imgo, frame_id, t_cap = self.get_raw_frame(sensor_id)
+            if imgo is None:
+                continue
+            if sensor_id == self.primary_sensor_id:
+                self.count_dropped_frames(frame_id)
+            with self.metrics.timer("resize"):
+                img = self.preprocess_frame(imgo, img_width, img_height, sensor_id=sensor_id)
+            if img is not None:
+                imgs.append(img)
+                t_caps.append(t_cap)
+                sensor_ids.append(sensor_id)
+        if len(imgs) == 0:
+            return []
+        # spread of the capture times of the frames inferred together
+        self.metrics.observe("sensor_skew", seconds_between(max(t_caps), min(t_caps)))
 
+        batch_preds, preds = self.detect_batch(imgs, confidence, t_caps, sensor_ids, req_ts=req_ts)
+        if sensor_ids[0] == self.primary_sensor_id:
+            self.publish_detections(imgs[0], batch_preds[0])
         return preds
 
 
@@ -0,0 +1,138 @@
+"""
+CoBe - Vision - Flow Tracker
+
+Sparse optical-flow tracking of detected objects between inferences. Corner points are seeded inside the boxes of the
+last detections and followed with pyramidal Lucas-Kanade flow on every captured frame, so that positions can be
+updated at camera rate while the detector runs at its own (lower) rate. Each new detection re-seeds the tracker.
+"""
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from cobe.settings import logs
+from cobe.tools.timetools import seconds_between
+
+logger = logs.setup_logger("vision.flowtracker")
+
+
+class FlowTracker(object):
+    """Follows the boxes of the last detections of the target class with sparse optical flow
+
+    :param target_class: class of the detections to track
+    :param max_points: maximum number of corner points seeded per box
+    :param min_points: an object is lost when fewer of its points could be followed
+    :param max_age: maximum time (s) an object is tracked without a new detection
+    :param win_size: size (px) of the search window of the flow at each pyramid level
+    :param max_level: number of pyramid levels of the flow
+    :param history: number of latest grayscale frames kept to seed detections of slightly older frames"""
+
+    def __init__(self, target_class="stick", max_points=30, min_points=5, max_age=1.0, win_size=21, max_level=3,
+                 history=8):
+        self.target_class = target_class
+        self.max_points = int(max_points)
+        self.min_points = int(min_points)
+        self.max_age = float(max_age)
+        self.flow_params = dict(winSize=(int(win_size), int(win_size)), maxLevel=int(max_level),
+                                criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.history = int(history)
+        self._lock = threading.Lock()
+        # latest grayscale frames by capture time
+        self._grays = OrderedDict()
+        # tracked objects as dicts of the prediction and its points, the frame they were last tracked on and the
+        # capture time of the detection they were seeded with
+        self._objects = []
+        self._prev_gray = None
+        self._t_detection = None
+        # number of frames with tracked objects and number of re-seeds
+        self.num_tracked = 0
+        self.num_seeds = 0
+
+    def seed(self, preds, t_cap):
+        """Re-seeds the tracker with the predictions of a frame captured at t_cap. The frame must have been added
+        before with add_frame, otherwise the latest added frame is used. Objects are then tracked through the frames
+        added since, so that the next add_frame continues from the latest frame."""
+        with self._lock:
+            if len(self._grays) == 0:
+                return
+            # falling back to the latest frame if the detected one is not in the history anymore
+            t_seed = t_cap if t_cap in self._grays else next(reversed(self._grays))
+            gray = self._grays[t_seed]
+            objects = []
+            for pred in preds:
+                if pred["class"] != self.target_class:
+                    continue
+                points = self._seed_points(gray, pred)
+                if points is not None:
+                    objects.append({"pred": dict(pred), "points": points})
+            self._objects = objects
+            self._prev_gray = gray
+            self._t_detection = t_cap
+            self.num_seeds += 1
+            # catching up with the frames captured while the detector was busy
+            for t_frame, newer_gray in list(self._grays.items()):
+                if t_frame > t_seed:
+                    self._track(newer_gray)
+
+    def _seed_points(self, gray, pred):
+        """Returns corner points to track inside the box of a prediction or None if there are too few"""
+        h, w = gray.shape
+        x0, x1 = max(int(pred["x"] - pred["width"] / 2), 0), min(int(pred["x"] + pred["width"] / 2), w)
+        y0, y1 = max(int(pred["y"] - pred["height"] / 2), 0), min(int(pred["y"] + pred["height"] / 2), h)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        mask = np.zeros_like(gray)
+        mask[y0:y1, x0:x1] = 255
+        points = cv2.goodFeaturesToTrack(gray, maxCorners=self.max_points, qualityLevel=0.01, minDistance=2,
+                                         mask=mask)
+        if points is None or len(points) < self.min_points:
+            return None
+        return points.astype(np.float32)
+
+    def add_frame(self, gray, t_cap):
+        """Tracks the seeded objects into a new grayscale frame captured at t_cap. Returns copies of the predictions
+        with updated positions or None if no object is tracked."""
+        with self._lock:
+            self._grays[t_cap] = gray
+            while len(self._grays) > self.history:
+                self._grays.popitem(last=False)
+            if len(self._objects) == 0 or self._prev_gray is None:
+                return None
+            if seconds_between(t_cap, self._t_detection) > self.max_age:
+                logger.debug("No detection for too long, dropping tracked objects.")
+                self._objects = []
+                return None
+
+            self._track(gray)
+            if len(self._objects) == 0:
+                return None
+            self.num_tracked += 1
+            return [dict(obj["pred"]) for obj in self._objects]
+
+    def _track(self, gray):
+        """Moves the tracked objects by the median flow of their points from the previous frame to gray and drops
+        objects with too few followed points. Must be called with the lock held."""
+        if len(self._objects) == 0:
+            self._prev_gray = gray
+            return
+        points = np.concatenate([obj["points"] for obj in self._objects])
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None, **self.flow_params)
+        self._prev_gray = gray
+        status = status.ravel() == 1
+        tracked, start = [], 0
+        for obj in self._objects:
+            end = start + len(obj["points"])
+            found = status[start:end]
+            if np.count_nonzero(found) >= self.min_points:
+                shift = np.median(next_points[start:end][found] - obj["points"][found], axis=0).ravel()
+                obj["pred"]["x"] += float(shift[0])
+                obj["pred"]["y"] += float(shift[1])
+                obj["points"] = next_points[start:end][found]
+                tracked.append(obj)
+            start = end
+        self._objects = tracked
+
+    def get_stats(self):
+        """Returns the number of frames with tracked objects and of re-seeds"""
+        return {"num_tracked": self.num_tracked, "num_seeds": self.num_seeds}
@@ -0,0 +1,63 @@
+"""
+CoBe - Vision - Frame Buffers
+
+Helpers to keep the frame path of the eye free of per-frame allocations where possible: resizing is skipped when a
+frame already has the requested size, and consumers that process frames synchronously (e.g. a stream client) can
+resize and convert into buffers reused per frame size instead of allocating new arrays for every frame.
+"""
+import cv2
+import numpy as np
+
+
+class FrameBuffers(object):
+    """Preallocated destination arrays reused per (purpose, shape, dtype). A buffer is overwritten by the next call
+    with the same key, so it must only be used by a single consumer that is done with the previous frame."""
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, purpose, shape, dtype=np.uint8):
+        """Returns the buffer for purpose with the given shape, allocating it on first use"""
+        key = (purpose, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[key] = buffer
+        return buffer
+
+    def resize(self, img, size, interpolation=cv2.INTER_LINEAR):
+        """Returns img resized to size (w, h) written into a reused buffer, or img itself if it already has that
+        size"""
+        if is_size(img, size):
+            return img
+        dst = self.get("resize", (size[1], size[0]) + img.shape[2:], img.dtype)
+        return cv2.resize(img, tuple(size), dst=dst, interpolation=interpolation)
+
+
+def is_size(img, size):
+    """Returns whether img has size (w, h)"""
+    return img.shape[1] == size[0] and img.shape[0] == size[1]
+
+
+def resize_frame(img, size, dst=None, interpolation=cv2.INTER_LINEAR):
+    """Resizes img to size (w, h) into dst (newly allocated if None). If img already has the requested size it is
+    returned as is without copying, so the result must not be modified in place when img is shared."""
+    if is_size(img, size):
+        return img
+    return cv2.resize(img, tuple(size), dst=dst, interpolation=interpolation)
+
+
+class JpegEncoder(object):
+    """JPEG encoder with fixed parameters encoding BGR frames directly with OpenCV, so that no colour converted copy
+    or PIL image of the frame is needed"""
+
+    def __init__(self, quality=80):
+        self._params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+
+    def encode(self, img):
+        """Returns the JPEG encoded frame as 1D uint8 array, which can be written to files and sockets without
+        copying it to bytes"""
+        ret_val, buffer = cv2.imencode(".jpg", img, self._params)
+        if not ret_val:
+            raise ValueError("Could not encode frame as JPEG")
+        return buffer
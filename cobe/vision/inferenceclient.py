@@ -0,0 +1,112 @@
+"""
+CoBe - Vision - Inference Client
+
+Lean client of the roboflow inference server running on the eye. Compared to the roboflow SDK it keeps a single
+keep-alive connection to the server instead of opening a new one per frame, JPEG-encodes frames with fixed encoder
+parameters and returns only the prediction fields used by CoBe instead of copies of the image in every prediction.
+"""
+import binascii
+import http.client
+import json
+import socket
+import urllib.parse
+
+import cv2
+
+from cobe.settings import logs
+
+logger = logs.setup_logger("vision.inferenceclient")
+
+# prediction fields returned to the eye
+PREDICTION_FIELDS = ("class", "x", "y", "width", "height", "confidence")
+
+
+class InferenceClient(object):
+    """Persistent HTTP client of a roboflow inference server
+
+    :param inf_server_url: url of the inference server, e.g. http://localhost:9001/
+    :param model_id: id of the model on the server as in cobe.settings.odmodel (e.g. /cobe)
+    :param version: version of the model
+    :param api_key: roboflow api key
+    :param jpeg_quality: JPEG quality (0-100) of the frames sent to the server
+    :param timeout: socket timeout (s) of the connection"""
+
+    def __init__(self, inf_server_url, model_id, version, api_key, jpeg_quality=90, timeout=5.):
+        url = urllib.parse.urlsplit(inf_server_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = float(timeout)
+        # query string without confidence, which is appended per request
+        self._path_prefix = (f"{url.path.rstrip('/')}/{model_id.strip('/')}/{version}"
+                             f"?api_key={api_key}&name=YOUR_IMAGE.jpg&overlap=30&format=json")
+        self._headers = {"Content-Type": "application/x-www-form-urlencoded", "Connection": "keep-alive"}
+        self._encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)]
+        self._connection = None
+        # number of (re)opened connections, stays 1 as long as the server keeps the connection alive
+        self.num_connections = 0
+
+    def _connect(self):
+        """Opens a new connection to the server"""
+        self.close()
+        self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self._connection.connect()
+        # headers and body are sent separately, without TCP_NODELAY the body waits for the ACK of the headers
+        self._connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.num_connections += 1
+
+    def is_ready(self):
+        """Returns whether the server accepts connections, keeping the connection open for the next request"""
+        if self._connection is not None:
+            return True
+        try:
+            self._connect()
+        except OSError:
+            self.close()
+            return False
+        return True
+
+    def encode(self, img):
+        """Returns the base64 encoded JPEG of the frame as expected by the inference server"""
+        ret_val, buffer = cv2.imencode(".jpg", img, self._encode_params)
+        if not ret_val:
+            raise ValueError("Could not encode frame as JPEG")
+        return binascii.b2a_base64(buffer, newline=False)
+
+    def _post(self, path, body):
+        """Sends the request on the persistent connection and returns the response body"""
+        if self._connection is None:
+            self._connect()
+        try:
+            self._connection.request("POST", path, body=body, headers=self._headers)
+            response = self._connection.getresponse()
+            data = response.read()
+        except Exception:
+            # connection is in an unknown state
+            self.close()
+            raise
+        if response.status != 200:
+            raise http.client.HTTPException(f"Inference server returned {response.status}: {data[:200]}")
+        if response.will_close:
+            self.close()
+        return data
+
+    def predict(self, img, confidence=40):
+        """Returns the predictions of the server on the frame with confidence (percent) above the threshold, each
+        holding only the fields in PREDICTION_FIELDS"""
+        body = self.encode(img)
+        path = f"{self._path_prefix}&confidence={confidence}"
+        try:
+            data = self._post(path, body)
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionError):
+            # the server closed the idle keep-alive connection, retrying once on a new one
+            logger.debug("Connection to inference server lost, reconnecting.")
+            self._connect()
+            data = self._post(path, body)
+        predictions = json.loads(data).get("predictions", [])
+        return [{field: pred[field] for field in PREDICTION_FIELDS} for pred in predictions]
+
+    def close(self):
+        """Closes the connection to the server"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,90 @@
+"""
+CoBe - Vision - Motion Gate
+
+Cheap frame-difference gate in front of the detector. Frames are downscaled to a small grayscale thumbnail and
+compared with the thumbnail of the last inferred frame. If the arena did not change enough, the predictions of the
+last inference are reused instead of sending the frame to the inference server. Predictions are only reused for
+requests with the same key (e.g. inference size and sensor), as their coordinates depend on it.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from cobe.settings import logs
+from cobe.tools.timetools import seconds_between
+
+logger = logs.setup_logger("vision.motiongate")
+
+
+class MotionGate(object):
+    """Decides whether a frame has to be inferred or the cached predictions of the last inferred frame can be reused
+
+    :param threshold: mean absolute grayscale difference (0-255) between thumbnails below which predictions are reused
+    :param max_reuse_age: maximum time (s) since the last inference for which its predictions can be reused
+    :param thumbnail_size: size (px) of the square thumbnails the frames are compared on"""
+
+    def __init__(self, threshold=2.0, max_reuse_age=1.0, thumbnail_size=64):
+        self.threshold = float(threshold)
+        self.max_reuse_age = float(max_reuse_age)
+        self.thumbnail_size = int(thumbnail_size)
+        self._lock = threading.Lock()
+        # thumbnail, predictions, capture time and key of the last inferred frame
+        self._ref_thumbnail = None
+        self._ref_preds = None
+        self._ref_t_cap = None
+        self._ref_key = None
+        # number of reused (hits) and inferred (misses) frames and the last measured difference
+        self.num_hits = 0
+        self.num_misses = 0
+        self.last_diff = None
+
+    def thumbnail(self, frame):
+        """Returns the small grayscale thumbnail the gate compares frames on"""
+        small = cv2.resize(frame, (self.thumbnail_size, self.thumbnail_size), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def check(self, frame, t_cap, key=None):
+        """Returns the thumbnail of the frame and the cached predictions if they can be reused for it or None if the
+        frame has to be inferred
+        :param key: key of the request, e.g. (img_width, img_height, sensor_id), predictions cached for another key
+                    are not reused"""
+        thumbnail = self.thumbnail(frame)
+        with self._lock:
+            if self._ref_thumbnail is None or key != self._ref_key or \
+                    seconds_between(t_cap, self._ref_t_cap) > self.max_reuse_age:
+                self.num_misses += 1
+                return thumbnail, None
+            self.last_diff = float(np.mean(cv2.absdiff(thumbnail, self._ref_thumbnail)))
+            if self.last_diff >= self.threshold:
+                self.num_misses += 1
+                return thumbnail, None
+            self.num_hits += 1
+            return thumbnail, self._ref_preds
+
+    def update(self, thumbnail, preds, t_cap, key=None):
+        """Stores the thumbnail and predictions of a freshly inferred frame as reference
+        :param key: key of the request the predictions were made for (see check)"""
+        with self._lock:
+            self._ref_thumbnail = thumbnail
+            self._ref_preds = preds
+            self._ref_t_cap = t_cap
+            self._ref_key = key
+
+    def reset(self):
+        """Forgets the reference frame so that the next frame is inferred"""
+        with self._lock:
+            self._ref_thumbnail = None
+            self._ref_preds = None
+            self._ref_t_cap = None
+            self._ref_key = None
+
+    def get_stats(self):
+        """Returns the gate settings and counters"""
+        return {"threshold": self.threshold,
+                "max_reuse_age": self.max_reuse_age,
+                "num_hits": self.num_hits,
+                "num_misses": self.num_misses,
+                "last_diff": self.last_diff}
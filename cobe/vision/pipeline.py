@@ -0,0 +1,135 @@
+"""
+CoBe - Vision - Pipeline
+
+Pipelined inference on the eye. Capturing/preprocessing and inference run in separate threads connected by a bounded
+queue, so that while frame N is at the inference server, frame N+1 is already captured and preprocessed. The latest
+finished result is kept in a slot from which it can be returned immediately when the master asks for it.
+"""
+import queue
+import threading
+
+from cobe.settings import logs
+from cobe.tools.timetools import now_ns, seconds_between
+
+logger = logs.setup_logger("vision.pipeline")
+
+
+class InferencePipeline(object):
+    """Two-stage capture/preprocess -> inference pipeline fed by a FrameGrabber
+
+    :param frame_grabber: FrameGrabber instance publishing the latest camera frames
+    :param preprocess: callable taking a raw camera frame and its capture time and returning the input to run
+                       inference on (or None to skip the frame)
+    :param detect: callable taking the preprocessed input and its capture time and returning a list of predictions
+    :param queue_depth: maximum number of preprocessed frames waiting for inference. Larger values keep the inference
+                        server busier (throughput) at the price of older frames being inferred (latency).
+    :param metrics: optional cobe.tools.metrics.Metrics instance counting dropped frames and queue waits"""
+
+    def __init__(self, frame_grabber, preprocess, detect, queue_depth=1, metrics=None):
+        self.frame_grabber = frame_grabber
+        self.metrics = metrics
+        self.preprocess = preprocess
+        self.detect = detect
+        self.queue_depth = max(1, int(queue_depth))
+        # preprocessed frames waiting for inference
+        self._frame_queue = queue.Queue(maxsize=self.queue_depth)
+        # latest finished result and condition to notify waiting consumers
+        self._result_lock = threading.Lock()
+        self._new_result = threading.Condition(self._result_lock)
+        self._result = None
+        self._result_id = 0
+        # number of preprocessed frames dropped because the inference stage fell behind
+        self.num_dropped = 0
+        # worker threads and their stopping flag
+        self._threads = []
+        self._is_running = False
+
+    def start(self):
+        """Starts the preprocessing and inference threads"""
+        self._is_running = True
+        self._threads = [threading.Thread(target=self._preprocess_loop, name="pipeline-preprocess", daemon=True),
+                         threading.Thread(target=self._inference_loop, name="pipeline-inference", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Inference pipeline started with queue depth {self.queue_depth}.")
+
+    def stop(self, timeout=2):
+        """Stops the pipeline threads"""
+        self._is_running = False
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        logger.info("Inference pipeline stopped.")
+
+    def is_running(self):
+        """Returns whether the pipeline threads are running"""
+        return self._is_running and all(thread.is_alive() for thread in self._threads)
+
+    def _preprocess_loop(self):
+        """Waits for every new camera frame, preprocesses it and queues it for inference. When the queue is full the
+        oldest waiting frame is dropped so that inference always gets the freshest frames."""
+        last_frame_id = 0
+        while self._is_running:
+            frame, frame_id, t_cap = self.frame_grabber.wait_for_frame(after_id=last_frame_id, timeout=0.5)
+            if frame is None or frame_id == last_frame_id:
+                continue
+            if self.metrics is not None and last_frame_id > 0 and frame_id > last_frame_id + 1:
+                # camera frames overwritten before the preprocessing stage got to them
+                self.metrics.count("frames_dropped", frame_id - last_frame_id - 1)
+            last_frame_id = frame_id
+            img = self.preprocess(frame, t_cap)
+            if img is None:
+                continue
+            item = (img, frame_id, t_cap, now_ns())
+            while True:
+                try:
+                    self._frame_queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self._frame_queue.get_nowait()
+                        self.num_dropped += 1
+                        if self.metrics is not None:
+                            self.metrics.count("frames_dropped")
+                    except queue.Empty:
+                        pass
+
+    def _inference_loop(self):
+        """Runs inference on queued frames and publishes the finished results"""
+        while self._is_running:
+            try:
+                img, frame_id, t_cap, t_queued = self._frame_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            t_start = now_ns()
+            if self.metrics is not None:
+                self.metrics.observe("queue_wait", seconds_between(t_start, t_queued))
+            try:
+                predictions = self.detect(img, t_cap)
+            except Exception as e:
+                logger.error(f"Error during pipelined inference of frame {frame_id}: {e}")
+                continue
+            with self._new_result:
+                self._result_id += 1
+                self._result = {"result_id": self._result_id,
+                                "frame_id": frame_id,
+                                "predictions": predictions,
+                                "t_cap": t_cap,
+                                "t_done": now_ns(),
+                                "queue_wait": seconds_between(t_start, t_queued)}
+                self._new_result.notify_all()
+
+    def get_result(self, after_id=0, timeout=None):
+        """Returns the latest finished result newer than after_id, waiting at most timeout seconds for it.
+        Returns None if no such result is available. The returned dict additionally holds
+            - staleness: seconds passed since the frame of the result was captured
+            - age: seconds passed since the result was finished"""
+        with self._new_result:
+            self._new_result.wait_for(lambda: self._result_id > after_id, timeout=timeout)
+            if self._result is None or self._result_id <= after_id:
+                return None
+            result = dict(self._result)
+        now = now_ns()
+        result["staleness"] = seconds_between(now, result["t_cap"])
+        result["age"] = seconds_between(now, result["t_done"])
+        return result
@@ -0,0 +1,78 @@
+"""
+CoBe - Vision - Publisher
+
+Asynchronous annotation and publishing of inferred frames on the MJPEG streaming server. Monitoring is kept off the
+inference reply path: the eye hands over the frame and its predictions and returns immediately, while a worker
+thread draws the boxes on a copy of the frame and publishes it. Only the latest handed over frame is kept, so frames
+are skipped when the worker falls behind.
+"""
+import threading
+from contextlib import nullcontext
+
+from cobe.settings import logs
+from cobe.tools.detectiontools import annotate_detections
+
+logger = logs.setup_logger("vision.publisher")
+
+
+class AnnotationPublisher(object):
+    """Latest-wins worker annotating frames and publishing them on a web_vision.StreamingServer
+
+    :param streaming_server: server the annotated frames are published on (its stream broadcaster)
+    :param metrics: optional cobe.tools.metrics.Metrics instance recording annotation times and skipped frames"""
+
+    def __init__(self, streaming_server, metrics=None):
+        self.streaming_server = streaming_server
+        self.metrics = metrics
+        # pending frame and predictions together with the condition to wake up the worker
+        self._lock = threading.Lock()
+        self._new_item = threading.Condition(self._lock)
+        self._item = None
+        # number of handed over frames that were replaced before the worker got to them
+        self.num_skipped = 0
+        self._thread = None
+        self._is_running = False
+
+    def start(self):
+        """Starts the worker thread"""
+        self._is_running = True
+        self._thread = threading.Thread(target=self._publish_loop, name="annotation-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        """Stops the worker thread, a pending frame is not published"""
+        with self._new_item:
+            self._is_running = False
+            self._new_item.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def submit(self, img, preds):
+        """Hands over a frame and its predictions (in frame coordinates) for publishing without blocking. The frame
+        is not modified."""
+        with self._new_item:
+            if self._item is not None:
+                self.num_skipped += 1
+                if self.metrics is not None:
+                    self.metrics.count("annotations_skipped")
+            self._item = (img, list(preds))
+            self._new_item.notify()
+
+    def _publish_loop(self):
+        """Main loop of the worker annotating and publishing the latest handed over frame"""
+        while True:
+            with self._new_item:
+                self._new_item.wait_for(lambda: self._item is not None or not self._is_running)
+                if not self._is_running:
+                    return
+                img, preds = self._item
+                self._item = None
+            timer = self.metrics.timer("annotation") if self.metrics is not None else nullcontext()
+            try:
+                with timer:
+                    # drawing on a copy, the frame may be shared with other consumers
+                    annotated = annotate_detections(img.copy(), preds)
+                self.streaming_server.stream.publish(annotated)
+            except Exception as e:
+                logger.error(f"Error while annotating frame: {e}")
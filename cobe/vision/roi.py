@@ -0,0 +1,138 @@
+"""
+CoBe - Vision - ROI
+
+Tracking-driven region of interest (ROI) for inference. When the last detection of the target class is recent and
+confident, only a window around its predicted position is sent to the detector at a higher effective resolution.
+Boxes found in the window are mapped back to full-frame coordinates. An old or weak detection or every N-th frame
+fall back to a full-frame search, a miss in the window is followed by a full-frame search of the same frame.
+"""
+import threading
+
+from cobe.settings import logs
+from cobe.tools.timetools import seconds_between
+
+logger = logs.setup_logger("vision.roi")
+
+
+class ROIWindow(object):
+    """Crop window in raw frame pixels together with the affine mapping of predictions made on the resized crop
+    back to the full inference frame"""
+
+    def __init__(self, x0, y0, x1, y1, input_size, frame_size, out_size):
+        """
+        :param x0, y0, x1, y1: crop window in raw frame pixels
+        :param input_size: (w, h) to which the crop is resized before inference
+        :param frame_size: (w, h) of the raw frame
+        :param out_size: (w, h) of the full inference frame in which predictions are returned
+        """
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.input_size = input_size
+        self.out_size = out_size
+        # x_out = ax * x_in + bx, y_out = ay * y_in + by
+        self.ax = (x1 - x0) / input_size[0] * out_size[0] / frame_size[0]
+        self.bx = x0 * out_size[0] / frame_size[0]
+        self.ay = (y1 - y0) / input_size[1] * out_size[1] / frame_size[1]
+        self.by = y0 * out_size[1] / frame_size[1]
+
+    def to_frame(self, pred):
+        """Maps a prediction made on the crop to the full inference frame in place"""
+        pred["x"] = self.ax * pred["x"] + self.bx
+        pred["y"] = self.ay * pred["y"] + self.by
+        pred["width"] = self.ax * pred["width"]
+        pred["height"] = self.ay * pred["height"]
+        return pred
+
+    def to_crop(self, pred):
+        """Returns a copy of a full-frame prediction mapped back to the coordinates of the crop"""
+        return dict(pred, x=(pred["x"] - self.bx) / self.ax, y=(pred["y"] - self.by) / self.ay,
+                    width=pred["width"] / self.ax, height=pred["height"] / self.ay)
+
+
+class ROITracker(object):
+    """Keeps track of the last confident detection of the target class and proposes the next inference window
+
+    :param roi_size: size of the window as fraction of the frame width and height
+    :param input_size: (w, h) the window is resized to before inference
+    :param min_confidence: minimum confidence of a detection to start ROI inference around it
+    :param max_age: maximum age (s) of the last detection to start ROI inference around it
+    :param full_frame_every: a full frame search is forced after this many consecutive ROI inferences
+    :param target_class: class of the detections to track"""
+
+    def __init__(self, roi_size=0.4, input_size=(256, 256), min_confidence=0.5, max_age=0.5, full_frame_every=10,
+                 target_class="stick"):
+        self.roi_size = float(roi_size)
+        self.input_size = tuple(int(s) for s in input_size)
+        self.min_confidence = float(min_confidence)
+        self.max_age = float(max_age)
+        self.full_frame_every = int(full_frame_every)
+        self.target_class = target_class
+        self._lock = threading.Lock()
+        # last tracked position in normalized frame coordinates, its velocity (1/s) and time
+        self._position = None
+        self._velocity = (0., 0.)
+        self._t_last = None
+        self._num_consecutive_roi = 0
+        # counters of ROI and full-frame inferences and of misses in ROI
+        self.num_roi = 0
+        self.num_full = 0
+        self.num_misses = 0
+
+    def next_window(self, frame_size, out_size, t_cap):
+        """Returns the ROIWindow to run inference on for a frame captured at t_cap or None for a full-frame search
+        :param frame_size: (w, h) of the raw frame
+        :param out_size: (w, h) of the full inference frame"""
+        with self._lock:
+            if self._position is None or self._num_consecutive_roi >= self.full_frame_every or \
+                    seconds_between(t_cap, self._t_last) > self.max_age:
+                self._num_consecutive_roi = 0
+                self.num_full += 1
+                return None
+            # predicting position at capture time with constant velocity
+            dt = seconds_between(t_cap, self._t_last)
+            xc = self._position[0] + self._velocity[0] * dt
+            yc = self._position[1] + self._velocity[1] * dt
+            self._num_consecutive_roi += 1
+            self.num_roi += 1
+
+        frame_w, frame_h = frame_size
+        win_w, win_h = int(self.roi_size * frame_w), int(self.roi_size * frame_h)
+        x0 = min(max(int(xc * frame_w - win_w / 2), 0), frame_w - win_w)
+        y0 = min(max(int(yc * frame_h - win_h / 2), 0), frame_h - win_h)
+        return ROIWindow(x0, y0, x0 + win_w, y0 + win_h, self.input_size, frame_size, out_size)
+
+    def update(self, preds, out_size, t_cap, window=None):
+        """Updates the tracked position with the full-frame predictions of a frame captured at t_cap
+        :param window: the ROIWindow the predictions were made in or None for a full-frame search"""
+        targets = [pred for pred in preds
+                   if pred["class"] == self.target_class and pred["confidence"] >= self.min_confidence]
+        with self._lock:
+            if len(targets) == 0:
+                if window is not None:
+                    self.num_misses += 1
+                # falling back to full-frame search
+                self._position = None
+                self._velocity = (0., 0.)
+                return
+            best = max(targets, key=lambda pred: pred["confidence"])
+            position = (best["x"] / out_size[0], best["y"] / out_size[1])
+            if self._position is not None and t_cap > self._t_last:
+                dt = seconds_between(t_cap, self._t_last)
+                self._velocity = ((position[0] - self._position[0]) / dt, (position[1] - self._position[1]) / dt)
+            self._position = position
+            self._t_last = t_cap
+
+    def is_tracking(self):
+        """Returns whether a target is tracked, i.e. the last inference found one"""
+        with self._lock:
+            return self._position is not None
+
+    def reset(self):
+        """Forgets the tracked position so that the next frame is searched as a whole"""
+        with self._lock:
+            self._position = None
+            self._velocity = (0., 0.)
+            self._num_consecutive_roi = 0
+
+    def get_stats(self):
+        """Returns the number of ROI and full-frame inferences and misses in ROI"""
+        return {"num_roi": self.num_roi, "num_full": self.num_full, "num_misses": self.num_misses}
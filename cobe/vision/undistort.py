@@ -0,0 +1,87 @@
+"""
+CoBe - Vision - Undistort
+
+Fisheye undistortion of camera frames. The undistortion maps stored in the calibration_maps folder are fused with the
+downscaling to the inference resolution into a single pair of remap maps, so that undistorting and resizing a frame
+costs one cv2.remap call instead of a cv2.remap followed by a cv2.resize. Frames that already have the calibrated
+and the output resolution are remapped with the undistortion maps as they are.
+"""
+import os
+
+import cv2
+import numpy as np
+
+from cobe.settings import logs
+
+logger = logs.setup_logger("vision.undistort")
+
+# folder holding the fisheye calibration maps of the eyes
+calibration_maps_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration_maps')
+
+
+def fuse_maps(map1, map2, in_size, out_size):
+    """Creates fixed-point remap maps that undistort a frame of size in_size (w, h) and resize it to out_size (w, h)
+    in a single cv2.remap pass.
+    :param map1, map2: undistortion maps as created by initUndistortRectifyMap, either as float x/y maps or in
+                       fixed-point representation. Their shape defines the resolution they were calibrated for.
+    Note that the fused maps sample the source with bilinear interpolation, so they are meant for frames that are
+    not much larger than the output (as the frames of the GStreamer pipeline that are already scaled)."""
+    map_size = (map1.shape[1], map1.shape[0])
+    if map1.ndim == 3 and map1.dtype == np.int16 and map_size == tuple(in_size) == tuple(out_size):
+        # nothing to resample, the fixed-point undistortion maps are used as they are
+        return map1, map2
+    if map1.ndim == 3:
+        # fixed-point representation, converting to float maps first
+        map_x, map_y = cv2.convertMaps(map1, map2, cv2.CV_32FC1)
+    else:
+        map_x, map_y = map1.astype(np.float32), map2.astype(np.float32)
+    map_h, map_w = map_x.shape[:2]
+
+    # sampling the undistortion maps at the pixel centers of the output image
+    if (map_w, map_h) != tuple(out_size):
+        map_x = cv2.resize(map_x, tuple(out_size), interpolation=cv2.INTER_LINEAR)
+        map_y = cv2.resize(map_y, tuple(out_size), interpolation=cv2.INTER_LINEAR)
+
+    # the maps point into an image of the calibrated resolution, rescaling them to the incoming frame size
+    in_w, in_h = in_size
+    if (in_w, in_h) != (map_w, map_h):
+        map_x = (map_x + 0.5) * (in_w / map_w) - 0.5
+        map_y = (map_y + 0.5) * (in_h / map_h) - 0.5
+
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+
+class FisheyeUndistorter(object):
+    """Undistorts and resizes camera frames with fused remap maps built once from a .npz file holding map1 and map2
+    and cached per input and output size"""
+
+    def __init__(self, map1, map2):
+        self.map1 = map1
+        self.map2 = map2
+        # fused maps per (in_size, out_size)
+        self._fused_maps = {}
+
+    @classmethod
+    def from_file(cls, calibration_map):
+        """Loads the undistortion maps from a .npz file name in the calibration_maps folder (as in
+        cobe.settings.network.eyes[...]["fisheye_calibration_map"]) or from an absolute path"""
+        cmap_path = calibration_map
+        if not os.path.isabs(cmap_path):
+            cmap_path = os.path.join(calibration_maps_dir, calibration_map)
+        logger.info(f"Loading fisheye calibration map from {cmap_path}")
+        maps = np.load(cmap_path)
+        return cls(maps["map1"], maps["map2"])
+
+    def get_maps(self, in_size, out_size):
+        """Returns the fused maps for the given input and output sizes (w, h), building them on first use"""
+        key = (tuple(in_size), tuple(out_size))
+        if key not in self._fused_maps:
+            logger.info(f"Building fused undistortion maps for input size {in_size} and output size {out_size}")
+            self._fused_maps[key] = fuse_maps(self.map1, self.map2, in_size, out_size)
+        return self._fused_maps[key]
+
+    def undistort(self, img, out_size, dst=None):
+        """Undistorts img and resizes it to out_size (w, h) in a single remap pass"""
+        fused_map1, fused_map2 = self.get_maps((img.shape[1], img.shape[0]), out_size)
+        return cv2.remap(img, fused_map1, fused_map2, interpolation=cv2.INTER_LINEAR,
+                         borderMode=cv2.BORDER_CONSTANT, dst=dst)
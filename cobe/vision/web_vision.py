@@ -1,21 +1,77 @@
 """Methods to stream vision of robot via mjpg web server"""
 import io
 import socketserver
+import threading
+import time
+import urllib.parse
+import urllib.request
 from http import server
-from PIL import Image
 import logging
+
 import cv2
 import numpy as np
 
+from cobe.tools.metrics import format_metrics
+from cobe.vision.framebuffers import FrameBuffers, JpegEncoder
+
+
+def parse_stream_params(query):
+    """Returns the per-client stream parameters of the query string of a stream url as dict with fps (max frame
+    rate), width (max frame width in px) and quality (JPEG quality 1-100), None where not given, e.g.
+    /stream.mjpg?fps=5&width=320&quality=60. Raises ValueError for invalid values."""
+    values = dict(urllib.parse.parse_qsl(query))
+    params = {"fps": None, "width": None, "quality": None}
+    try:
+        if "fps" in values:
+            params["fps"] = float(values["fps"])
+        if "width" in values:
+            params["width"] = int(values["width"])
+        if "quality" in values:
+            params["quality"] = int(values["quality"])
+    except ValueError:
+        raise ValueError(f"Invalid stream parameters {query}")
+    if params["fps"] is not None and params["fps"] <= 0:
+        raise ValueError(f"Stream frame rate must be positive, got {params['fps']}")
+    if params["width"] is not None and params["width"] < 16:
+        raise ValueError(f"Stream width must be at least 16 px, got {params['width']}")
+    if params["quality"] is not None and not 1 <= params["quality"] <= 100:
+        raise ValueError(f"Stream quality must be between 1 and 100, got {params['quality']}")
+    return params
+
+
+def encode_snapshot(frame, fmt):
+    """Returns a frame encoded losslessly as PNG (fmt "png") or as raw numpy array file (fmt "npy")"""
+    if fmt == "png":
+        ret_val, buffer = cv2.imencode(".png", frame)
+        if not ret_val:
+            raise ValueError("Could not encode frame as PNG")
+        return buffer.tobytes()
+    elif fmt == "npy":
+        stream = io.BytesIO()
+        np.save(stream, frame, allow_pickle=False)
+        return stream.getvalue()
+    raise ValueError(f"Unknown snapshot format {fmt}, choose from png or npy")
+
+
+def fetch_snapshot(host, port, name="calibration", fmt="png", timeout=10.):
+    """Downloads the latest frame of a stream (stream, calibration or live) of the streaming server of an eye at
+    full resolution from its one-shot endpoint, e.g. http://host:8000/calibration.png, and returns it as array
+    :param fmt: png (lossless, compressed) or npy (raw array)"""
+    with urllib.request.urlopen(f"http://{host}:{port}/{name}.{fmt}", timeout=timeout) as response:
+        data = response.read()
+    if fmt == "npy":
+        return np.load(io.BytesIO(data), allow_pickle=False)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
 
 class StreamingHandler(server.BaseHTTPRequestHandler):
     def do_GET(self):
-        global frame
-        if self.path == '/':
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/':
             self.send_response(301)
             self.send_header('Location', '/index.html')
             self.end_headers()
-        elif self.path == '/index.html':
+        elif url.path == '/index.html':
             content = """\
                     <html>
                     <head>
@@ -33,7 +89,45 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
             self.send_header('Content-Length', len(content))
             self.end_headers()
             self.wfile.write(content)
-        elif self.path.endswith('.mjpg'):
+        elif url.path == '/metrics':
+            if self.server.metrics is None:
+                self.send_error(404)
+                return
+            content = format_metrics(self.server.metrics.snapshot(), prefix="cobe_eye").encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', len(content))
+            self.end_headers()
+            self.wfile.write(content)
+        elif url.path.endswith(('.png', '.npy')):
+            # one-shot lossless snapshot of the latest frame of a stream, e.g. /calibration.png
+            name, _, fmt = url.path.rsplit('/', 1)[-1].rpartition('.')
+            broadcaster = self.server.broadcasters.get(name)
+            if broadcaster is None:
+                self.send_error(404)
+                return
+            frame, seq = broadcaster.latest()
+            if frame is None:
+                self.send_error(404, f"No {name} frame published yet")
+                return
+            content = encode_snapshot(frame, fmt)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png' if fmt == 'png' else 'application/octet-stream')
+            self.send_header('Content-Length', len(content))
+            self.send_header('Cache-Control', 'no-store')
+            self.send_header('X-Frame-Seq', seq)
+            self.end_headers()
+            self.wfile.write(content)
+        elif url.path.endswith('.mjpg'):
+            broadcaster = self.server.broadcasters.get(url.path.rsplit('/', 1)[-1][:-len('.mjpg')])
+            if broadcaster is None:
+                self.send_error(404)
+                return
+            try:
+                params = parse_stream_params(url.query)
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
             self.send_response(200)
             self.send_header('Age', 0)
             self.send_header('Cache-Control', 'no-store')
@@ -43,49 +137,206 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
             self.send_header('Expires', '0')
             self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
             self.end_headers()
+            # clients that stop reading block their own handler only until the timeout and are then removed
+            self.connection.settimeout(self.server.client_timeout)
+            min_interval = 1 / params["fps"] if params["fps"] is not None else 0
+            self.server.add_client(1)
             try:
-                while True:
-                    jpg = None
-                    if self.server.frame is not None and self.path.endswith('stream.mjpg'):
-                        # Streaming inference frame for monitoring
-                        jpg = Image.fromarray(
-                            cv2.resize(cv2.cvtColor(self.server.frame, cv2.COLOR_BGR2RGB), self.server.des_res).astype(
-                                'uint8'))
-                    if self.server.calib_frame is not None and self.path.endswith('calibration.mjpg'):
-                        # Streaming high-resolution calibration frame for calibration
-                        jpg = Image.fromarray(
-                            cv2.cvtColor(self.server.calib_frame, cv2.COLOR_BGR2RGB).astype('uint8'))
-                    if jpg is not None:
-                        buf = io.BytesIO()
-                        jpg.save(buf, format='JPEG')
-                        frame_n = buf.getvalue()
-                        self.wfile.write(b'--FRAME\r\n')
-                        self.send_header('Content-Type', 'image/jpeg')
-                        self.end_headers()
-                        self.wfile.write(frame_n)
-                        self.wfile.write(b'\r\n')
-                        self.server.frame = None
+                last_seq = 0
+                t_last_sent = 0
+                while not broadcaster.closed:
+                    # waiting out the frame interval of the client, frames published meanwhile are skipped and
+                    # only the latest one is sent
+                    wait_time = t_last_sent + min_interval - time.monotonic()
+                    if wait_time > 0:
+                        time.sleep(wait_time)
+                    jpeg, seq = broadcaster.wait_for_frame(after_seq=last_seq, timeout=1, max_width=params["width"],
+                                                           quality=params["quality"])
+                    if jpeg is None:
+                        continue
+                    if last_seq > 0 and seq - last_seq > 1 and self.server.metrics is not None:
+                        self.server.metrics.count("stream_frames_skipped", seq - last_seq - 1)
+                    last_seq = seq
+                    t_last_sent = time.monotonic()
+                    self.wfile.write(b'--FRAME\r\n')
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Length', len(jpeg))
+                    self.end_headers()
+                    self.wfile.write(jpeg)
+                    self.wfile.write(b'\r\n')
 
             except Exception as e:
                 logging.warning(
                     'Removed streaming client %s: %s',
                     self.client_address, str(e))
+            finally:
+                self.server.add_client(-1)
         else:
             self.send_error(404)
             self.end_headers()
 
 
+class FrameBroadcaster(object):
+    """Encode-once fan-out of the frames of an MJPEG stream to all its clients. Published frames are kept with a
+    sequence number, and the first client waiting for a frame in a given profile (frame size and JPEG quality)
+    resizes and JPEG encodes it. The encoded frame is cached as immutable bytes per profile that all other clients
+    of the profile send as they are, so a frame is encoded once per profile however many clients are connected, and
+    not at all without clients. Clients block on a condition variable until the next frame instead of polling, and
+    always get the latest frame, skipping the frames they were too slow for.
+
+    :param frame_size: (w, h) the frames are resized to before encoding (None: as published)
+    :param quality: default JPEG quality (0-100)
+    :param frame_grabber: capture.FrameGrabber to stream the raw camera frames of instead of published frames
+    :param metrics: optional cobe.tools.metrics.Metrics instance recording encoding times"""
+
+    def __init__(self, frame_size=None, quality=80, frame_grabber=None, metrics=None):
+        self.frame_size = frame_size
+        self.quality = int(quality)
+        self.frame_grabber = frame_grabber
+        self.metrics = metrics
+        # JPEG encoders by quality
+        self._jpeg_encoders = {}
+        # resize buffers reused for every encoded frame, only used while holding the encoding lock
+        self._buffers = FrameBuffers()
+        self._encode_lock = threading.Lock()
+        # latest published frame and its sequence number together with the condition to wake up the clients
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._frame = None
+        self._seq = 0
+        # latest encoded frame per profile ((w, h), quality) as (sequence number, JPEG bytes)
+        self._encoded = {}
+        # number of frames encoded, one per frame and profile independent of the number of clients
+        self.num_encoded = 0
+        self.closed = False
+
+    def publish(self, img):
+        """Hands over a new frame to the clients without encoding it. The frame must not be modified afterwards."""
+        with self._new_frame:
+            self._frame = img
+            self._seq += 1
+            self._new_frame.notify_all()
+
+    def latest(self):
+        """Returns the latest frame as published (not encoded) and its sequence number without blocking, the frame
+        is None if none was published yet"""
+        if self.frame_grabber is not None:
+            frame, frame_id, _ = self.frame_grabber.latest()
+            return frame, frame_id
+        with self._lock:
+            return self._frame, self._seq
+
+    def close(self):
+        """Wakes up all waiting clients so that their streams end"""
+        with self._new_frame:
+            self.closed = True
+            self._new_frame.notify_all()
+
+    def _wait_for_raw_frame(self, after_seq, timeout):
+        """Blocks until a frame newer than after_seq is available and returns it with its sequence number, or
+        (None, after_seq) after timeout (s)"""
+        if self.frame_grabber is not None:
+            frame, frame_id, _ = self.frame_grabber.wait_for_frame(after_id=after_seq, timeout=timeout)
+            return (frame, frame_id) if frame is not None and frame_id > after_seq else (None, after_seq)
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._seq > after_seq or self.closed, timeout=timeout)
+            if self._seq <= after_seq:
+                return None, after_seq
+            return self._frame, self._seq
+
+    def profile(self, frame, max_width=None, quality=None):
+        """Returns the encoding profile ((w, h), quality) of a frame for a client with the given max width (px)
+        and JPEG quality, frames are only ever scaled down"""
+        width, height = self.frame_size if self.frame_size is not None else (frame.shape[1], frame.shape[0])
+        if max_width is not None and max_width < width:
+            width, height = int(max_width), max(int(round(height * max_width / width)), 1)
+        return (int(width), int(height)), int(quality) if quality is not None else self.quality
+
+    def wait_for_frame(self, after_seq=0, timeout=None, max_width=None, quality=None):
+        """Blocks until a frame newer than after_seq is available and returns it JPEG encoded as bytes together with
+        its sequence number, or (None, after_seq) after timeout (s) or when the broadcaster is closed
+        :param max_width: maximum width (px) of the frame, it is scaled down keeping its aspect ratio
+        :param quality: JPEG quality (1-100), default the quality of the broadcaster"""
+        frame, seq = self._wait_for_raw_frame(after_seq, timeout)
+        if frame is None:
+            return None, after_seq
+        size, quality = self.profile(frame, max_width, quality)
+        with self._encode_lock:
+            encoded_seq, jpeg = self._encoded.get((size, quality), (0, None))
+            if encoded_seq != seq:
+                # first client of the profile getting this frame, the others reuse its bytes
+                t_start = time.perf_counter_ns()
+                img = self._buffers.resize(frame, size)
+                encoder = self._jpeg_encoders.setdefault(quality, JpegEncoder(quality))
+                jpeg = encoder.encode(img).tobytes()
+                # encodings of older frames are not needed anymore
+                self._encoded = {profile: encoded for profile, encoded in self._encoded.items() if encoded[0] >= seq}
+                self._encoded[(size, quality)] = (seq, jpeg)
+                self.num_encoded += 1
+                if self.metrics is not None:
+                    self.metrics.observe("publish", (time.perf_counter_ns() - t_start) / 1e9)
+        return jpeg, seq
+
+
 class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
     allow_reuse_address = True
     daemon_threads = True
 
     def __init__(self, x, y):
         super(StreamingServer, self).__init__(x, y)
-        # frame to attach to monitoring mJPG stream
-        self.frame = None
-        # highres frame to attach to calibration mJPG stream
-        self.calib_frame = None
-        # desired resolution of the stream
-        self.des_res = None
+        # broadcasters of the monitoring stream of inferred frames, the high-resolution calibration frames and the
+        # raw camera frames of the capture thread by stream name
+        self.stream = FrameBroadcaster()
+        self.calibration = FrameBroadcaster()
+        self.live = FrameBroadcaster()
+        self.broadcasters = {"stream": self.stream, "calibration": self.calibration, "live": self.live}
         # id of the CoBeEye to stream
         self.eye_id = None
+        # socket timeout (s) after which clients that stopped reading are removed
+        self.client_timeout = 10
+        # cobe.tools.metrics.Metrics instance of the eye served on /metrics
+        self._metrics = None
+        # number of connected mJPG stream clients
+        self.num_clients = 0
+        self._clients_lock = threading.Lock()
+
+    @property
+    def des_res(self):
+        """Desired resolution (w, h) of the monitoring stream (None: resolution of the inferred frames)"""
+        return self.stream.frame_size
+
+    @des_res.setter
+    def des_res(self, size):
+        self.stream.frame_size = size
+
+    @property
+    def frame_grabber(self):
+        """Background capture thread of the eye holding the latest raw camera frame for the live mJPG stream"""
+        return self.live.frame_grabber
+
+    @frame_grabber.setter
+    def frame_grabber(self, frame_grabber):
+        self.live.frame_grabber = frame_grabber
+
+    @property
+    def metrics(self):
+        """cobe.tools.metrics.Metrics instance of the eye, also recording the encoding times of the streams"""
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+        for broadcaster in self.broadcasters.values():
+            broadcaster.metrics = metrics
+
+    def server_close(self):
+        for broadcaster in self.broadcasters.values():
+            broadcaster.close()
+        super(StreamingServer, self).server_close()
+
+    def add_client(self, num):
+        """Updates the number of connected stream clients by num and reports it in the metrics"""
+        with self._clients_lock:
+            self.num_clients += num
+            if self.metrics is not None:
+                self.metrics.set_gauge("stream_clients", self.num_clients)
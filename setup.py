@@ -37,6 +37,7 @@ setup(
     entry_points={
         'console_scripts': ["cobe-eye-start=cobe.vision.eye:main",
                             "cobe-eye-kalman-start=cobe.vision.eye:main_kalman",
+                            "cobe-eye-benchmark=cobe.vision.benchmark:main",
                             "cobe-master-start-eyeserver=cobe.app:start_eyeserver",
                             "cobe-master-start=cobe.app:main",
                             "cobe-master-cleanup-docker=cobe.app:cleanup_inf_servers",